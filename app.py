@@ -14,11 +14,13 @@ from flask_restful import Api
 from flask_cors import CORS
 
 from auth import auth
-from models import database
+from models import database, Item
+import search
 from views.address import AddressesHandler, AddressHandler
 from views.auth import LoginHandler, LogoutHandler
 from views.orders import OrdersHandler, OrderHandler
-from views.items import ItemHandler, ItemsHandler, SearchItemHandler
+from views.items import (BatchSearchItemHandler, ItemHandler, ItemsHandler,
+                         SearchItemHandler, SearchStatsHandler, SuggestItemHandler)
 from views.user import UsersHandler, UserHandler
 from views.pictures import PictureHandler, ItemPictureHandler
 from views.favorites import FavoritesHandler, FavoriteHandler
@@ -38,12 +40,38 @@ app.secret_key = os.getenv(
 )
 
 
+@app.before_first_request
+def build_search_index():
+    Item.sync_search()
+    if search.config.SHARED_INDEX_DIR:
+        search.shared.attach(Item, search.config.SHARED_INDEX_DIR)
+    elif search.config.SNAPSHOT_PATH:
+        search.snapshot.open_snapshot(Item, search.config.SNAPSHOT_PATH)
+    elif search.config.INDEX_ON_STARTUP:
+        search.build_index(Item)
+    index = search.get_index(Item)
+    if isinstance(index, search.snapshot.SnapshotIndex):
+        # catch up with the changes made since the snapshot was written
+        Item.sync_search(since=index.version)
+    if search.config.POPULARITY_WEIGHT:
+        Item.build_popularity()
+    search.backends.get_backend().setup(Item)
+
+
 @app.before_request
 def database_connect():
     if database.is_closed():
         database.connect()
 
 
+@app.before_request
+def reload_search_snapshot():
+    if search.config.SHARED_INDEX_DIR:
+        search.shared.refresh(Item, search.config.SHARED_INDEX_DIR)
+    elif search.config.SNAPSHOT_PATH:
+        search.snapshot.reload_snapshot(Item, search.config.SNAPSHOT_PATH)
+
+
 @app.teardown_request
 def database_disconnect(response):
     if not database.is_closed():
@@ -59,6 +87,9 @@ api.add_resource(ItemsHandler, "/items/")
 api.add_resource(ItemHandler, "/items/<uuid:item_uuid>")
 api.add_resource(ItemPictureHandler, '/items/<uuid:item_uuid>/pictures/')
 api.add_resource(SearchItemHandler, "/items/db/")
+api.add_resource(BatchSearchItemHandler, "/items/db/batch/")
+api.add_resource(SearchStatsHandler, "/items/db/stats/")
+api.add_resource(SuggestItemHandler, "/items/suggest/")
 api.add_resource(OrdersHandler, '/orders/')
 api.add_resource(OrderHandler, '/orders/<uuid:order_uuid>')
 api.add_resource(UsersHandler, '/users/')
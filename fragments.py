@@ -0,0 +1,98 @@
+"""
+Cache of the rendered json of the resources.
+
+Serializing a resource costs far more than reading its row, while most rows
+of the catalog do not change between two requests. Every :any:`BaseModel`
+updates its ``updated_at`` on :any:`BaseModel.save`, so the json rendered for
+a row stays valid as long as its ``updated_at`` does: :any:`cache` keeps the
+json of the latest rendered resources keyed by model, id and ``updated_at``,
+and :any:`BaseSchema.jsonapi`, :any:`BaseSchema.jsonapi_list` and
+:any:`BaseSchema.jsonapi_iter` reuse them, so that listing unchanged
+resources is a select query and a string concatenation.
+
+Only the resources rendered without related data are cached: the included
+resources may change without their parent being saved. Their relationship
+linkage may change too (i.e. a new picture of an item), so the model signals
+touch the resources whose relationships list a saved or deleted one (see
+:any:`BaseModel.touch` and ``BaseModel._listed_by``): their ``updated_at``
+changes in the database, and every process (i.e. each gunicorn worker, with
+its own cache) renders them again. Resources listed by others and written
+with queries, bypassing the signals, must touch them explicitly.
+
+The cache is a bounded LRU of :any:`FRAGMENT_CACHE_SIZE` resources.
+
+Example:
+    >>> item = Item.get()
+    >>> item.json()  # rendered and cached
+    '{"data": {"type": "item", ...}'
+    >>> cache.get(item)  # until the item is saved again
+    '{"data": {"type": "item", ...}'
+"""
+from collections import OrderedDict
+import os
+
+#: Maximum number of resources whose json is cached, ``0`` to disable the
+#: cache, set by the ``FRAGMENT_CACHE_SIZE`` environment variable
+FRAGMENT_CACHE_SIZE = int(os.getenv('FRAGMENT_CACHE_SIZE', 10000))
+
+
+class FragmentCache:
+    """
+    Bounded LRU cache of the rendered json of resources, valid for a single
+    ``updated_at`` of each of them.
+
+    Resources without an ``id`` (not saved yet) or an ``updated_at`` are
+    never cached.
+
+    Attributes:
+        size (int): maximum number of resources kept, when ``None``
+            :any:`FRAGMENT_CACHE_SIZE` is used
+        fragments (OrderedDict): ``(model, id)`` of the cached resources,
+            mapped to their ``(updated_at, json)``, least recently used first
+    """
+
+    def __init__(self, size=None):
+        self.size = size
+        self.fragments = OrderedDict()
+
+    def __len__(self):
+        return len(self.fragments)
+
+    @property
+    def max_size(self):
+        return FRAGMENT_CACHE_SIZE if self.size is None else self.size
+
+    def get(self, obj):
+        """Get the cached json of a resource, ``None`` if missing or changed."""
+        key = (type(obj), getattr(obj, 'id', None))
+        try:
+            updated_at, fragment = self.fragments[key]
+        except KeyError:
+            return None
+        if updated_at != getattr(obj, 'updated_at', None):
+            return None
+        self.fragments.move_to_end(key)
+        return fragment
+
+    def put(self, obj, fragment):
+        """Cache the json of a resource, evicting the least recently used."""
+        updated_at = getattr(obj, 'updated_at', None)
+        key = (type(obj), getattr(obj, 'id', None))
+        if self.max_size <= 0 or key[1] is None or updated_at is None:
+            return
+        self.fragments[key] = (updated_at, fragment)
+        self.fragments.move_to_end(key)
+        while len(self.fragments) > self.max_size:
+            self.fragments.popitem(last=False)
+
+    def drop(self, model, id):
+        """Drop the cached json of a resource, if any."""
+        self.fragments.pop((model, id), None)
+
+    def clear(self):
+        """Drop all the cached fragments."""
+        self.fragments.clear()
+
+
+#: Rendered json cache of the application resources
+cache = FragmentCache()
@@ -0,0 +1,19 @@
+"""
+Gunicorn settings of the application, see the ``Procfile``.
+
+With the ``SEARCH_SHARED_INDEX`` environment variable set, the master process
+publishes the search index of the items before forking the workers (see
+:mod:`search.shared`), so that they all map the same copy at their first
+request instead of building their own.
+"""
+
+
+def on_starting(server):
+    import search
+    if not search.config.SHARED_INDEX_DIR:
+        return
+
+    from models import Item
+    with Item._meta.database.execution_context():
+        generation = search.shared.publish(Item, search.config.SHARED_INDEX_DIR)
+    server.log.info('Published generation %s of the shared search index', generation)
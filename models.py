@@ -2,6 +2,8 @@
 Application ORM Models built with Peewee
 """
 import datetime
+import itertools
+from operator import attrgetter
 import os
 from exceptions import (InsufficientAvailabilityException,
                         WrongQuantity, SearchAttributeMismatch)
@@ -11,11 +13,12 @@ from flask_login import UserMixin
 from passlib.hash import pbkdf2_sha256
 from peewee import (BooleanField, CharField, DateTimeField, DecimalField,
                     ForeignKeyField, IntegerField, PostgresqlDatabase,
-                    TextField, UUIDField)
-from playhouse.signals import Model, post_delete, pre_delete
+                    SelectQuery, TextField, UUIDField, fn)
+from playhouse.signals import Model, post_delete, post_save, pre_delete
 
 from schemas import (AddressSchema, BaseSchema, FavoriteSchema, ItemSchema,
                      OrderItemSchema, OrderSchema, PictureSchema, UserSchema)
+import fragments
 import search
 from utils import remove_image
 
@@ -37,6 +40,12 @@ else:
     database = SqliteDatabase('database.db')
 
 
+#: Searchable model classes -> catalog version (see
+#: :any:`BaseModel.catalog_version`) their search indexes registered in this
+#: process are up to date with
+_SYNCED_VERSIONS = {}
+
+
 class BaseModel(Model):
     """
     BaseModel implements all the common logic for all the application models,
@@ -68,18 +77,93 @@ class BaseModel(Model):
     #: map each weight to attributes (:any:`BaseModel._search_attributes`)
     #: indexes.
     _search_weights = None
+    #: Attribute names whose words are suggested to autocomplete the search
+    #: queries (see :mod:`search.suggest`).
+    _suggest_attributes = None
+    #: Attribute names whose values can be used to filter the searches and
+    #: counted in their results, and attributes that can be filtered by
+    #: range of values (see :mod:`search.facets`).
+    _facet_terms = None
+    _facet_ranges = None
+    #: Names of the foreign keys pointing to resources whose rendered
+    #: relationships list this one, so that they are touched (see
+    #: :any:`BaseModel.touch`) when this one is saved or deleted.
+    _listed_by = ()
 
     def save(self, *args, **kwargs):
         """
         Overrides Peewee ``save`` method to automatically update
-        ``updated_at`` time during save.
+        ``updated_at`` time during save, and the catalog version of the
+        searchable models (see :any:`catalog_version`) in the same
+        transaction, when the values the searches depend on changed (see
+        :any:`_search_state`).
         """
         self.updated_at = datetime.datetime.now()
-        return super(BaseModel, self).save(*args, **kwargs)
+        if not self._search_attributes:
+            return super(BaseModel, self).save(*args, **kwargs)
+
+        state = self._search_state()
+        with self._meta.database.transaction():
+            result = super(BaseModel, self).save(*args, **kwargs)
+            if state != getattr(self, '_search_saved', None):
+                CatalogChange.record(self._meta.db_table, self.id)
+        self._search_saved = state
+        return result
+
+    def prepared(self):
+        """
+        Called by Peewee on the resources read from the database, to keep
+        the values the searches depend on as they are saved.
+        """
+        super(BaseModel, self).prepared()
+        if self._search_attributes:
+            self._search_saved = self._search_state()
+
+    def _search_state(self):
+        """
+        Get the values of the resource the searches depend on, its searched
+        and facet attributes: saving it changes the catalog version only if
+        they changed.
+        """
+        names = itertools.chain(self._search_attributes, self._facet_terms or (),
+                                self._facet_ranges or ())
+        return tuple(getattr(self, name) for name in names)
+
+    def delete_instance(self, *args, **kwargs):
+        """
+        Overrides Peewee ``delete_instance`` method to update the catalog
+        version of the searchable models in the same transaction.
+        """
+        if not self._search_attributes:
+            return super(BaseModel, self).delete_instance(*args, **kwargs)
+
+        with self._meta.database.transaction():
+            result = super(BaseModel, self).delete_instance(*args, **kwargs)
+            CatalogChange.record(self._meta.db_table, self.id)
+        return result
 
     class Meta:
         database = database
 
+    @classmethod
+    def touch(cls, id):
+        """
+        Set the ``updated_at`` of a resource to now with a query, so without
+        triggering the model signals, i.e. when the resources listed by its
+        relationships change, so that no process reuses its rendered json
+        (see :mod:`fragments`).
+
+        Args:
+            id (int): id of the resource
+
+        Returns:
+            datetime.datetime: the new ``updated_at`` of the resource
+        """
+        updated_at = datetime.datetime.now()
+        cls.update(updated_at=updated_at).where(cls.id == id).execute()
+        fragments.cache.drop(cls, id)
+        return updated_at
+
     @classmethod
     def json_list(cls, objs_list):
         """
@@ -94,6 +178,24 @@ class BaseModel(Model):
         """
         return cls._schema.jsonapi_list(objs_list)
 
+    @classmethod
+    def json_stream(cls, query):
+        """
+        Lazily transform the resources of a query into a jsonapi string, as
+        :meth:`json_list` does.
+
+        The rows are read with ``query.iterator()``, so peewee does not cache
+        the instances of the query: only one resource at a time is in memory.
+
+        Args:
+            query (peewee.SelectQuery): query of the instances to serialize
+
+        Return:
+            iterator: the parts of the jsonapi compliant list representation
+            of the resources, see :any:`utils.generate_stream_response`
+        """
+        return cls._schema.jsonapi_iter(query.iterator())
+
     def json(self, include_data=[]):
         """
         Interface for the class defined ``_schema`` that returns a JSONAPI compliant
@@ -128,10 +230,182 @@ class BaseModel(Model):
         """
         return cls._schema.validate_input(data, partial=partial)
 
+    @classmethod
+    def catalog_version(cls):
+        """
+        Get the version of the resources of the class, read from the database
+        so that it is the same in every process (i.e. the gunicorn workers).
+
+        The version is a counter (see :class:`CatalogVersion`) incremented
+        in the same transaction of every creation or deletion of a resource
+        by any process, and of every save that changes the values the
+        searches depend on (see :any:`_search_state`), so reading it is a
+        primary key lookup and it never goes back, whatever the clocks of the
+        hosts do.
+
+        Returns:
+            int: the current version
+        """
+        return CatalogVersion.read(cls._meta.db_table)
+
+    @classmethod
+    def sync_search(cls, since=None):
+        """
+        Apply to the search indexes of the class registered in this process
+        (see :func:`search.index.get_indexes`) the changes of the resources
+        made by the other processes since the last call, as recorded in
+        :class:`CatalogChange`, so that all the processes search the same
+        catalog.
+
+        Indexes built from the database after the first call are up to date
+        with the catalog version read then, so the application calls it
+        before building them, and then before every search.
+
+        Arguments:
+            since (int): catalog version the indexes are up to date with
+                (i.e. the one of a snapshot), defaults to the one of the last
+                call
+
+        Returns:
+            int: the current catalog version
+        """
+        version = cls.catalog_version()
+        synced = _SYNCED_VERSIONS.get(cls) if since is None else since
+        _SYNCED_VERSIONS[cls] = version
+        if synced is None or version <= synced:
+            return version
+
+        indexes = search.get_indexes(cls)
+        changed = CatalogChange.changed(cls._meta.db_table, synced) if indexes else []
+        size = search.config.CANDIDATES_CHUNK_SIZE
+        for start in range(0, len(changed), size):
+            chunk = changed[start:start + size]
+            objects = {obj.id: obj for obj in cls.select().where(cls.id << chunk)}
+            for resource in chunk:
+                obj = objects.get(resource)
+                for index in indexes:
+                    if obj is None:
+                        index.remove(resource)
+                    else:
+                        index.add_object(obj)
+        return version
+
+    # defined before `search`, that would shadow the package in their defaults
+    @classmethod
+    def search_matches(cls, query, dataset, limit=-1,
+                       attributes=None, weights=None,
+                       threshold=search.config.THRESHOLD, ids=None, after=None):
+        """
+        Search a list of resources as :any:`BaseModel.search` does, returning
+        the match of each resource too, i.e. to get the cursor of the next
+        page of results.
+
+        Returns:
+            list: ``(resource, match)`` tuples sorted by relevance
+        """
+
+        attributes = attributes or cls._search_attributes
+        weights = weights or cls._search_weights
+
+        if not attributes:
+            raise SearchAttributeMismatch(
+                'Attributes to look for not defined for {}. \
+                Please update the Model or specify during search call.\
+                '.format(cls.__name__))
+
+        # the items may have been changed by another process
+        version = cls.sync_search()
+        key = None
+        if search.cache.results.max_size > 0:
+            key = cls._search_key(query, dataset, limit, attributes, weights, threshold, ids,
+                                  after)
+        if key is not None:
+            search.cache.results.check(version)
+            if search.popularity.expire(cls) and search.config.POPULARITY_WEIGHT:
+                # sales left the recent window, changing the ranking
+                search.cache.results.bump()
+            cached = search.cache.results.get(key)
+            if cached is not None:
+                counters = search.stats.current()
+                if counters is not None:
+                    counters.result_cache_hits += 1
+                matches = dict(cached)
+                results = cls._fetch_ranked(dataset, [doc_id for doc_id, _ in cached])
+                return [(obj, matches[obj.id]) for obj in results]
+
+        results = cls._search(query, dataset, limit, attributes, weights, threshold, ids, after)
+        if key is not None:
+            search.cache.results.put(key, [(obj.id, match) for obj, match in results])
+        return results
+
+    @classmethod
+    def batch_search(cls, queries, dataset, limit=-1,
+                     attributes=None, weights=None,
+                     threshold=search.config.THRESHOLD, ids=None):
+        """
+        Search a list of resources for many queries at once, with the same
+        results of :any:`BaseModel.search` for each of them.
+
+        Through the search index all the candidates are scored in a single
+        pass (see :meth:`search.index.SearchIndex.batch_search`), otherwise
+        the dataset is scanned once for all the queries (see
+        :func:`search.core.batch_search`), and the resources of all the
+        queries are fetched together.
+
+        Arguments:
+            queries (list): queries to look for
+            dataset (iterable): sequence of resource objects to lookup into
+            limit (int): maximum number of resources to return for each query
+                (default -1, all)
+            attributes (list): model attribute names, as for
+                :any:`BaseModel.search`
+            weights (list): attributes weights values, as for
+                :any:`BaseModel.search`
+            threshold (float): matching threshold
+            ids (set): ids of the resources of ``dataset``, when already known
+
+        Returns:
+            list: for each query, the list of the resources that may match it
+        """
+        attributes = attributes or cls._search_attributes
+        weights = weights or cls._search_weights
+
+        if not attributes:
+            raise SearchAttributeMismatch(
+                'Attributes to look for not defined for {}. \
+                Please update the Model or specify during search call.\
+                '.format(cls.__name__))
+
+        cls.sync_search()
+        cache = search.SimilarityCache()
+        boosts = search.popularity.boosts(cls)
+
+        index = search.get_index(cls)
+        if index is not None:
+            ranked = index.batch_search(queries, attributes, weights, threshold, limit, cache,
+                                        ids, boosts)
+            if ranked is not None:
+                all_ids = list({doc_id for matches in ranked for doc_id, _ in matches})
+                objects = {obj.id: obj for obj in cls._fetch_ranked(dataset, all_ids)}
+                results = []
+                for query, matches in zip(queries, ranked):
+                    found = [objects[doc_id] for doc_id, _ in matches if doc_id in objects]
+                    if 0 < limit == len(matches) and len(found) < limit:
+                        # some of the best documents are not part of the dataset
+                        found = cls.search(query, dataset, limit, attributes, weights,
+                                           threshold, ids)
+                    results.append(found)
+                return results
+
+        ranked = search.core.batch_search(queries, attributes, dataset, limit, threshold,
+                                          weights, cache, key=attrgetter('id'),
+                                          boosts=boosts)
+        return [[obj for obj, _ in matches] for matches in ranked]
+
     @classmethod
     def search(cls, query, dataset, limit=-1,
                attributes=None, weights=None,
-               threshold=search.config.THRESHOLD):
+               threshold=search.config.THRESHOLD, ids=None, after=None):
         """
         Search a list of resources with the callee class.
 
@@ -147,10 +421,21 @@ class BaseModel(Model):
                 if length does not match it will be ignored.
             threshold (float): value between 0 and 1, identify the matching
                 threshold for a result to be included.
+            ids (set): ids of the resources of ``dataset``, when already known
+                (i.e. from :mod:`search.facets`), so that the search index
+                candidates can be restricted to them before scoring.
+            after (tuple): ``(match, id)`` of the last resource of a previous
+                page of results, only the resources ranked after it are
+                returned (see :mod:`search.cursor`).
 
         Returns:
             list: list of resources that may match the query.
 
+        The ranked ids of searches on a database query are cached in
+        :any:`search.cache.results` until a resource of the class is saved or
+        deleted, by any process (see :any:`catalog_version`), so repeated
+        searches only fetch the resources.
+
         Raises:
             SearchAttributeMismatch:
                 if ``attributes`` are missing, either as model
@@ -163,17 +448,238 @@ class BaseModel(Model):
 
                 results = Item.search('shoes', Item.select(), limit=20)
         """
+        matches = cls.search_matches(query, dataset, limit, attributes, weights,
+                                     threshold, ids, after)
+        return [obj for obj, _ in matches]
 
-        attributes = attributes or cls._search_attributes
-        weights = weights or cls._search_weights
+    @classmethod
+    def _search_key(cls, query, dataset, limit, attributes, weights, threshold, ids=None,
+                    after=None):
+        """
+        Get the key of a search in the results cache, ``None`` if the dataset
+        is not a database query and so the search cannot be cached.
 
-        if not attributes:
-            raise SearchAttributeMismatch(
-                'Attributes to look for not defined for {}. \
-                Please update the Model or specify during search call.\
-                '.format(cls.__name__))
+        The ``ids`` are not part of the key: they must be the ids of the
+        resources of ``dataset`` (i.e. of the same filters), that its query
+        already identifies.
+        """
+        if not isinstance(dataset, SelectQuery):
+            return None
+
+        sql, params = dataset.sql()
+        return (
+            cls.__name__,
+            tuple(search.utils.tokenize(query.lower())),
+            limit,
+            tuple(attributes),
+            tuple(weights) if weights else None,
+            threshold,
+            sql,
+            tuple(params),
+            after,
+        )
 
-        return search.search(query, attributes, dataset, limit, threshold, weights)
+    @classmethod
+    def _search(cls, query, dataset, limit, attributes, weights, threshold, ids=None,
+                after=None):
+        """
+        Rank the resources of a search, see :any:`BaseModel.search`.
+
+        Resources with the same match are sorted by id, on all the paths, so
+        that a cursor continues the same ranking whatever path is taken.
+
+        Returns:
+            list: ``(resource, match)`` tuples sorted by relevance
+        """
+        # jaro winkler values cache shared by the index and the scoring
+        cache = search.SimilarityCache()
+        # popularity multipliers of the resources, if ranked by popularity too
+        boosts = search.popularity.boosts(cls)
+
+        index = search.get_index(cls)
+        if index is not None:
+            ranked = index.search(query, attributes, weights, threshold, limit, cache, ids,
+                                  after, boosts)
+            if ranked is not None:
+                results = cls._fetch_ranked(dataset, [doc_id for doc_id, _ in ranked], limit)
+                if 0 < limit == len(ranked) and len(results) < limit:
+                    # some of the best documents are not part of the dataset,
+                    # so rank all of them to fill up the results.
+                    ranked = index.search(query, attributes, weights, threshold, -1, cache,
+                                          ids, after, boosts)
+                    results = cls._fetch_ranked(dataset, [doc_id for doc_id, _ in ranked],
+                                                limit)
+                matches = dict(ranked)
+                return [(obj, matches[obj.id]) for obj in results]
+
+        # let the database find the best candidates, if a backend is set up
+        candidates = search.backends.get_backend().candidates(cls, query, attributes,
+                                                              ids=ids)
+        if candidates is not None:
+            if not candidates:
+                return []
+            dataset = cls._restrict(dataset, candidates)
+
+        return search.core.search_matches(query, attributes, dataset, limit, threshold,
+                                          weights, cache, key=attrgetter('id'), after=after,
+                                          boosts=boosts)
+
+    @classmethod
+    def _restrict(cls, dataset, ids):
+        """Get the resources of a search dataset with one of the given ids."""
+        if isinstance(dataset, SelectQuery):
+            return dataset.where(cls.id << ids)
+        ids = set(ids)
+        return [obj for obj in dataset if obj.id in ids]
+
+    @classmethod
+    def _fetch_ranked(cls, dataset, ids, limit=-1):
+        """
+        Get the resources of a search dataset with the given ids, in the same
+        order of the ids.
+
+        Queries are restricted in the database in chunks of
+        :any:`search.config.CANDIDATES_CHUNK_SIZE` ids, until ``limit``
+        resources are found, while any other iterable is filtered.
+
+        Args:
+            dataset (iterable): sequence of resource objects
+            ids (list): ranked ids of the resources to get
+            limit (int): maximum number of resources to return (-1, all)
+
+        Returns:
+            list: the resources of ``dataset`` with one of the ``ids``
+        """
+        if not isinstance(dataset, SelectQuery):
+            objects = {obj.id: obj for obj in dataset}
+            results = [objects[i] for i in ids if i in objects]
+            return results[:limit] if limit > 0 else results
+
+        results = []
+        size = search.config.CANDIDATES_CHUNK_SIZE
+        for start in range(0, len(ids), size):
+            chunk = ids[start:start + size]
+            objects = {obj.id: obj for obj in dataset.where(cls.id << chunk)}
+            results.extend(objects[i] for i in chunk if i in objects)
+            if 0 < limit <= len(results):
+                return results[:limit]
+
+        return results
+
+
+def _upsert(model, values, conflict, update):
+    """
+    Insert a row, or update the one with the same values of the ``conflict``
+    fields if it exists, in a single statement (SQLite >= 3.24 and
+    PostgreSQL >= 9.5), so that concurrent processes never fail on the unique
+    constraint.
+
+    Args:
+        model (:any:`BaseModel`): model class of the row
+        values (dict): field name -> value of the inserted row
+        conflict (list): names of the unique fields
+        update (str): assignments of the ``SET`` clause of the update, where
+            ``{table}`` and the ``{<field name>}`` are replaced by their
+            quoted names
+    """
+    database = model._meta.database
+    fields = model._meta.fields
+
+    def quote(name):
+        return '{0}{1}{0}'.format(database.quote_char, name)
+
+    names = {name: quote(field.db_column) for name, field in fields.items()}
+    names['table'] = quote(model._meta.db_table)
+    sql = 'INSERT INTO {} ({}) VALUES ({}) ON CONFLICT ({}) DO UPDATE SET {}'.format(
+        names['table'],
+        ', '.join(names[name] for name in values),
+        ', '.join([database.interpolation] * len(values)),
+        ', '.join(names[name] for name in conflict),
+        update.format(**names),
+    )
+    database.execute_sql(sql, [fields[name].db_value(value) for name, value in values.items()])
+
+
+class CatalogVersion(BaseModel):
+    """
+    Version counter of the resources of a searchable model, shared by all the
+    processes through the database (see :any:`BaseModel.catalog_version`).
+
+    Attributes:
+        name (str): name of the counter, the table of the model
+        value (int): current version, ``0`` before the first change
+    """
+    name = CharField(primary_key=True)
+    value = IntegerField(default=0)
+
+    @classmethod
+    def read(cls, name):
+        """Get the current value of a counter."""
+        value = cls.select(cls.value).where(cls.name == name).scalar()
+        return value or 0
+
+    @classmethod
+    def bump(cls, name):
+        """
+        Increment a counter, creating it if missing. Called inside the
+        transaction of the change it versions, so that the row stays locked
+        until it is committed and the versions are committed in order.
+
+        Returns:
+            int: the new value
+        """
+        now = datetime.datetime.now()
+        _upsert(cls, {'name': name, 'value': 1, 'created_at': now, 'updated_at': now},
+                ['name'], '{value} = {table}.{value} + 1')
+        return cls.read(name)
+
+
+class CatalogChange(BaseModel):
+    """
+    Catalog version of the last change of each resource of a searchable
+    model, so that every process can apply to its own search indexes the
+    changes made by the others (see :any:`BaseModel.sync_search`). There is
+    a single row for each resource, even after it is deleted.
+
+    Attributes:
+        name (str): name of the catalog version, the table of the model
+        resource (int): id of the changed resource
+        version (int): catalog version of its last change
+    """
+    name = CharField()
+    resource = IntegerField()
+    version = IntegerField()
+
+    class Meta:
+        indexes = (
+            (('name', 'resource'), True),
+            (('name', 'version'), False),
+        )
+
+    @classmethod
+    def record(cls, name, resource):
+        """
+        Increment the catalog version (see :any:`CatalogVersion.bump`) for
+        the change of a resource, inside the transaction of the change.
+
+        Returns:
+            int: the new catalog version
+        """
+        version = CatalogVersion.bump(name)
+        now = datetime.datetime.now()
+        _upsert(cls, {'name': name, 'resource': resource, 'version': version,
+                      'created_at': now, 'updated_at': now},
+                ['name', 'resource'], '{version} = excluded.{version}')
+        return version
+
+    @classmethod
+    def changed(cls, name, since):
+        """Get the ids of the resources changed after the ``since`` version."""
+        query = (cls
+                 .select(cls.resource)
+                 .where((cls.name == name) & (cls.version > since))
+                 .tuples())
+        return [resource for resource, in query]
 
 
 class Item(BaseModel):
@@ -197,6 +703,12 @@ class Item(BaseModel):
     category = TextField()
     _schema = ItemSchema
     _search_attributes = ['name', 'category', 'description']
+    _suggest_attributes = ['name', 'category']
+    _facet_terms = ['category']
+    _facet_ranges = ['price', 'availability']
+    #: name of the version of the popularity counters in the catalog change
+    #: log, see :meth:`sync_popularity`
+    _popularity_version = 'item.popularity'
 
     def __str__(self):
         return '{}, {}, {}, {}'.format(
@@ -205,12 +717,124 @@ class Item(BaseModel):
             self.price,
             self.description)
 
+    def _search_state(self):
+        """
+        Get the values of the item the searches depend on: its searched
+        attributes, its category and price and whether it is in stock, the
+        only filter on the availability, so that the orders change the
+        catalog version only when an item runs out of stock or is restocked.
+        """
+        return (self.name, self.category, self.description, self.price,
+                (self.availability or 0) > 0)
+
     def is_favorite(self, item):
         for f in self.favorites:
             if f.item_id == item.id:
                 return True
         return False
 
+    @classmethod
+    def sync_search(cls, since=None):
+        """
+        Apply the changes of the other processes to the search indexes (see
+        :any:`BaseModel.sync_search`) and to the popularity table of the
+        items (see :meth:`sync_popularity`).
+
+        Returns:
+            int: the current catalog version
+        """
+        version = super(Item, cls).sync_search(since)
+        cls.sync_popularity()
+        return version
+
+    @classmethod
+    def build_popularity(cls):
+        """
+        Build the popularity table of the items (see :mod:`search.popularity`)
+        from all the orders and favorites, and register it. The table is then
+        kept up to date by :meth:`sync_popularity`.
+
+        Returns:
+            search.popularity.PopularityTable: the new table
+        """
+        version = CatalogVersion.read(cls._popularity_version)
+        start = datetime.datetime.fromtimestamp(search.popularity.window_start())
+
+        # units sold before the recent window, and each recent sale on its own
+        old = (OrderItem
+               .select(OrderItem.item, fn.SUM(OrderItem.quantity))
+               .join(Order)
+               .where(Order.created_at < start)
+               .group_by(OrderItem.item)
+               .tuples())
+        recent = (OrderItem
+                  .select(OrderItem.item, OrderItem.quantity, Order.created_at)
+                  .join(Order)
+                  .where(Order.created_at >= start)
+                  .tuples())
+        sales = itertools.chain(
+            ((item_id, int(quantity), 0) for item_id, quantity in old),
+            ((item_id, quantity, created_at.timestamp())
+             for item_id, quantity, created_at in recent),
+        )
+
+        favorites = (Favorite
+                     .select(Favorite.item, fn.COUNT(Favorite.id))
+                     .group_by(Favorite.item)
+                     .tuples())
+        return search.popularity.build_table(cls, sales, favorites, version)
+
+    @classmethod
+    def sync_popularity(cls):
+        """
+        Count again from the database, in the popularity table of the items
+        if built, the items whose orders or favorites changed (in any
+        process, see :func:`_record_popularity`) since the version of the
+        table, dropping the cached results ranked with the old counters.
+
+        Returns:
+            bool: whether the popularity of any item changed
+        """
+        table = search.popularity.get_table(cls)
+        if table is None:
+            return False
+        version = CatalogVersion.read(cls._popularity_version)
+        if version <= table.version:
+            return False
+
+        changed = CatalogChange.changed(cls._popularity_version, table.version)
+        table.version = version
+        start = datetime.datetime.fromtimestamp(search.popularity.window_start())
+        size = search.config.CANDIDATES_CHUNK_SIZE
+        for offset in range(0, len(changed), size):
+            chunk = changed[offset:offset + size]
+            units = dict(OrderItem
+                         .select(OrderItem.item, fn.SUM(OrderItem.quantity))
+                         .where(OrderItem.item << chunk)
+                         .group_by(OrderItem.item)
+                         .tuples())
+            recent = (OrderItem
+                      .select(OrderItem.item, OrderItem.quantity, Order.created_at)
+                      .join(Order)
+                      .where((OrderItem.item << chunk) & (Order.created_at >= start))
+                      .tuples())
+            sales = {}
+            for item_id, quantity, created_at in recent:
+                sales.setdefault(item_id, []).append((quantity, created_at.timestamp()))
+            favorites = dict(Favorite
+                             .select(Favorite.item, fn.COUNT(Favorite.id))
+                             .where(Favorite.item << chunk)
+                             .group_by(Favorite.item)
+                             .tuples())
+            for item_id in chunk:
+                table.reset(item_id, int(units.get(item_id) or 0), sales.get(item_id, ()),
+                            favorites.get(item_id, 0))
+
+        if changed and search.config.POPULARITY_WEIGHT:
+            # the ranking of the cached results changed
+            search.cache.results.bump()
+        return bool(changed)
+
 
 @database.atomic()
 @pre_delete(sender=Item)
@@ -222,6 +846,44 @@ def on_delete_item_handler(model_class, instance):
         pic.delete_instance()
 
 
+@post_save(sender=Item)
+def on_save_item_handler(model_class, instance, created):
+    """Update the item postings"""
+    for index in search.get_indexes(model_class):
+        index.add_object(instance)
+
+
+@post_delete(sender=Item)
+def on_delete_item_index_handler(model_class, instance):
+    """Remove the item postings"""
+    for index in search.get_indexes(model_class):
+        index.remove_object(instance)
+
+
+def _record_popularity(item_ids):
+    """
+    Record in the catalog change log that the orders or the favorites of
+    the items changed, after the change or inside its transaction, so that
+    every process counts them again (see :meth:`Item.sync_popularity`).
+
+    Args:
+        item_ids (iterable): ids of the changed items
+    """
+    for item_id in sorted(set(item_ids)):
+        CatalogChange.record(Item._popularity_version, item_id)
+
+
+def _record_sales(quantities):
+    """
+    Record the units of the items sold (or returned, if negative) by an
+    order, see :func:`_record_popularity`.
+
+    Args:
+        quantities (dict): item id -> units sold
+    """
+    _record_popularity(item_id for item_id, quantity in quantities.items() if quantity)
+
+
 class Picture(BaseModel):
     """
     A Picture model describes and points to a stored image file. Allows linkage
@@ -238,6 +900,7 @@ class Picture(BaseModel):
     extension = CharField()
     item = ForeignKeyField(Item, related_name='pictures')
     _schema = PictureSchema
+    _listed_by = ('item',)
 
     @property
     def filename(self):
@@ -361,6 +1024,7 @@ class Address(BaseModel):
     phone = CharField()
 
     _schema = AddressSchema
+    _listed_by = ('user',)
 
 
 class Order(BaseModel):
@@ -379,6 +1043,7 @@ class Order(BaseModel):
     delivery_address = ForeignKeyField(Address, related_name="orders")
     user = ForeignKeyField(User, related_name="orders")
     _schema = OrderSchema
+    _listed_by = ('user',)
 
     class Meta:
         order_by = ('created_at',)
@@ -412,7 +1077,9 @@ class Order(BaseModel):
         """
 
         self.total_price = 0
+        quantities = {oi.item_id: -oi.quantity for oi in self.order_items}
         OrderItem.delete().where(OrderItem.order == self).execute()
+        _record_sales(quantities)
         self.save()
         return self
 
@@ -518,6 +1185,8 @@ class Order(BaseModel):
                 self.address = new_address
             if update_total or new_address:
                 self.save()
+        # order items are inserted and deleted by queries, without signals
+        self.updated_at = Order.touch(self.id)
         return self
 
     @database.atomic()
@@ -556,6 +1225,8 @@ class Order(BaseModel):
                     orderitem.save()
                     break
 
+        _record_sales({item.id: difference for item, difference in items.items()})
+
     def delete_items(self, items):
         """
         Delete orderitems in a single query and updates items' availability.
@@ -582,6 +1253,8 @@ class Order(BaseModel):
                 OrderItem.order == self).where(
                 OrderItem.item << [k for k in items.keys()]).execute()
 
+        _record_sales({item.id: -quantity for item, quantity in items.items()})
+
     def create_items(self, items):
         """
         Creates orderitems in a single query and updates items' availability.
@@ -613,6 +1286,8 @@ class Order(BaseModel):
                     'subtotal': item.price * quantity,
                 } for item, quantity in items.items()]).execute()
 
+        _record_sales({item.id: quantity for item, quantity in items.items()})
+
     def add_item(self, item, quantity=1):
         """
         Add items to the order. It updates item availability.
@@ -662,6 +1337,7 @@ class OrderItem(BaseModel):
     quantity = IntegerField()
     subtotal = DecimalField()
     _schema = OrderItemSchema
+    _listed_by = ('order',)
 
     def add_item(self, quantity=1):
         """
@@ -685,6 +1361,7 @@ class OrderItem(BaseModel):
         self.quantity += quantity
         self._calculate_subtotal()
         self.save()
+        _record_sales({self.item_id: quantity})
 
     def remove_item(self, quantity=1):
         """
@@ -711,6 +1388,7 @@ class OrderItem(BaseModel):
         else:  # elif self.quantity == quantity
             quantity = self.quantity
             self.delete_instance()
+        _record_sales({self.item_id: -quantity})
         return quantity
 
     def _calculate_subtotal(self):
@@ -726,3 +1404,56 @@ class Favorite(BaseModel):
     user = ForeignKeyField(User, related_name="favorites")
     item = ForeignKeyField(Item, related_name="favorites")
     _schema = FavoriteSchema
+
+
+@pre_delete(sender=Order)
+def on_delete_order_handler(model_class, instance):
+    """Keep the items of the order, deleted with it"""
+    instance._sold_quantities = {oi.item_id: -oi.quantity for oi in instance.order_items}
+
+
+@post_delete(sender=Order)
+def on_deleted_order_handler(model_class, instance):
+    """Remove the units of the deleted order from the items popularity"""
+    _record_sales(instance._sold_quantities)
+
+
+@post_save(sender=Favorite)
+def on_save_favorite_handler(model_class, instance, created):
+    """Count the new favorite in the item popularity"""
+    if created:
+        _record_popularity([instance.item_id])
+
+
+@post_delete(sender=Favorite)
+def on_delete_favorite_handler(model_class, instance):
+    """Remove the deleted favorite from the item popularity"""
+    _record_popularity([instance.item_id])
+
+
+def _drop_fragments(instance):
+    """
+    Drop the rendered json (see :mod:`fragments`) of a resource and of the
+    resources its foreign keys point to, touching the ones whose
+    relationships list it, so that the other processes drop them too.
+    """
+    fragments.cache.drop(type(instance), instance.id)
+    for field in instance._meta.fields.values():
+        if isinstance(field, ForeignKeyField):
+            related_id = instance._data.get(field.name)
+            if field.name in instance._listed_by and related_id is not None:
+                field.rel_model.touch(related_id)
+            else:
+                fragments.cache.drop(field.rel_model, related_id)
+
+
+@post_save()
+def on_save_fragments_handler(model_class, instance, created):
+    """Drop the rendered json of the resources related to the saved one"""
+    _drop_fragments(instance)
+
+
+@post_delete()
+def on_delete_fragments_handler(model_class, instance):
+    """Drop the rendered json of the deleted resource and the related ones"""
+    _drop_fragments(instance)
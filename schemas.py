@@ -15,11 +15,17 @@ While schemas could be used directly they are meant to be inside the related :mo
 class.
 
 """
+import threading
+
 from marshmallow_jsonapi import Schema, fields
 from marshmallow import validate
 
 import simplejson
 
+import fragments
+import serializers
+import validators
+
 #: Validation rule to avoid empty strings.
 #: Documentation can be found at https://goo.gl/pVvryk
 NOT_BLANK = validate.Length(min=1, error='Field cannot be blank')
@@ -30,6 +36,10 @@ MORE_THAN_ZERO = validate.Range(min=0)
 #: Validation rule for lists that cannot be empty.
 NOT_EMPTY = validate.Length(min=1, error='List cannot be empty')
 
+#: Schema instances reused to serialize the resources, for each thread
+#: mapping ``(schema class, include_data)`` to the instance
+_CACHED_SCHEMAS = threading.local()
+
 
 class BaseSchema(Schema):
     """
@@ -41,6 +51,33 @@ class BaseSchema(Schema):
     class Meta:
         json_module = simplejson
 
+    @classmethod
+    def cached(cls, include_data=()):
+        """
+        Get the instance of the schema with the given included fields, built
+        once per thread and reused by the following serializations.
+
+        Building a schema copies all its fields, so serializing a list of
+        resources with a new instance for each one spends most of its time
+        there. The ``included`` resources collected by the previous dump are
+        cleared.
+
+        Args:
+            include_data (iterable): names of the fields to include
+        Returns:
+            BaseSchema: the cached instance
+        """
+        schemas = getattr(_CACHED_SCHEMAS, 'schemas', None)
+        if schemas is None:
+            schemas = _CACHED_SCHEMAS.schemas = {}
+
+        key = (cls, tuple(include_data))
+        schema = schemas.get(key)
+        if schema is None:
+            schema = schemas[key] = cls(include_data=include_data)
+        schema.included_data = {}
+        return schema
+
     @classmethod
     def jsonapi(cls, obj, include_data=[]):
         """
@@ -60,8 +97,20 @@ class BaseSchema(Schema):
             * ``errors``: errors that may have occurred during the dump
         """
 
-        serialized = cls(include_data=include_data).dumps(obj)
-        return serialized.data, serialized.errors
+        if not include_data:
+            fragment = fragments.cache.get(obj)
+            if fragment is not None:
+                return fragment, {}
+
+        serialize = serializers.get_serializer(cls) if not include_data else None
+        if serialize is not None:
+            data, errors = cls.opts.json_module.dumps(serialize(obj)), {}
+        else:
+            data, errors = cls.cached(include_data).dumps(obj)
+
+        if not include_data and not errors:
+            fragments.cache.put(obj, data)
+        return data, errors
 
     @classmethod
     def jsonapi_list(cls, obj_list, include_data=[]):
@@ -69,9 +118,14 @@ class BaseSchema(Schema):
         Serialize a series of resource models - with any related data specified - into a
         json stringified list.
 
+        The same schema instance (or its compiled serializer, see
+        :mod:`serializers`) dumps all the resources, and each one is encoded by
+        the same json encoder, so the result is the same of joining the
+        ``json`` of every resource. The json of the resources not changed
+        since they were last rendered is reused (see :mod:`fragments`).
+
         Args:
             obj_list (iterable): An iterable of :mod:`models` of the same type.
-                Each ``obj`` **must** implements a ``json``.
             include_data (list): A list of :any:`str` describing the name of the
                 resource field that have to be included, if present.
 
@@ -79,10 +133,71 @@ class BaseSchema(Schema):
             str: json representing a list of resources in the form of
             ``[{resource}, ...]``
         """
-        json_string = ','.join(o.json(include_data) for o in obj_list)
-        json_string = '[{}]'.format(json_string)
+        render = cls._renderer(include_data)
+        return '[{}]'.format(','.join(render(obj) for obj in obj_list))
+
+    @classmethod
+    def jsonapi_iter(cls, obj_list, include_data=[]):
+        """
+        Serialize a series of resource models as :meth:`jsonapi_list` does,
+        lazily: the json list is generated in parts, the opening bracket
+        before the first resource is read from ``obj_list``, then a resource
+        at a time, so that they do not need to be all in memory.
+
+        Args:
+            obj_list (iterable): An iterable of :mod:`models` of the same type.
+            include_data (list): A list of :any:`str` describing the name of the
+                resource field that have to be included, if present.
+
+        Yields:
+            str: the parts of the json list, joined the same of
+            :meth:`jsonapi_list`
+        """
+        render = cls._renderer(include_data)
+        yield '['
+
+        separator = ''
+        for obj in obj_list:
+            yield separator + render(obj)
+            separator = ','
+        yield ']'
 
-        return json_string
+    @classmethod
+    def _renderer(cls, include_data):
+        """
+        Get the function rendering a resource into its json, reusing the
+        rendered json of the unchanged resources (see :mod:`fragments`) when
+        nothing is included.
+        """
+        dump, encode = cls._dumper(include_data), cls.opts.json_module.dumps
+        if include_data:
+            return lambda obj: encode(dump(obj))
+
+        def render(obj):
+            fragment = fragments.cache.get(obj)
+            if fragment is None:
+                fragment = encode(dump(obj))
+                fragments.cache.put(obj, fragment)
+            return fragment
+        return render
+
+    @classmethod
+    def _dumper(cls, include_data):
+        """
+        Get the function dumping a resource into its JSONAPI dict: the compiled
+        serializer of the schema, if any and nothing is included, otherwise
+        the dump of the cached schema instance.
+        """
+        serialize = serializers.get_serializer(cls) if not include_data else None
+        if serialize is not None:
+            return serialize
+
+        schema = cls.cached(include_data)
+
+        def dump(obj):
+            schema.included_data = {}
+            return schema.dump(obj).data
+        return dump
 
     @classmethod
     def validate_input(cls, jsondata, partial=False):
@@ -92,6 +207,10 @@ class BaseSchema(Schema):
 
         documentation at https://goo.gl/0ZW1OW
 
+        The data is checked first by the compiled checker of the schema (see
+        :mod:`validators`), and validated by a cached schema instance only if
+        it has errors, to report them.
+
         Args:
             jsondata (dict or list(dict)): data structure to validate against the schema
             partial (bool): wether to ignore missing fields (even if required).
@@ -100,7 +219,10 @@ class BaseSchema(Schema):
         Returns:
             list: with errors (jsonapi standard) if any, else empty list
         """
-        return cls().validate(jsondata, partial=partial)
+        check = validators.get_checker(cls, partial)
+        if check is not None and check(jsondata):
+            return {}
+        return cls.cached().validate(jsondata, partial=partial)
 
 
 class ItemSchema(BaseSchema):
@@ -369,3 +491,7 @@ class FavoriteSchema(BaseSchema):
         type_='user', schema='UserSchema',
         id_field='uuid',
     )
+
+
+if serializers.ENABLED:
+    serializers.compile_schemas(BaseSchema)
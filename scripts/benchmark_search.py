@@ -0,0 +1,305 @@
+"""
+Benchmark the search engine on synthetic catalogs.
+
+Catalogs are generated with the same Faker generators of
+``scripts/demo_content.py`` from a fixed seed, so every run searches the very
+same items with the very same queries (a catalog is always the beginning of
+any bigger one). Items are kept in memory and never written to the database.
+
+For each catalog size and search mode the script reports the p50/p95/p99
+latency of the queries, the average number of documents scored and of token
+pairs compared with the jaro winkler algorithm for each query, and the peak
+memory allocated by the search (and by the index build, for the modes using
+an index).
+
+Results can be stored as a baseline with ``--save-baseline``, and the next
+runs fail (exit code 1) if any of their values is higher than the baseline
+one by more than ``--tolerance`` (``--latency-tolerance`` for the latencies,
+that are noisier). Latencies depend on the machine, so the baseline should be
+saved on the same machine the runs are compared on.
+
+Examples::
+
+    PYTHONPATH=. python3 scripts/benchmark_search.py --sizes 1000,10000
+    PYTHONPATH=. python3 scripts/benchmark_search.py --save-baseline
+    PYTHONPATH=. python3 scripts/benchmark_search.py --sizes 1000000 --modes index,numpy
+"""
+from contextlib import ExitStack
+import json
+import math
+import os
+import random
+import time
+import tracemalloc
+from unittest import mock
+
+import click
+
+from models import Item
+import search
+from search import config, core, parallel, utils, vectorized
+from search.index import SearchIndex
+from scripts import demo_content
+
+#: Seed of the generated catalogs and queries
+SEED = 9623954
+#: Attributes searched, as for :any:`Item`
+ATTRIBUTES = Item._search_attributes
+#: Default baseline file
+BASELINE = os.path.join(os.path.dirname(__file__), 'benchmark_baseline.json')
+#: Metrics compared with the baseline
+METRICS = ['p50', 'p95', 'p99', 'candidates', 'pairs', 'memory']
+#: Latency metrics, compared with their own tolerance
+LATENCIES = ['p50', 'p95', 'p99']
+#: Search modes: (uses the index, configuration overrides)
+MODES = {
+    'scan': (False, {}),
+    'index': (True, {'ENGINE': 'python', 'PARALLEL_WORKERS': 0}),
+    'numpy': (True, {'ENGINE': 'numpy', 'PARALLEL_WORKERS': 0}),
+    'parallel': (True, {'ENGINE': 'python', 'PARALLEL_MIN_DOCUMENTS': 0}),
+}
+
+
+def build_catalog(size, seed=SEED):
+    """Generate ``size`` unsaved items, with ids from 1."""
+    demo_content.fake.seed(seed)
+    random.seed(seed)
+    return [Item(id=i, **demo_content.item_data()) for i in range(1, size + 1)]
+
+
+def build_queries(catalog, count, seed=SEED):
+    """
+    Generate ``count`` queries of one or two words of the item names, half
+    of them with a typo.
+    """
+    rand = random.Random(seed)
+    words = sorted({w for obj in catalog for w in utils.tokenize(obj.name.lower())})
+    queries = []
+    for i in range(count):
+        query = rand.sample(words, rand.randint(1, 2))
+        if i % 2:
+            word = query[0]
+            pos = rand.randrange(len(word))
+            query[0] = word[:pos] + rand.choice('aeiou') + word[pos + 1:]
+        queries.append(' '.join(query))
+    return queries
+
+
+def percentile(values, percent):
+    """Get the ``percent`` percentile of the values (nearest rank)."""
+    values = sorted(values)
+    rank = math.ceil(percent / 100 * len(values))
+    return values[max(rank, 1) - 1]
+
+
+class Counters:
+    """
+    Count the documents scored and the token pairs compared by the searches
+    run inside the :meth:`patch` context.
+    """
+
+    def __init__(self):
+        self.candidates = 0
+        self.pairs = 0
+
+    def rank(self, documents, attributes, weights, score, *args, **kwargs):
+        last = []
+
+        def counting_score(document, attr):
+            if not last or last[0] is not document:
+                last[:] = [document]
+                self.candidates += 1
+            return score(document, attr)
+
+        return self._rank(documents, attributes, weights, counting_score, *args, **kwargs)
+
+    def vectorized_search(self, index, doc_ids, *args, **kwargs):
+        doc_ids = list(doc_ids)
+        self.candidates += len(doc_ids)
+        return self._vectorized_search(index, doc_ids, *args, **kwargs)
+
+    def parallel_search(self, index, doc_ids, *args, **kwargs):
+        doc_ids = list(doc_ids)
+        self.candidates += len(doc_ids)
+        return self._parallel_search(index, doc_ids, *args, **kwargs)
+
+    def jaro_winkler(self, token1, token2):
+        self.pairs += 1
+        return self._jaro_winkler(token1, token2)
+
+    def patch(self):
+        self._rank = core.rank
+        self._vectorized_search = vectorized.search
+        self._parallel_search = parallel.search
+        self._jaro_winkler = search.cache._jaro_winkler
+
+        stack = ExitStack()
+        stack.enter_context(mock.patch.object(core, 'rank', new=self.rank))
+        stack.enter_context(mock.patch.object(
+            vectorized, 'search', new=self.vectorized_search))
+        stack.enter_context(mock.patch.object(
+            parallel, 'search', new=self.parallel_search))
+        stack.enter_context(mock.patch.object(
+            search.cache, '_jaro_winkler', new=self.jaro_winkler))
+        return stack
+
+
+def run_mode(mode, catalog, index, queries, limit, rounds=5):
+    """
+    Run the queries with the given mode.
+
+    The latency of each query is the lowest of ``rounds`` runs, to filter out
+    the noise of the other processes of the machine.
+
+    Returns:
+        dict: the metrics of the run
+    """
+    use_index, overrides = MODES[mode]
+
+    def run(query):
+        if use_index:
+            return index.search(query, ATTRIBUTES, limit=limit)
+        return search.search(query, ATTRIBUTES, catalog, limit)
+
+    with ExitStack() as stack:
+        for name, value in overrides.items():
+            stack.enter_context(mock.patch.object(config, name, value))
+
+        # counters and memory, with a first run of the queries
+        search.cache.clear()
+        counters = Counters()
+        tracemalloc.start()
+        with counters.patch():
+            for query in queries:
+                run(query)
+        memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        # latencies, with the jaro winkler cache as cold as in the first run
+        latencies = [float('inf')] * len(queries)
+        for _ in range(rounds):
+            search.cache.clear()
+            for i, query in enumerate(queries):
+                start = time.perf_counter()
+                run(query)
+                latencies[i] = min(latencies[i], (time.perf_counter() - start) * 1000)
+
+    return {
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'candidates': counters.candidates / len(queries),
+        'pairs': counters.pairs / len(queries),
+        'memory': memory / 2 ** 20,
+    }
+
+
+def build_index(catalog):
+    """Build an unregistered index of the catalog, with its peak memory (MiB)."""
+    tracemalloc.start()
+    index = SearchIndex(ATTRIBUTES)
+    for obj in catalog:
+        index.add_object(obj)
+    memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return index, memory / 2 ** 20
+
+
+def regressions(results, baseline, tolerance, latency_tolerance=None):
+    """
+    Compare the results of a run with a baseline.
+
+    Arguments:
+        results (dict): ``{size: {mode: {metric: value}}}``
+        baseline (dict): results of a previous run, same structure
+        tolerance (float): allowed increase of each value, i.e. ``0.25`` for
+            25%
+        latency_tolerance (float): allowed increase of the latencies,
+            defaults to ``tolerance``
+
+    Returns:
+        list: ``(size, mode, metric, value, baseline value)`` of the values
+        higher than the baseline ones over the tolerance
+    """
+    if latency_tolerance is None:
+        latency_tolerance = tolerance
+
+    found = []
+    for size, modes in results.items():
+        for mode, metrics in modes.items():
+            expected = baseline.get(size, {}).get(mode)
+            if expected is None:
+                continue
+            for metric in METRICS:
+                allowed = latency_tolerance if metric in LATENCIES else tolerance
+                if metrics[metric] > expected[metric] * (1 + allowed):
+                    found.append((size, mode, metric, metrics[metric], expected[metric]))
+    return found
+
+
+@click.command()
+@click.option('--sizes', default='1000,10000', help='Comma separated catalog sizes.')
+@click.option('--modes', default='scan,index,numpy',
+              help='Comma separated search modes ({}).'.format(', '.join(MODES)))
+@click.option('--queries', default=50, help='Number of queries for each run.')
+@click.option('--limit', default=20, help='Maximum number of results of the queries.')
+@click.option('--rounds', default=5, help='Runs of each query, the fastest is kept.')
+@click.option('--workers', default=4, help='Processes of the parallel mode.')
+@click.option('--max-scan-size', default=100000,
+              help='Biggest catalog searched with the scan mode.')
+@click.option('--baseline', default=BASELINE, help='Baseline file.')
+@click.option('--save-baseline', is_flag=True, help='Store the results as the baseline.')
+@click.option('--tolerance', default=0.1, help='Allowed increase over the baseline.')
+@click.option('--latency-tolerance', default=0.5,
+              help='Allowed increase of the latencies over the baseline.')
+def main(sizes, modes, queries, limit, rounds, workers, max_scan_size, baseline,
+         save_baseline, tolerance, latency_tolerance):
+    sizes = [int(size) for size in sizes.split(',')]
+    modes = modes.split(',')
+    MODES['parallel'][1]['PARALLEL_WORKERS'] = workers
+
+    start = time.time()
+    catalog = build_catalog(max(sizes))
+    click.echo('Generated {} items in {:.2f}s'.format(len(catalog), time.time() - start))
+
+    header = '{:>8} {:>9} {:>9} {:>9} {:>9} {:>11} {:>9} {:>9}'
+    row = '{:>8} {:>9} {:>9.2f} {:>9.2f} {:>9.2f} {:>11.1f} {:>9.1f} {:>9.1f}'
+    click.echo(header.format('size', 'mode', 'p50 ms', 'p95 ms', 'p99 ms',
+                             'candidates', 'pairs', 'peak MiB'))
+
+    results = {}
+    for size in sizes:
+        items = catalog[:size]
+        size_queries = build_queries(items, queries)
+        index, index_memory = build_index(items)
+        for mode in modes:
+            if mode == 'scan' and size > max_scan_size:
+                continue
+            metrics = run_mode(mode, items, index, size_queries, limit, rounds)
+            if MODES[mode][0]:
+                metrics['memory'] += index_memory
+            results.setdefault(str(size), {})[mode] = metrics
+            click.echo(row.format(size, mode, *(metrics[m] for m in METRICS)))
+    parallel.shutdown()
+
+    if save_baseline:
+        with open(baseline, 'w') as fo:
+            json.dump(results, fo, indent=2, sort_keys=True)
+        click.echo('Baseline saved to {}'.format(baseline))
+        return
+
+    if not os.path.exists(baseline):
+        click.echo('No baseline to compare with at {}'.format(baseline))
+        return
+
+    with open(baseline) as fo:
+        found = regressions(results, json.load(fo), tolerance, latency_tolerance)
+    for size, mode, metric, value, expected in found:
+        click.echo('REGRESSION {} items, {}: {} {:.2f} (baseline {:.2f})'.format(
+            size, mode, metric, value, expected))
+    if found:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Rebuild from scratch the search index of the searchable models.
+
+Items created, edited or deleted through the API keep the index up to date
+one at a time, so a full rebuild is only needed after bulk changes made
+directly on the database (i.e. with ``scripts/demo_content.py``).
+
+With ``--snapshot`` the index is written as a memory mapped snapshot (see
+:mod:`search.snapshot`) to the given file, atomically replacing the previous
+one: the running application processes load it on their next request.
+
+With ``--shared`` a new generation of the index shared by the application
+processes (see :mod:`search.shared`) is published in the given directory,
+and the processes map it on their next request.
+
+One of the two is required: the in-memory index of ``SEARCH_INDEX=on`` lives
+in each application process, so it can only be rebuilt by restarting it.
+"""
+import time
+
+import click
+
+from models import Item, database
+import search
+
+
+@click.command()
+@click.option('--snapshot', default=search.config.SNAPSHOT_PATH,
+              help='Snapshot file to write, defaults to SEARCH_SNAPSHOT.')
+@click.option('--shared', default=search.config.SHARED_INDEX_DIR,
+              help='Shared index directory, defaults to SEARCH_SHARED_INDEX.')
+def main(snapshot, shared):
+    if not (snapshot or shared):
+        raise click.UsageError(
+            'Missing --snapshot or --shared (or SEARCH_SNAPSHOT or SEARCH_SHARED_INDEX): '
+            'the in-memory index of SEARCH_INDEX=on is built by each application '
+            'process, restart the application to rebuild it.')
+
+    if database.is_closed():
+        database.connect()
+
+    start = time.time()
+    if shared:
+        generation = search.shared.publish(Item, shared)
+        click.echo('Published generation {} of the shared index in {:.2f}s'.format(
+            generation, time.time() - start))
+        return
+
+    index = search.snapshot.build_snapshot(Item, snapshot)
+    elapsed = time.time() - start
+
+    terms = sum(len(postings) for postings in index.postings.values())
+    click.echo('Indexed {} items ({} terms) in {:.2f}s'.format(
+        len(index), terms, elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -5,7 +5,8 @@ and supply a new one db with new down-to-earth data.
 
 from peewee import fn
 from faker import Factory
-from models import User, Item, Order, OrderItem, Address, Picture, Favorite
+from models import (User, Item, Order, OrderItem, Address, Picture, Favorite,
+                    CatalogVersion, CatalogChange)
 import utils
 import argparse
 import glob
@@ -53,6 +54,8 @@ def set_db(database):
     Address._meta.database = database
     Picture._meta.database = database
     Favorite._meta.database = database
+    CatalogVersion._meta.database = database
+    CatalogChange._meta.database = database
 
 
 def user_creator(num_user):
@@ -75,22 +78,27 @@ def user_creator(num_user):
         )
 
 
-def item_creator(num_item):
+def item_data():
+    """Generate the fields of a new random item."""
     LIST_CATEGORIES = ['scarpe', 'accessori', 'abbigliamento uomo', 'abbigliamento donna']
+    item_id = fake.uuid4()
+    item_name = fake.sentence(nb_words=3, variable_nb_words=True)
+    item_price = fake.pyfloat(left_digits=2, right_digits=2, positive=True)
+    item_category = random.choice(LIST_CATEGORIES)
+    return {
+        'uuid': item_id,
+        'name': item_name,
+        'price': item_price,
+        'description': fake.paragraph(
+            nb_sentences=3, variable_nb_sentences=True),
+        'availability': random.randint(35, 60),
+        'category': item_category,
+    }
+
+
+def item_creator(num_item):
     for i in range(num_item):
-        item_id = fake.uuid4()
-        item_name = fake.sentence(nb_words=3, variable_nb_words=True)
-        item_price = fake.pyfloat(left_digits=2, right_digits=2, positive=True)
-        item_category = random.choice(LIST_CATEGORIES)
-        item = Item.create(
-            uuid=item_id,
-            name=item_name,
-            price=item_price,
-            description=fake.paragraph(
-                nb_sentences=3, variable_nb_sentences=True),
-            availability=random.randint(35, 60),
-            category=item_category,
-        )
+        item = Item.create(**item_data())
         picture_creator(num_item, i, item)
 
 
@@ -1,7 +1,8 @@
 from colorama import init, Fore, Style
 import sys
 from models import (User, Item, Order, OrderItem,
-                    Address, Picture, database, Favorite)
+                    Address, Picture, database, Favorite, CatalogVersion,
+                    CatalogChange)
 
 
 init(autoreset=True)
@@ -25,6 +26,10 @@ def drops_all_tables(database):
             Picture.drop_table()
         if table == 'favorite':
             Favorite.drop_table()
+        if table == 'catalogversion':
+            CatalogVersion.drop_table()
+        if table == 'catalogchange':
+            CatalogChange.drop_table()
 
 
 def create_tables():
@@ -35,6 +40,8 @@ def create_tables():
     OrderItem.create_table(fail_silently=True)
     Picture.create_table(fail_silently=True)
     Favorite.create_table(fail_silently=True)
+    CatalogVersion.create_table(fail_silently=True)
+    CatalogChange.create_table(fail_silently=True)
 
 
 def good_bye(word, default='has'):
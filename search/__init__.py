@@ -1 +1,6 @@
+from search import backends, cursor, popularity, shared, snapshot, stats  # noqa: F401
+from search.cache import ResultCache, SimilarityCache  # noqa: F401
 from search.core import search  # noqa: F401
+from search.facets import build_facet_index, drop_facet_index, get_facet_index  # noqa: F401
+from search.index import build_index, drop_index, get_index, get_indexes  # noqa: F401
+from search.suggest import build_prefix_index, drop_prefix_index, get_prefix_index  # noqa: F401
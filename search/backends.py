@@ -0,0 +1,320 @@
+"""
+Database-native candidate retrieval for the search engine.
+
+Without an in-memory index (see :mod:`search.index`) a search scores every
+row of the dataset. A backend lets the database itself find the rows that
+share a word prefix with the query through its own full-text index, so that
+only the best :any:`search.config.BACKEND_CANDIDATES` of them are pulled into
+python and re-ranked with the jaro winkler scoring.
+
+Prefixes of :any:`search.config.BACKEND_PREFIX_LENGTH` characters are used
+instead of the whole query tokens, since the jaro winkler similarity already
+favours words sharing their beginning (`scarpa` still finds `scarpe`).
+
+Backends are registered by name in :any:`BACKENDS`, and the one used is
+selected with :any:`search.config.CANDIDATES_BACKEND`:
+
+* ``'scan'``: no retrieval in the database, the full scan of the dataset
+* ``'sqlite'``: an FTS5 external content table kept up to date by triggers
+* ``'postgres'``: GIN indexes on a ``tsvector`` and on the ``pg_trgm``
+  trigrams of the searchable attributes
+
+A backend returns ``None`` when it cannot serve a search (another database,
+a model or attributes it was not set up for, an empty query...), and the
+search falls back to the full scan.
+"""
+from peewee import PostgresqlDatabase, SqliteDatabase
+
+from search import config, utils
+
+#: Backend instances, by name
+_INSTANCES = {}
+
+
+def _quote(database, name):
+    return '{0}{1}{0}'.format(database.quote_char, name)
+
+
+class ScanBackend:
+    """Backend that never retrieves candidates, so every search is a full scan."""
+
+    def setup(self, model, attributes=None):
+        """Prepare the database for the searches on a model (nothing to do)."""
+
+    def candidates(self, model, query, attributes, limit=None, ids=None):
+        """Always ``None``: the whole dataset has to be scored."""
+        return None
+
+
+class DatabaseBackend(ScanBackend):
+    """
+    Base class of the backends retrieving the candidates in the database.
+
+    Subclasses define the ``database_class`` they run on, how to create
+    their full-text index (:meth:`create`) and how to query it
+    (:meth:`query`).
+
+    Attributes:
+        models (dict): model class -> attributes set up for it
+    """
+    #: Database class the backend runs on
+    database_class = None
+
+    def __init__(self):
+        self.models = {}
+
+    def setup(self, model, attributes=None):
+        """
+        Create the full-text index of a model in its database, if missing.
+
+        Arguments:
+            model (:any:`BaseModel`): model class to index
+            attributes (list): attributes to index, defaults to the model
+                ``_search_attributes``
+        """
+        attributes = list(attributes or model._search_attributes)
+        database = model._meta.database
+        if not isinstance(database, self.database_class):
+            return
+
+        self.create(model, attributes)
+        self.models[model] = attributes
+
+    def candidates(self, model, query, attributes, limit=None, ids=None):
+        """
+        Get the ids of the rows of ``model`` that best match the query.
+
+        When only some ``ids`` are allowed (i.e. the rows passing the filters
+        of a search) the rows are selected again with a wider limit, until
+        ``limit`` of them are allowed or there are no more rows matching, so
+        that the allowed rows ranking below the others are found too.
+
+        Arguments:
+            model (:any:`BaseModel`): model class to search
+            query (str): search query
+            attributes (list): attributes to look into
+            limit (int): maximum number of ids, defaults to
+                :any:`search.config.BACKEND_CANDIDATES`
+            ids (set): ids of the rows allowed, all of them if ``None``
+
+        Returns:
+            list: row ids, best first, or ``None`` if the backend cannot
+            serve the search.
+        """
+        indexed = self.models.get(model)
+        if indexed is None or not set(attributes) <= set(indexed):
+            return None
+        if not isinstance(model._meta.database, self.database_class):
+            return None
+
+        prefixes = sorted({
+            token[:config.BACKEND_PREFIX_LENGTH]
+            for token in utils.tokenize(query.lower())
+        })
+        if not prefixes:
+            return None
+
+        limit = limit or config.BACKEND_CANDIDATES
+        selected = limit
+        while True:
+            sql, params = self.query(model, indexed, attributes, prefixes, selected)
+            cursor = model._meta.database.execute_sql(sql, params)
+            rows = [row[0] for row in cursor.fetchall()]
+            if ids is None:
+                return rows
+
+            allowed = [row for row in rows if row in ids]
+            if len(allowed) >= limit or len(rows) < selected:
+                return allowed[:limit]
+            # widen the limit by the share of the rows left out by the filter
+            selected = max(2 * selected, 2 * selected * limit // max(len(allowed), 1))
+
+    def drop(self, model):
+        """Drop the full-text index of a model from its database."""
+        if self.models.pop(model, None) is not None:
+            self.destroy(model)
+
+    def create(self, model, attributes):
+        """Create the full-text index of the attributes of the model."""
+        raise NotImplementedError
+
+    def destroy(self, model):
+        """Remove the full-text index of the model from the database."""
+        raise NotImplementedError
+
+    def query(self, model, indexed, attributes, prefixes, limit):
+        """
+        Get the ``(sql, params)`` selecting the ids of the best ``limit``
+        rows with a word starting with one of the ``prefixes``.
+        """
+        raise NotImplementedError
+
+
+class SqliteBackend(DatabaseBackend):
+    """
+    FTS5 backend for the SQLite database.
+
+    The ``<table>_fts`` virtual table reads the attributes from the model
+    table (external content), and triggers on the model table keep its index
+    up to date on every insert, update and delete. The index is built from the
+    existing rows when the virtual table is created, so the setup of the
+    other processes finding it already there is cheap.
+    """
+    database_class = SqliteDatabase
+
+    def _names(self, model, attributes):
+        database = model._meta.database
+        table = model._meta.db_table
+        columns = [model._meta.fields[attr].db_column for attr in attributes]
+        return (
+            _quote(database, table),
+            _quote(database, '{}_fts'.format(table)),
+            [_quote(database, column) for column in columns],
+            _quote(database, model._meta.primary_key.db_column),
+        )
+
+    def _triggers(self, model):
+        database = model._meta.database
+        fts_table = '{}_fts'.format(model._meta.db_table)
+        return {
+            'trigger_{}'.format(event): _quote(database, '{}_{}'.format(fts_table, event))
+            for event in ('ai', 'ad', 'au')
+        }
+
+    def create(self, model, attributes):
+        database = model._meta.database
+        table, fts, columns, pk = self._names(model, attributes)
+        values = ', '.join('new.{}'.format(c) for c in columns)
+        old_values = ', '.join('old.{}'.format(c) for c in columns)
+        statements = [
+            'CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({columns}, '
+            'content={table}, content_rowid={pk})',
+            'CREATE TRIGGER IF NOT EXISTS {trigger_ai} AFTER INSERT ON {table} BEGIN '
+            'INSERT INTO {fts}(rowid, {columns}) VALUES (new.{pk}, {values}); END',
+            'CREATE TRIGGER IF NOT EXISTS {trigger_ad} AFTER DELETE ON {table} BEGIN '
+            'INSERT INTO {fts}({fts}, rowid, {columns}) '
+            'VALUES (\'delete\', old.{pk}, {old_values}); END',
+            'CREATE TRIGGER IF NOT EXISTS {trigger_au} AFTER UPDATE ON {table} BEGIN '
+            'INSERT INTO {fts}({fts}, rowid, {columns}) '
+            'VALUES (\'delete\', old.{pk}, {old_values}); '
+            'INSERT INTO {fts}(rowid, {columns}) VALUES (new.{pk}, {values}); END',
+        ]
+        names = {
+            'table': table, 'fts': fts, 'pk': pk, 'columns': ', '.join(columns),
+            'values': values, 'old_values': old_values,
+        }
+        names.update(self._triggers(model))
+        with database.atomic():
+            created = not database.execute_sql(
+                'SELECT 1 FROM sqlite_master WHERE type = \'table\' AND name = ?',
+                ['{}_fts'.format(model._meta.db_table)]).fetchone()
+            if created:
+                statements.append('INSERT INTO {fts}({fts}) VALUES (\'rebuild\')')
+            for statement in statements:
+                database.execute_sql(statement.format(**names))
+
+    def destroy(self, model):
+        database = model._meta.database
+        _, fts, _, _ = self._names(model, [])
+        with database.atomic():
+            for trigger in self._triggers(model).values():
+                database.execute_sql('DROP TRIGGER IF EXISTS {}'.format(trigger))
+            database.execute_sql('DROP TABLE IF EXISTS {}'.format(fts))
+
+    def query(self, model, indexed, attributes, prefixes, limit):
+        _, fts, _, _ = self._names(model, indexed)
+        columns = ' '.join(model._meta.fields[attr].db_column for attr in attributes)
+        match = '{{{}}} : ({})'.format(
+            columns, ' OR '.join('"{}"*'.format(p) for p in prefixes))
+        sql = 'SELECT rowid FROM {fts} WHERE {fts} MATCH ? ORDER BY rank LIMIT ?'
+        return sql.format(fts=fts), [match, limit]
+
+
+class PostgresBackend(DatabaseBackend):
+    """
+    Backend for the PostgreSQL database.
+
+    Two GIN indexes are created on the concatenation of the attributes: one
+    on its ``tsvector`` (with the ``simple`` configuration, so that words are
+    not stemmed) to match the prefixes, and one on its ``pg_trgm`` trigrams to
+    match words with typos in the first characters too. Both are expression
+    indexes, so PostgreSQL keeps them up to date by itself.
+    """
+    database_class = PostgresqlDatabase
+
+    def _document(self, model, attributes):
+        database = model._meta.database
+        return " || ' ' || ".join(
+            "coalesce({}, '')".format(_quote(database, model._meta.fields[attr].db_column))
+            for attr in attributes
+        )
+
+    def create(self, model, attributes):
+        database = model._meta.database
+        table = model._meta.db_table
+        document = self._document(model, attributes)
+        statements = [
+            'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+            'CREATE INDEX IF NOT EXISTS {tsv_index} ON {table} '
+            'USING GIN (to_tsvector(\'simple\', {document}))',
+            'CREATE INDEX IF NOT EXISTS {trgm_index} ON {table} '
+            'USING GIN (({document}) gin_trgm_ops)',
+        ]
+        names = {
+            'table': _quote(database, table), 'document': document,
+            'tsv_index': _quote(database, '{}_search_tsv'.format(table)),
+            'trgm_index': _quote(database, '{}_search_trgm'.format(table)),
+        }
+        with database.atomic():
+            for statement in statements:
+                database.execute_sql(statement.format(**names))
+
+    def destroy(self, model):
+        database = model._meta.database
+        with database.atomic():
+            for index in ('search_tsv', 'search_trgm'):
+                database.execute_sql('DROP INDEX IF EXISTS {}'.format(
+                    _quote(database, '{}_{}'.format(model._meta.db_table, index))))
+
+    def query(self, model, indexed, attributes, prefixes, limit):
+        database = model._meta.database
+        # same expression of the indexes, so that they can be used
+        document = self._document(model, indexed)
+        tsquery = ' | '.join("'{}':*".format(p) for p in prefixes)
+        words = ' '.join(prefixes)
+        sql = (
+            'SELECT {pk} FROM {table} '
+            'WHERE to_tsvector(\'simple\', {document}) @@ to_tsquery(\'simple\', %s) '
+            'OR %s <%% ({document}) '
+            'ORDER BY greatest('
+            'ts_rank(to_tsvector(\'simple\', {document}), to_tsquery(\'simple\', %s)), '
+            'word_similarity(%s, {document})) DESC '
+            'LIMIT %s'
+        ).format(
+            pk=_quote(database, model._meta.primary_key.db_column),
+            table=_quote(database, model._meta.db_table),
+            document=document,
+        )
+        return sql, [tsquery, words, tsquery, words, limit]
+
+
+#: Available backends, by name
+BACKENDS = {
+    'scan': ScanBackend,
+    'sqlite': SqliteBackend,
+    'postgres': PostgresBackend,
+}
+
+
+def get_backend(name=None):
+    """
+    Get the instance of a backend.
+
+    Arguments:
+        name (str): name of the backend in :any:`BACKENDS`, defaults to
+            :any:`search.config.CANDIDATES_BACKEND`
+    """
+    name = name or config.CANDIDATES_BACKEND
+    if name not in _INSTANCES:
+        _INSTANCES[name] = BACKENDS[name]()
+    return _INSTANCES[name]
@@ -0,0 +1,167 @@
+"""
+BK-tree of the vocabulary terms, for the typo tolerant lookups.
+
+A BK-tree (Burkhard-Keller tree) is a metric tree: every child of a node is
+stored under its Levenshtein distance from the node term, so by the triangle
+inequality only the children whose distance is within ``max_distance`` of
+the distance between the node and the looked up word can hold a match, and
+the rest of the tree is skipped. Looking up a misspelled word visits only a
+small part of the vocabulary, instead of comparing it with every term.
+
+Distances are computed with the ``distance`` package.
+
+The tree is used by :class:`search.index.SearchIndex` to find the vocabulary
+terms close to the query tokens (when :any:`search.config.SIMILAR_TERMS` is
+``'bktree'``) and by :func:`did_you_mean` to correct the queries without
+results.
+
+Example:
+    >>> from search.bktree import BKTree
+    >>> tree = BKTree(['scarpe', 'scarponi', 'sedie'])
+    >>> tree.find('scrape', 2)
+    {'scarpe': 2}
+"""
+import distance
+
+from search import config, utils
+
+
+class _Node:
+    __slots__ = ('term', 'children', 'removed')
+
+    def __init__(self, term):
+        self.term = term
+        self.children = {}
+        self.removed = False
+
+
+class BKTree:
+    """
+    BK-tree of a set of terms, under the Levenshtein distance.
+
+    Removed terms are only flagged, and the tree is rebuilt once they are
+    more than the terms left.
+    """
+
+    def __init__(self, terms=()):
+        self.root = None
+        self.size = 0
+        self.removed = 0
+        for term in terms:
+            self.add(term)
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, term):
+        node = self._node(term)
+        return node is not None and not node.removed
+
+    def __iter__(self):
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            if not node.removed:
+                yield node.term
+            stack.extend(node.children.values())
+
+    def _node(self, term):
+        """Get the node of a term, even if removed, or ``None``."""
+        node = self.root
+        while node is not None:
+            dist = distance.levenshtein(term, node.term)
+            if dist == 0:
+                return node
+            node = node.children.get(dist)
+        return None
+
+    def add(self, term):
+        """Add a term to the tree, if missing."""
+        if self.root is None:
+            self.root = _Node(term)
+            self.size += 1
+            return
+
+        node = self.root
+        while True:
+            dist = distance.levenshtein(term, node.term)
+            if dist == 0:
+                if node.removed:
+                    node.removed = False
+                    self.removed -= 1
+                    self.size += 1
+                return
+
+            child = node.children.get(dist)
+            if child is None:
+                node.children[dist] = _Node(term)
+                self.size += 1
+                return
+            node = child
+
+    def remove(self, term):
+        """Remove a term from the tree, if present."""
+        node = self._node(term)
+        if node is None or node.removed:
+            return
+
+        node.removed = True
+        self.size -= 1
+        self.removed += 1
+        if self.removed > self.size:
+            terms = list(self)
+            self.root, self.size, self.removed = None, 0, 0
+            for term in terms:
+                self.add(term)
+
+    def find(self, word, max_distance):
+        """
+        Get the terms within ``max_distance`` edits from ``word``.
+
+        Returns:
+            dict: term -> Levenshtein distance from ``word``
+        """
+        matches = {}
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            dist = distance.levenshtein(word, node.term)
+            if dist <= max_distance and not node.removed:
+                matches[node.term] = dist
+            for child_dist, child in node.children.items():
+                if dist - max_distance <= child_dist <= dist + max_distance:
+                    stack.append(child)
+        return matches
+
+
+def did_you_mean(query, tree, frequency, max_distance=None):
+    """
+    Correct the tokens of a query that are not terms of the vocabulary.
+
+    Each of them is replaced by the closest term of the tree, the one found in
+    more documents (and then the first in alphabetical order) if more terms
+    are at the same distance.
+
+    Arguments:
+        query (str): search query
+        tree (:class:`BKTree`): vocabulary terms
+        frequency (callable): ``frequency(term)`` returns the number of
+            documents containing the term
+        max_distance (int): maximum distance of the corrections, defaults to
+            :any:`search.config.TYPO_MAX_DISTANCE`
+
+    Returns:
+        str: the corrected query tokens, ``None`` if there is nothing to correct
+    """
+    if max_distance is None:
+        max_distance = config.TYPO_MAX_DISTANCE
+
+    tokens, corrected = utils.tokenize(query.lower()), False
+    for i, token in enumerate(tokens):
+        matches = tree.find(token, max_distance)
+        if not matches or token in matches:
+            continue
+        tokens[i] = min(matches, key=lambda term: (matches[term], -frequency(term), term))
+        corrected = True
+
+    return ' '.join(tokens) if corrected else None
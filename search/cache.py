@@ -0,0 +1,147 @@
+"""
+Caches for the search engine.
+
+Searching compares the same words again and again: within a single query the
+same (document token, query token) pairs come up for every document that
+contains the token, and popular queries repeat the same comparisons across
+requests.
+
+:class:`SimilarityCache` memoizes the jaro winkler value of each pair of
+tokens for a single query, in front of a process-wide bounded LRU cache of
+:any:`search.config.SIMILARITY_CACHE_SIZE` pairs shared by all the queries.
+
+Real traffic is also skewed towards a few popular queries, so the ranked ids
+of the latest searches are kept in :any:`results`, a :class:`ResultCache`
+that is emptied every time the catalog version changes (i.e. when an item is
+saved or deleted by any process, see :any:`BaseModel.catalog_version`).
+"""
+from collections import OrderedDict
+from functools import lru_cache
+
+import jellyfish as jf
+
+from search import config
+
+
+if config.SIMILARITY_CACHE_SIZE:
+    _jaro_winkler = lru_cache(maxsize=config.SIMILARITY_CACHE_SIZE)(jf.jaro_winkler)
+else:
+    _jaro_winkler = jf.jaro_winkler
+
+
+def clear():
+    """Empty the process-wide similarity cache."""
+    if hasattr(_jaro_winkler, 'cache_clear'):
+        _jaro_winkler.cache_clear()
+
+
+class SimilarityCache:
+    """
+    Callable returning the jaro winkler value of two tokens, computing it
+    only the first time a pair is requested.
+
+    A new instance should be created for each query, so that its memory is
+    released as soon as the query is done.
+
+    Example:
+        >>> cache = SimilarityCache()
+        >>> cache('scarpe', 'scarpa')
+        0.9333333333333333
+        >>> len(cache)
+        1
+    """
+
+    def __init__(self):
+        self.pairs = {}
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def __call__(self, token1, token2):
+        key = (token1, token2)
+        try:
+            return self.pairs[key]
+        except KeyError:
+            value = self.pairs[key] = _jaro_winkler(token1, token2)
+            return value
+
+
+class ResultCache:
+    """
+    Bounded LRU cache of the ranked ids of search results, valid for a single
+    version of the catalog.
+
+    Keys can be any hashable value identifying a search (normalized query,
+    limit, attributes, weights, threshold, ...). The version of the catalog
+    is shared by all the processes, while each of them has its own cache:
+    :meth:`check` must be called with the current version before each lookup,
+    to drop the results ranked on a previous one. :meth:`bump` drops all the
+    cached results when only the ranking of the process changed.
+
+    Attributes:
+        size (int): maximum number of results kept, when ``None``
+            :any:`search.config.RESULT_CACHE_SIZE` is used
+        version: catalog version of the cached results
+
+    Example:
+        >>> cache = ResultCache(size=2)
+        >>> cache.check(120)
+        >>> cache.put(('scarpe', 10), [3, 1, 2])
+        >>> cache.get(('scarpe', 10))
+        [3, 1, 2]
+        >>> cache.check(121)
+        >>> cache.get(('scarpe', 10)) is None
+        True
+    """
+
+    def __init__(self, size=None):
+        self.size = size
+        self.version = None
+        self.results = OrderedDict()
+
+    def __len__(self):
+        return len(self.results)
+
+    @property
+    def max_size(self):
+        return config.RESULT_CACHE_SIZE if self.size is None else self.size
+
+    def get(self, key):
+        """Get the cached ids of a search, ``None`` if not cached."""
+        try:
+            ids = self.results[key]
+        except KeyError:
+            return None
+        self.results.move_to_end(key)
+        return ids
+
+    def put(self, key, ids):
+        """
+        Cache the ranked ids of a search, evicting the least recently used.
+        Rankings longer than :any:`search.config.RESULT_CACHE_MAX_RESULTS`
+        are not cached.
+        """
+        ids = list(ids)
+        if self.max_size <= 0 or len(ids) > config.RESULT_CACHE_MAX_RESULTS:
+            return
+        self.results[key] = ids
+        self.results.move_to_end(key)
+        while len(self.results) > self.max_size:
+            self.results.popitem(last=False)
+
+    def check(self, version):
+        """
+        Move to the current catalog version, dropping all the cached results
+        if it changed (i.e. in another process) since they were ranked.
+        """
+        if version != self.version:
+            self.version = version
+            self.results.clear()
+
+    def bump(self):
+        """Drop all the cached results, i.e. when the ranking changed."""
+        self.results.clear()
+
+
+#: Search results cache of the application catalog
+results = ResultCache()
@@ -3,6 +3,8 @@ This module contains constants and configuration options for the search engine,
 that allows to quickly customize the threshold, matching parameters' weights
 and other options without having to touch the code.
 """
+import os
+
 #: string equality weight for weighted average with positional coefficient
 MATCH_WEIGHT = 0.2
 
@@ -17,3 +19,129 @@ MIN_WORD_LENGTH = 3
 
 #: Regex that will be used to split a string into separate chunks
 STR_SPLIT_REGEX = r'\W+'
+
+#: maximum number of ranked ids used to restrict a database query at once
+#: when fetching the results of a search through an index (see :any:`search.index`).
+CANDIDATES_CHUNK_SIZE = 500
+
+#: build the search index of the searchable models when the application
+#: starts, enabled with the ``SEARCH_INDEX=on`` environment variable.
+INDEX_ON_STARTUP = os.getenv('SEARCH_INDEX', 'off') == 'on'
+
+#: file of the memory mapped snapshot of the search index of :any:`Item`
+#: (see :mod:`search.snapshot`), loaded by the application at its first
+#: request and reloaded when a new one replaces it. Set with the
+#: ``SEARCH_SNAPSHOT`` environment variable, empty to keep the index in the
+#: memory of each process.
+SNAPSHOT_PATH = os.getenv('SEARCH_SNAPSHOT', '')
+
+#: directory of the search index of :any:`Item` shared by all the processes
+#: of the application (see :mod:`search.shared`), published by the gunicorn
+#: master when it starts and mapped by every worker. Set with the
+#: ``SEARCH_SHARED_INDEX`` environment variable (i.e. to a directory under
+#: ``/dev/shm``), empty to disable.
+SHARED_INDEX_DIR = os.getenv('SEARCH_SHARED_INDEX', '')
+
+#: number of documents changed since the snapshot was written after which a
+#: new snapshot is rebuilt (or the next generation of the shared index is
+#: published) in background.
+SNAPSHOT_MAX_CHANGES = 1000
+
+#: size of the character n-grams used to find the vocabulary terms similar to
+#: the query tokens (see :mod:`search.ngrams`).
+NGRAM_SIZE = 3
+
+#: minimum n-gram similarity (shared n-grams over all the distinct n-grams of
+#: the two words) for a vocabulary term to be scored against a query token.
+#: ``0`` scores every term of the vocabulary.
+NGRAM_SIMILARITY = 0.2
+
+#: lookup of the vocabulary terms similar to the query tokens, whose documents
+#: are the search candidates: ``'ngrams'`` (terms sharing enough n-grams, see
+#: :any:`NGRAM_SIMILARITY`) or ``'bktree'`` (terms within
+#: :any:`TYPO_MAX_DISTANCE` edits, see :mod:`search.bktree`).
+SIMILAR_TERMS = 'ngrams'
+
+#: maximum Levenshtein distance of a vocabulary term from a misspelled query
+#: token, for the ``'bktree'`` lookup and the "did you mean" corrections.
+TYPO_MAX_DISTANCE = 2
+
+#: maximum number of (token, token) jaro winkler values kept in the process-wide
+#: LRU cache shared by all the queries (see :mod:`search.cache`), read when
+#: the package is imported. ``0`` disables the cache.
+SIMILARITY_CACHE_SIZE = 2 ** 16
+
+#: maximum number of searches whose ranked result ids are kept in the LRU
+#: cache of :any:`search.cache.results`, until the catalog changes. ``0``
+#: disables the cache.
+RESULT_CACHE_SIZE = 1024
+
+#: maximum number of ranked ids of a single search kept in the cache of
+#: :any:`search.cache.results`: longer rankings (i.e. of unlimited searches)
+#: are not cached.
+RESULT_CACHE_MAX_RESULTS = 1000
+
+#: collect the counters and timings of all the searches of the application
+#: (see :mod:`search.stats`), enabled with the ``SEARCH_STATS=on``
+#: environment variable. When disabled they are collected only for the
+#: requests asking to ``explain`` the search.
+COLLECT_STATS = os.getenv('SEARCH_STATS', 'off') == 'on'
+
+#: how much the popularity of the items (see :mod:`search.popularity`) boosts
+#: their match: a match is multiplied by ``1 + POPULARITY_WEIGHT *
+#: popularity``, where the popularity goes from ``0`` to ``1``. ``0``
+#: ranks by the match of the text alone.
+POPULARITY_WEIGHT = 0
+
+#: days of the recent window of the sales, whose units count
+#: :any:`POPULARITY_RECENT_WEIGHT` times more.
+POPULARITY_WINDOW_DAYS = 30
+
+#: weight of each unit sold in the recent window, in addition to the one of
+#: every unit sold.
+POPULARITY_RECENT_WEIGHT = 2
+
+#: weight of each user having the item among the favorites.
+POPULARITY_FAVORITE_WEIGHT = 1
+
+#: weighted count of units and favorites that makes the popularity of an
+#: item ``0.5``.
+POPULARITY_SCALE = 20
+
+#: backend retrieving the search candidates in the database when a model has
+#: no search index (see :mod:`search.backends`): ``'scan'`` (no retrieval,
+#: full scan), ``'sqlite'`` or ``'postgres'``. Set with the
+#: ``SEARCH_BACKEND`` environment variable.
+CANDIDATES_BACKEND = os.getenv('SEARCH_BACKEND', 'scan')
+
+#: maximum number of candidates retrieved by a database backend to be
+#: re-ranked in python.
+BACKEND_CANDIDATES = 200
+
+#: length of the prefixes of the query tokens matched by a database backend
+BACKEND_PREFIX_LENGTH = 4
+
+#: maximum length of the autocomplete prefixes whose suggestions are cached
+#: until the prefix index changes (see :mod:`search.suggest`).
+SUGGEST_CACHED_PREFIX_LENGTH = 2
+
+#: fraction of empty slots (left by removed or updated documents) after which
+#: the document store of an index is compacted (see :mod:`search.store`).
+STORE_MAX_GARBAGE = 0.25
+
+#: number of processes used to score the candidates of a search through an
+#: index in parallel (see :mod:`search.parallel`). ``0`` disables the pool.
+PARALLEL_WORKERS = 0
+
+#: minimum number of candidate documents for a search to be run in parallel
+PARALLEL_MIN_DOCUMENTS = 50000
+
+#: maximum number of documents changed since the processes of the parallel
+#: pool were forked, whose tokens are sent along with the searches, before the
+#: pool is forked again from the current index
+PARALLEL_MAX_CHANGES = 5000
+
+#: engine used to score the documents of a search index: ``'python'`` scores
+#: one pair of tokens at a time, ``'numpy'`` aggregates whole arrays of
+#: documents at once (see :mod:`search.vectorized`).
+ENGINE = 'python'
@@ -3,12 +3,13 @@ Search API core module
 
 Contains the main functions to get match values and searching
 """
-import jellyfish as jf
+import heapq
 
-from search import utils, config
+from search import stats, utils, config
+from search.cache import SimilarityCache
 
 
-def similarity(query, string):
+def similarity(query, string, cache=None):
     """
     Calculate the match for the given `query` and `string`.
 
@@ -19,45 +20,89 @@ def similarity(query, string):
     Arguments:
         query (str): search query
         string (str): string to test against
+        cache (:class:`search.cache.SimilarityCache`): cache to look up the
+            jaro winkler values into, a new one is used if not provided.
 
     Returns:
         float: normalized value indicating the probability of match, where
         0 means completely dissimilar and 1 means equal.
     """
 
+    counters = stats.current()
+    tokenize = utils.tokenize if counters is None else counters.tokenizer()
+
     # split the two strings cleaning out some stuff
-    query = utils.tokenize(query.lower())
-    string = utils.tokenize(string.lower())
+    query = tokenize(query.lower())
+    string = tokenize(string.lower())
+
+    return token_similarity(query, string, cache)
+
+
+def token_similarity(query, tokens, cache=None):
+    """
+    Calculate the match between two already tokenized strings, as
+    :func:`similarity` does.
+
+    Arguments:
+        query (list): tokens of the search query
+        tokens (list): tokens of the string to test against
+        cache (:class:`search.cache.SimilarityCache`): cache to look up the
+            jaro winkler values into, a new one is used if not provided.
 
+    Returns:
+        float: normalized match value
+    """
     # if one of the two strings is falsy (no content, or was passed with items
     # short enough to be trimmed out), return 0 here to avoid ZeroDivisionError
     # later on while processing.
-    if len(query) == 0 or len(string) == 0:
+    if len(query) == 0 or len(tokens) == 0:
         return 0
 
-    shortest, longest = sorted((query, string), key=lambda x: len(x))
+    if cache is None:
+        cache = SimilarityCache()
+        counters = stats.current()
+        if counters is not None:
+            cache = counters.cache(cache)
+
+    # jaro winkler equality for each (token, query token) pair
+    matrix = [[cache(token, q) for q in query] for token in tokens]
+    return matrix_similarity(matrix)
 
-    # matrix of tuples for each segment of both query and string
-    matrix = [(s1, s2) for s1 in longest for s2 in shortest]
 
-    matches = {}
-    for string1, string2 in matrix:
-        # get the jaro winkler equality between the two strings
-        match = jf.jaro_winkler(string1, string2)
-        # calculate the distance factor for the position of the segments
-        # on their respective lists
-        positional = utils.position_similarity(
-            string1, string2, longest, shortest)
+def matrix_similarity(matrix):
+    """
+    Calculate the match value of a string against the query, given the
+    jaro winkler value of each pair of their tokens.
+
+    For each token of the longest of the two (the string one if they have the
+    same length) the most similar token of the other is taken, and the
+    jaro winkler value is averaged with the distance factor for the position
+    of the two tokens in their respective lists.
 
-        # get them together and append to the matches dictionary
-        match = (match, positional)
-        matches.setdefault(string1, []).append(match)
+    Arguments:
+        matrix (list): ``matrix[i][j]`` is the jaro winkler value between the
+            ``i``-th token of the string and the ``j``-th token of the query.
+            Both dimensions must not be empty.
 
-    # get the highest value for each list, the apply the word-distance factor
-    # the key takes the jaro winkler distance value to get the max value
-    matches = [max(m, key=lambda x: x[0]) for m in matches.values()]
+    Returns:
+        float: normalized match value
+    """
+    tokens_len, query_len = len(matrix), len(matrix[0])
     _weights = (config.MATCH_WEIGHT, config.DIST_WEIGHT)
-    matches = [utils.weighted_average((m, d), _weights) for m, d in matches]
+
+    matches = []
+    if tokens_len >= query_len:
+        # string is the longest, match each of its tokens with the query
+        for i, row in enumerate(matrix):
+            # first index with the highest jaro winkler value
+            j = max(range(query_len), key=row.__getitem__)
+            positional = utils.index_similarity(i, j, tokens_len, query_len)
+            matches.append(utils.weighted_average((row[j], positional), _weights))
+    else:
+        for j in range(query_len):
+            i = max(range(tokens_len), key=lambda i: matrix[i][j])
+            positional = utils.index_similarity(j, i, query_len, tokens_len)
+            matches.append(utils.weighted_average((matrix[i][j], positional), _weights))
 
     # get the weighted mean for all the highest matches and apply the highest
     # match value found as coefficient as multiplier, to add weights to more
@@ -66,9 +111,222 @@ def similarity(query, string):
     return mean_match
 
 
+def rank(documents, attributes, weights, score, limit=-1, threshold=0, after=None,
+         boosts=None):
+    """
+    Rank the documents by their weighted match, keeping only the best
+    ``limit`` ones in a heap.
+
+    The match of a document is the highest attribute match multiplied by the
+    weight of that attribute. Attributes are scored from the heaviest one, and
+    since an attribute match cannot be higher than ``1`` the weights give an
+    upper bound of the match a document can still reach: as soon as it is
+    lower than the threshold or than the `k`-th best match found so far the
+    remaining attributes are not scored at all.
+
+    Arguments:
+        documents (iterable): ``(key, document)`` tuples, where ``key`` is an
+            unique number used to sort the documents with the same match
+            (lowest first).
+        attributes (list): attributes names
+        weights (dict): attribute -> weight, as returned by
+            :func:`search.utils.attribute_weights`
+        score (callable): ``score(document, attribute)`` returns the match of
+            the attribute of the document.
+        limit (int): maximum number of documents to return, ``-1`` for all.
+        threshold (float): minimum match for a document to be included.
+        after (tuple): ``(match, key)`` position of the last document of a
+            previous page of results (see :mod:`search.cursor`): only the
+            documents ranked after it are returned.
+        boosts (sequence): multiplier of the match of each document, indexed
+            by key (see :mod:`search.popularity`), applied once the document
+            reached the ``threshold``. Keys past its end are not boosted.
+
+    Returns:
+        list: ``(document, match)`` tuples sorted by relevance
+    """
+    # attributes indexes, from the heaviest one
+    order = sorted(range(len(attributes)), key=lambda i: -weights[attributes[i]])
+    order_weights = [weights[attributes[i]] for i in order]
+
+    # min heap of the best `limit` documents, whose first item is the one
+    # that a new document has to beat: lowest match, then highest key.
+    heap = []
+    matches = []
+    if after is not None:
+        after = (after[0], -after[1])
+
+    factor = 1
+    for key, document in documents:
+        if boosts is not None:
+            try:
+                factor = boosts[key]
+            except IndexError:
+                factor = 1
+
+        floor = threshold
+        if 0 < limit == len(heap):
+            floor = max(floor, heap[0][0] / factor)
+
+        best, best_index = None, None
+        for n, i in enumerate(order):
+            bound = order_weights[n]
+            if best is not None:
+                bound = max(bound, best * weights[attributes[best_index]])
+            if bound < floor:
+                break
+
+            match = score(document, attributes[i])
+            if best is None or match > best or (match == best and i < best_index):
+                best, best_index = match, i
+        else:
+            match = best * weights[attributes[best_index]]
+            if match < threshold:
+                continue
+
+            entry = (match * factor, -key, document)
+            if after is not None and entry[:2] >= after:
+                # already returned in a previous page
+                continue
+            if limit <= 0:
+                matches.append(entry)
+            elif len(heap) < limit:
+                heapq.heappush(heap, entry)
+            elif entry[:2] > heap[0][:2]:
+                heapq.heapreplace(heap, entry)
+
+    matches = sorted(heap or matches, key=lambda m: (-m[0], -m[1]))
+    return [(document, match) for match, _, document in matches]
+
+
+def batch_rank(documents, attributes, weights, score, count, limit=-1, threshold=0,
+               boosts=None):
+    """
+    Rank the documents for ``count`` queries at once, scoring each attribute
+    of a document once for all the queries, with the same results of
+    :func:`rank` for each of them.
+
+    Arguments:
+        documents (iterable): ``(key, document, queries)`` tuples, where
+            ``key`` is as for :func:`rank` and ``queries`` the indexes of the
+            queries the document has to be ranked for (``None`` for all).
+        attributes (list): attributes names
+        weights (dict): attribute -> weight, as returned by
+            :func:`search.utils.attribute_weights`
+        score (callable): ``score(document, attribute, queries)`` returns the
+            list of the matches of the attribute for the given queries indexes.
+        count (int): number of queries
+        limit (int): maximum number of documents to return for each query,
+            ``-1`` for all.
+        threshold (float): minimum match for a document to be included.
+        boosts (sequence): multiplier of the match of each document, indexed
+            by key, as for :func:`rank`
+
+    Returns:
+        list: for each query, the ``(document, match)`` tuples sorted by
+        relevance
+    """
+    all_queries = list(range(count))
+    heaps = [[] for _ in all_queries]
+
+    factor = 1
+    for key, document, queries in documents:
+        if queries is None:
+            queries = all_queries
+        if boosts is not None:
+            try:
+                factor = boosts[key]
+            except IndexError:
+                factor = 1
+
+        # highest attribute match (the first one on ties) for each query
+        best = [None] * len(queries)
+        best_attr = [None] * len(queries)
+        for attr in attributes:
+            for n, match in enumerate(score(document, attr, queries)):
+                if best[n] is None or match > best[n]:
+                    best[n], best_attr[n] = match, attr
+
+        for n, query in enumerate(queries):
+            match = best[n] * weights[best_attr[n]]
+            if match < threshold:
+                continue
+
+            heap, entry = heaps[query], (match * factor, -key, document)
+            if limit <= 0 or len(heap) < limit:
+                heapq.heappush(heap, entry)
+            elif entry[:2] > heap[0][:2]:
+                heapq.heapreplace(heap, entry)
+
+    return [
+        [(document, match) for match, _, document in sorted(heap, key=lambda m: (-m[0], -m[1]))]
+        for heap in heaps
+    ]
+
+
+def batch_search(queries, attributes, dataset, limit=-1,
+                 threshold=config.THRESHOLD, weights=None, cache=None, key=None,
+                 boosts=None):
+    """
+    Search the dataset for many queries at once, with the same results of
+    :func:`search_matches` for each of them, in a single pass over the
+    dataset.
+
+    Each attribute of the objects is tokenized once for all the queries, and
+    the jaro winkler values of its tokens against the query tokens are shared
+    by all the queries through the ``cache``, so that the distinct tokens of
+    all the queries are compared with each word once.
+
+    Arguments:
+        queries (list): search queries (str)
+        attributes (list): the names of the attributes to search into
+        dataset (iterable): objects to look up, as for :func:`search`
+        limit (int): maximum number of results of each query, ``-1`` for all
+        threshold (float): value under which results are considered not valid
+        weights (list): attributes weights, as for :func:`search`
+        cache (:class:`search.cache.SimilarityCache`): cache for the jaro
+            winkler values, a new one is used if not provided.
+        key (callable): ``key(object)`` returns the unique number used to
+            sort the objects with the same match, by default the position of
+            the object in the dataset.
+        boosts (sequence): multiplier of the match of each object, indexed by
+            key, see :func:`rank`
+
+    Returns:
+        list: for each query, the ``(resource, match)`` tuples of its results
+        sorted by relevance
+
+    Example:
+        >>> from models import Item
+        >>> from search.core import batch_search
+        >>> batch_search(['scarpe', 'sedia'], ['name'], Item.select(), limit=10)
+        [[(<Item 'scarpe rosse'>, 0.95)], [(<Item 'sedia'>, 1.0)]]
+    """
+    weights = utils.attribute_weights(attributes, weights)
+
+    if not threshold:
+        threshold = 0
+
+    if cache is None:
+        cache = SimilarityCache()
+
+    query_tokens = [utils.tokenize(query.lower()) for query in queries]
+
+    def score(obj, attr, indexes):
+        tokens = utils.tokenize(getattr(obj, attr).lower())
+        return [token_similarity(query_tokens[n], tokens, cache) for n in indexes]
+
+    if key is None:
+        documents = ((position, obj, None) for position, obj in enumerate(dataset))
+    else:
+        documents = ((key(obj), obj, None) for obj in dataset)
+    return batch_rank(documents, attributes, weights, score, len(queries), limit, threshold,
+                      boosts)
+
+
 def search(
         query, attributes, dataset, limit=-1,
-        threshold=config.THRESHOLD, weights=None):
+        threshold=config.THRESHOLD, weights=None, cache=None):
     """
     Main function of the package, allows to do a fuzzy full-text search on the
     rows of the given `table` model, looking up the value
@@ -88,10 +346,14 @@ def search(
             attributes weights. if not provided **or** if different length
             the weight will generated automatically, considering
             the index of the attribute name, reversed (first -> more weight).
+        cache (:class:`search.cache.SimilarityCache`): cache for the jaro
+            winkler values, shared by all the objects of the dataset so that
+            each pair of words is compared once. A new one is used if not
+            provided.
 
     Returns:
         list: A list containing ``[0:limit]`` resources from the given table,
-        sorted by relevance.
+        sorted by relevance (see :func:`rank`).
 
     Raises:
         AttributeError: if one of the object does not have one of the given
@@ -115,38 +377,59 @@ def search(
 
         Will have the same effect
     """
-    matches = []
-    if not weights or len(weights) != len(attributes):
-        # list of integers of the same length of `attributes` as in [3, 2, 1]
-        # for attributes = ['a', 'b', 'c']
-        weights = list(range(len(attributes), 0, -1))
+    matches = search_matches(query, attributes, dataset, limit, threshold, weights, cache)
+    return [obj for obj, _ in matches]
+
 
-    weights = utils.scale_to_one(weights)
-    weights = {attr: w for attr, w in zip(attributes, weights)}
+def search_matches(
+        query, attributes, dataset, limit=-1,
+        threshold=config.THRESHOLD, weights=None, cache=None, key=None, after=None,
+        boosts=None):
+    """
+    Search the dataset as :func:`search` does, returning the match of each
+    resource too.
+
+    Arguments:
+        key (callable): ``key(object)`` returns the unique number used to
+            sort the objects with the same match, by default the position of
+            the object in the dataset.
+        after (tuple): ``(match, key)`` of the last resource of a previous
+            page, only the resources ranked after it are returned (see
+            :func:`rank`).
+        boosts (sequence): multiplier of the match of each resource, indexed
+            by key, see :func:`rank`
+
+    Returns:
+        list: ``(resource, match)`` tuples sorted by relevance
+    """
+    weights = utils.attribute_weights(attributes, weights)
 
     if not threshold:
         threshold = 0
 
-    for obj in dataset:
-        partial_matches = []
-
-        for attr in attributes:
-            attrval = getattr(obj, attr)
+    if cache is None:
+        cache = SimilarityCache()
 
-            match = similarity(query, attrval)
-            partial_matches.append({'attr': attr, 'match': match})
+    # instrumented only when collecting the stats (see :mod:`search.stats`)
+    counters = stats.current()
+    tokenize = utils.tokenize
+    if counters is not None:
+        cache, tokenize = counters.cache(cache), counters.tokenizer()
 
-        # get the highest match for each attribute and multiply it by the
-        # attribute weight, so we can get the weighted average to return
-        match = max(partial_matches, key=lambda m: m['match'])
-        match = match['match'] * weights[match['attr']]
+    query = tokenize(query.lower())
 
-        if match >= threshold:
-            matches.append({'data': obj, 'match': match})
+    def score(obj, attr):
+        attrval = tokenize(getattr(obj, attr).lower())
+        return token_similarity(query, attrval, cache)
 
-    matches.sort(key=lambda m: m['match'], reverse=True)
+    if key is None:
+        documents = enumerate(dataset)
+    else:
+        documents = ((key(obj), obj) for obj in dataset)
 
-    if limit > 0:
-        matches = matches[:limit]
+    if counters is None:
+        return rank(documents, attributes, weights, score, limit, threshold, after, boosts)
 
-    return [m['data'] for m in matches]
+    with counters.ranking():
+        return rank(counters.visit(documents), attributes, weights,
+                    counters.scorer(score), limit, threshold, after, boosts)
@@ -0,0 +1,63 @@
+"""
+Opaque cursors to page through ranked search results.
+
+Results are sorted by match and then by id, so the match and the id of the
+last result of a page are enough to continue the search right after it:
+:func:`search.core.rank` skips every document ranked at or before that
+position as soon as it is scored, and keeps in its heap only the documents of
+the next page, instead of ranking all the previous pages again.
+
+A cursor also records the catalog version (see
+:any:`BaseModel.catalog_version`) the page was ranked on, since after a change
+of the catalog the same position may not continue the same ranking. The
+version is read from the database, so a cursor created by a process can be
+used with any other one.
+
+Example:
+    >>> from search import cursor
+    >>> token = cursor.encode(0.92, 17, 120)
+    >>> cursor.decode(token)
+    (0.92, 17, 120)
+"""
+import base64
+import binascii
+import json
+
+
+def encode(match, doc_id, version):
+    """
+    Get the cursor of a search position.
+
+    Arguments:
+        match (float): match of the last result of the page
+        doc_id (int): id of the last result of the page
+        version (int): catalog version of the results
+
+    Returns:
+        str: url safe opaque cursor
+    """
+    data = json.dumps([match, doc_id, version], separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def decode(cursor):
+    """
+    Get the search position of a cursor.
+
+    Returns:
+        tuple: ``(match, document id, catalog version)``
+
+    Raises:
+        ValueError: if the cursor is not a valid one
+    """
+    try:
+        match, doc_id, version = json.loads(
+            base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except (binascii.Error, UnicodeError, TypeError, ValueError):
+        raise ValueError('Invalid cursor: {}'.format(cursor))
+
+    if (not isinstance(match, (int, float)) or isinstance(match, bool) or
+            not isinstance(doc_id, int) or
+            not isinstance(version, int) or isinstance(version, bool)):
+        raise ValueError('Invalid cursor: {}'.format(cursor))
+    return float(match), doc_id, version
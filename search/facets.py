@@ -0,0 +1,183 @@
+"""
+Facet filters and counts for the search engine.
+
+Filtering a search by category, price range or availability after the
+scoring wastes the scoring of all the documents that are filtered out. A
+:class:`FacetIndex` keeps the set of document ids for each value of the term
+facets (i.e. ``category``) and the documents sorted by value for the range
+facets (i.e. ``price``), so that the documents passing the filters are known
+before the scoring starts, and the facet counts of the results are just the
+sizes of set intersections.
+
+As for :mod:`search.index`, facet indexes are registered per model class and
+kept up to date by the model signals.
+
+Example:
+    >>> from models import Item
+    >>> from search import facets
+    >>> index = facets.build_facet_index(Item)
+    >>> ids = index.filter(terms={'category': 'scarpe'}, ranges={'price': (10, 50)})
+    >>> index.counts(ids, 'category')
+    {'scarpe': 12}
+"""
+from bisect import bisect_left, bisect_right, insort
+
+#: Registered facet indexes, mapping model classes to their :class:`FacetIndex`
+_FACET_INDEXES = {}
+
+
+class FacetIndex:
+    """
+    Id sets of the values of some attributes of a collection of documents.
+
+    Attributes:
+        terms (dict): term facet attribute -> {value: set of document ids}
+        ranges (dict): range facet attribute -> list of ``(value, document
+            id)`` sorted by value
+        values (dict): document id -> {attribute: value}
+    """
+
+    def __init__(self, terms=(), ranges=()):
+        self.terms = {attr: {} for attr in terms}
+        self.ranges = {attr: [] for attr in ranges}
+        self.values = {}
+
+    def __len__(self):
+        return len(self.values)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.values
+
+    def add(self, doc_id, values):
+        """
+        Add a document to the index, replacing any previous version of it.
+
+        Arguments:
+            doc_id (int): document id
+            values (dict): attribute name -> value, for all the facets
+        """
+        self.remove(doc_id)
+
+        self.values[doc_id] = {attr: values[attr] for attr in self.terms}
+        self.values[doc_id].update((attr, values[attr]) for attr in self.ranges)
+        for attr, ids in self.terms.items():
+            ids.setdefault(values[attr], set()).add(doc_id)
+        for attr, entries in self.ranges.items():
+            insort(entries, (values[attr], doc_id))
+
+    def remove(self, doc_id):
+        """Remove a document from the index, if present."""
+        values = self.values.pop(doc_id, None)
+        if values is None:
+            return
+
+        for attr, ids in self.terms.items():
+            members = ids[values[attr]]
+            members.discard(doc_id)
+            if not members:
+                del ids[values[attr]]
+        for attr, entries in self.ranges.items():
+            del entries[bisect_left(entries, (values[attr], doc_id))]
+
+    def add_object(self, obj):
+        """
+        Add a model instance to the index, using its ``id`` as document id.
+
+        Values are converted by the model fields as when read from the
+        database, since the attributes of a new instance keep the values it
+        was created with (i.e. a price as a string).
+        """
+        fields = obj._meta.fields
+        self.add(obj.id, {
+            attr: fields[attr].python_value(getattr(obj, attr))
+            for attr in list(self.terms) + list(self.ranges)
+        })
+
+    def remove_object(self, obj):
+        """Remove a model instance from the index."""
+        self.remove(obj.id)
+
+    def filter(self, terms=None, ranges=None):
+        """
+        Get the ids of the documents passing all the given filters.
+
+        Arguments:
+            terms (dict): term facet attribute -> value the documents must have
+            ranges (dict): range facet attribute -> ``(minimum, maximum)``
+                values (both included) the documents must have, either can be
+                ``None`` for no limit
+
+        Returns:
+            set: ids of the matching documents, or ``None`` if no filter is
+            given (all the documents match).
+        """
+        selections = []
+        for attr, value in (terms or {}).items():
+            selections.append(self.terms[attr].get(value, set()))
+
+        for attr, (minimum, maximum) in (ranges or {}).items():
+            entries = self.ranges[attr]
+            start = 0 if minimum is None else bisect_left(entries, (minimum,))
+            end = len(entries) if maximum is None else bisect_right(
+                entries, (maximum, float('inf')))
+            selections.append({doc_id for _, doc_id in entries[start:end]})
+
+        if not selections:
+            return None
+
+        selections.sort(key=len)
+        return set(selections[0]).intersection(*selections[1:])
+
+    def counts(self, doc_ids, attr):
+        """
+        Count the documents having each value of a term facet.
+
+        Arguments:
+            doc_ids (iterable): ids of the documents to count
+            attr (str): term facet attribute
+
+        Returns:
+            dict: value -> number of documents, for the values of at least
+            one of the documents
+        """
+        doc_ids = set(doc_ids)
+        counts = {}
+        for value, ids in self.terms[attr].items():
+            count = len(doc_ids & ids)
+            if count:
+                counts[value] = count
+        return counts
+
+
+def build_facet_index(model, terms=None, ranges=None):
+    """
+    Build a new :class:`FacetIndex` for all the rows of the given model and
+    register it, replacing any existing one.
+
+    Arguments:
+        model (:any:`BaseModel`): model class to index
+        terms (list): term facet attributes, defaults to the model
+            ``_facet_terms``
+        ranges (list): range facet attributes, defaults to the model
+            ``_facet_ranges``
+
+    Returns:
+        FacetIndex: the new index
+    """
+    index = FacetIndex(terms or model._facet_terms or (),
+                       ranges or model._facet_ranges or ())
+    for obj in model.select():
+        index.add_object(obj)
+
+    _FACET_INDEXES[model] = index
+    return index
+
+
+def get_facet_index(model):
+    """Return the :class:`FacetIndex` registered for the model, if any."""
+    return _FACET_INDEXES.get(model)
+
+
+def drop_facet_index(model):
+    """Unregister the facet index of the given model, if any."""
+    _FACET_INDEXES.pop(model, None)
@@ -0,0 +1,485 @@
+"""
+In-memory inverted index for the search engine.
+
+The index maps every token of the searchable attributes of a model to the
+documents (rows) containing it, together with the token positions inside the
+attribute value, so that a query can be resolved to a small set of candidate
+documents before any scoring happens in :func:`search.core.search`.
+
+Indexes are registered per model class, and :any:`BaseModel.search` uses the
+one registered for the callee class automatically when it exists.
+
+Example:
+    >>> from models import Item
+    >>> from search import index
+    >>> index.build_index(Item)
+    >>> Item.search('scarpe', Item.select(), limit=10)  # uses the index
+"""
+from search import config, core, facets, parallel, stats, suggest, utils, vectorized
+from search.bktree import BKTree, did_you_mean
+from search.cache import SimilarityCache
+from search.ngrams import NgramIndex
+from search.store import DocumentStore
+
+#: Registered indexes, mapping model classes to their :class:`SearchIndex`
+_INDEXES = {}
+
+#: Tolerance used when comparing jaro winkler values with the lower bound,
+#: so that floating point rounding never excludes a valid candidate.
+_EPSILON = 1e-9
+
+
+class SearchIndex:
+    """
+    Inverted index over a fixed list of attributes.
+
+    Attributes:
+        attributes (list): names of the indexed attributes
+        postings (dict): for each attribute a dict mapping each token to
+            another dict of ``{document id: [positions]}``
+        store (:class:`search.store.DocumentStore`): tokens of each
+            document, used to score the documents and to remove their
+            postings.
+        vocabulary (:class:`search.ngrams.NgramIndex`): n-gram index of the
+            distinct terms of all the attributes.
+        generation (int): incremented on every change of the indexed
+            documents.
+        listeners (list): callables called with the document id after each
+            change of the indexed documents.
+    """
+
+    def __init__(self, attributes):
+        self.attributes = list(attributes)
+        self.postings = {attr: {} for attr in self.attributes}
+        self.store = DocumentStore(self.attributes)
+        self.vocabulary = NgramIndex()
+        self.generation = 0
+        self.listeners = []
+        self._typos = None
+
+    @property
+    def typos(self):
+        """
+        :class:`search.bktree.BKTree` of the distinct terms of all the
+        attributes, built on first use and then kept up to date.
+        """
+        if self._typos is None:
+            self._typos = BKTree(self.vocabulary.terms)
+        return self._typos
+
+    def __len__(self):
+        return len(self.store)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.store
+
+    def _tokenize(self, values):
+        return [utils.tokenize(values[attr].lower()) for attr in self.attributes]
+
+    def _changed(self, doc_id):
+        self.generation += 1
+        for listener in self.listeners:
+            listener(doc_id)
+
+    def add(self, doc_id, values):
+        """
+        Index a document, replacing any previous version of it.
+
+        Arguments:
+            doc_id (int): unique identifier of the document
+            values (dict): attribute name -> attribute value (str) for each
+                of the indexed attributes.
+        """
+        tokens = self._tokenize(values)
+        if doc_id in self.store and self.store.tokens_of(doc_id) == tokens:
+            # nothing to update
+            return
+
+        self.remove(doc_id)
+        self.store.add(doc_id, tokens)
+        for attr, attr_tokens in zip(self.attributes, tokens):
+            postings = self.postings[attr]
+            for position, token in enumerate(attr_tokens):
+                if token not in postings:
+                    postings[token] = {}
+                    if self._typos is not None and token not in self.vocabulary:
+                        self._typos.add(token)
+                    self.vocabulary.add(token)
+                postings[token].setdefault(doc_id, []).append(position)
+        self._changed(doc_id)
+
+    def remove(self, doc_id):
+        """
+        Remove a document and all its postings from the index. Missing
+        documents are ignored.
+        """
+        if doc_id not in self.store:
+            return
+
+        tokens = self.store.tokens_of(doc_id)
+        self.store.remove(doc_id)
+        for attr, attr_tokens in zip(self.attributes, tokens):
+            postings = self.postings[attr]
+            for token in set(attr_tokens):
+                docs = postings[token]
+                del docs[doc_id]
+                if not docs:
+                    del postings[token]
+                    self.vocabulary.remove(token)
+                    if self._typos is not None and token not in self.vocabulary:
+                        self._typos.remove(token)
+        self._changed(doc_id)
+
+    def add_object(self, obj):
+        """Index (or reindex) an object, using its ``id`` as document id."""
+        self.add(obj.id, {attr: getattr(obj, attr) for attr in self.attributes})
+
+    def remove_object(self, obj):
+        """Remove an object from the index."""
+        self.remove(obj.id)
+
+    def candidates(self, query, attributes, weights=None,
+                   threshold=config.THRESHOLD, cache=None):
+        """
+        Get the ids of the documents that could match the query.
+
+        A document is a candidate if at least one of its attributes contains a
+        token that is similar enough to one of the query tokens for the
+        attribute to reach the ``threshold`` (see
+        :func:`search.utils.similarity_lower_bound`).
+
+        Only the terms returned by :meth:`similar_terms` are checked, so when
+        :any:`search.config.NGRAM_SIMILARITY` is ``0`` no document that
+        :func:`search.core.search` would return is left out, otherwise the
+        documents matching only because of the positional coefficient of
+        unrelated words (that share no n-grams with the query) are skipped.
+
+        Arguments:
+            query (str): search query
+            attributes (list): attributes to look into
+            weights (list): attributes weights, as for :func:`search.core.search`
+            threshold (float): matching threshold
+            cache (:class:`search.cache.SimilarityCache`): cache for the jaro
+                winkler values, that can be shared with the scoring of the
+                candidates.
+
+        Returns:
+            set: candidate documents ids, or ``None`` if the index cannot
+            restrict the search (some attributes are not indexed or every
+            document may match).
+        """
+        if any(attr not in self.attributes for attr in attributes):
+            return None
+
+        weights = utils.attribute_weights(attributes, weights)
+        threshold = threshold or 0
+
+        bounds = {}
+        for attr in attributes:
+            bound = utils.similarity_lower_bound(threshold, weights[attr])
+            if bound <= 0:
+                # even documents with no tokens at all can match
+                return None
+            bounds[attr] = bound - _EPSILON
+
+        query_tokens = utils.tokenize(query.lower())
+        if not query_tokens:
+            return set()
+
+        if cache is None:
+            cache = SimilarityCache()
+
+        # best jaro winkler value against the query tokens for each term
+        # of the vocabulary that may be similar enough to one of them.
+        best_matches = {
+            term: max(cache(term, q) for q in query_tokens)
+            for term in self.similar_terms(query_tokens)
+        }
+
+        candidates = set()
+        for attr in attributes:
+            if bounds[attr] > 1:
+                continue
+
+            for term, match in best_matches.items():
+                if match >= bounds[attr]:
+                    candidates.update(self.term_documents(attr, term))
+
+        return candidates
+
+    def documents(self):
+        """Get the ids of all the indexed documents."""
+        return self.store.slots.keys()
+
+    def term_documents(self, attr, term):
+        """Get the ids of the documents whose attribute contains the term."""
+        return self.postings[attr].get(term, ())
+
+    def search(self, query, attributes, weights=None,
+               threshold=config.THRESHOLD, limit=-1, cache=None, doc_ids=None,
+               after=None, boosts=None):
+        """
+        Rank the indexed documents against the query, as
+        :func:`search.core.search` does, scoring the :meth:`candidates` with
+        the tokens kept in the document store.
+
+        Arguments:
+            query (str): search query
+            attributes (list): attributes to look into
+            weights (list): attributes weights, as for :func:`search.core.search`
+            threshold (float): matching threshold
+            limit (int): maximum number of documents to return, ``-1`` for all
+            cache (:class:`search.cache.SimilarityCache`): cache for the jaro
+                winkler values.
+            doc_ids (set): ids of the only documents that can be returned
+                (i.e. the ones passing some filters), ``None`` for all.
+            after (tuple): ``(match, document id)`` of the last document of a
+                previous page, only the documents ranked after it are
+                returned (see :mod:`search.cursor`).
+            boosts (sequence): multiplier of the match of each document,
+                indexed by id (see :mod:`search.popularity`).
+
+        Returns:
+            list: ``(document id, match)`` tuples of the best matching
+            documents, sorted by relevance (and by id if the match is the
+            same), or ``None`` if some of the attributes are not indexed.
+        """
+        if any(attr not in self.attributes for attr in attributes):
+            return None
+
+        if cache is None:
+            cache = SimilarityCache()
+
+        counters = stats.current()
+        if counters is not None:
+            cache = counters.cache(cache)
+
+        candidates = self.candidates(query, attributes, weights, threshold, cache)
+        if candidates is None:
+            candidates = self.documents()
+        if doc_ids is not None:
+            candidates = candidates & doc_ids
+
+        if counters is None:
+            return self._rank(query, candidates, attributes, weights, threshold, limit,
+                              cache, after, boosts)
+
+        counters.documents += len(candidates)
+        with counters.ranking():
+            return self._rank(query, candidates, attributes, weights, threshold, limit,
+                              cache, after, boosts, counters)
+
+    def _rank(self, query, candidates, attributes, weights, threshold, limit, cache,
+              after, boosts, counters=None):
+        """Rank the candidates of :meth:`search` with the configured engine."""
+        query_tokens = utils.tokenize(query.lower())
+        weights = utils.attribute_weights(attributes, weights)
+
+        if config.ENGINE == 'numpy':
+            return vectorized.search(self, candidates, query_tokens, attributes,
+                                     weights, limit, threshold or 0, cache, after, boosts)
+
+        if (config.PARALLEL_WORKERS and len(candidates) >= config.PARALLEL_MIN_DOCUMENTS and
+                parallel.available()):
+            return parallel.search(self, candidates, query_tokens, attributes,
+                                   weights, limit, threshold or 0, after, boosts)
+
+        documents = ((doc_id, doc_id) for doc_id in candidates)
+        score = self.scorer(query_tokens, cache)
+        if counters is not None:
+            score = counters.scorer(score)
+
+        return core.rank(documents, attributes, weights, score, limit, threshold or 0, after,
+                         boosts)
+
+    def batch_search(self, queries, attributes, weights=None,
+                     threshold=config.THRESHOLD, limit=-1, cache=None, doc_ids=None,
+                     boosts=None):
+        """
+        Rank the indexed documents against many queries at once, with the
+        same results of :meth:`search` for each of them.
+
+        The candidates of all the queries are scored in a single pass, each
+        one for the queries it is a candidate of, reading its tokens once,
+        and the jaro winkler values of each term against the distinct tokens
+        of all the queries are computed once and shared by all the
+        documents and the queries.
+
+        Arguments:
+            queries (list): search queries (str)
+            attributes (list): attributes to look into
+            weights (list): attributes weights, as for :func:`search.core.search`
+            threshold (float): matching threshold
+            limit (int): maximum number of documents to return for each
+                query, ``-1`` for all
+            cache (:class:`search.cache.SimilarityCache`): cache for the jaro
+                winkler values.
+            doc_ids (set): ids of the only documents that can be returned,
+                ``None`` for all.
+            boosts (sequence): multiplier of the match of each document,
+                indexed by id, as for :meth:`search`
+
+        Returns:
+            list: for each query, the ``(document id, match)`` tuples of its
+            best matching documents sorted by relevance, or ``None`` if some
+            of the attributes are not indexed.
+        """
+        if any(attr not in self.attributes for attr in attributes):
+            return None
+
+        if cache is None:
+            cache = SimilarityCache()
+
+        # indexes of the queries each document is a candidate of
+        members = {}
+        for n, query in enumerate(queries):
+            candidates = self.candidates(query, attributes, weights, threshold, cache)
+            if candidates is None:
+                candidates = self.documents()
+            if doc_ids is not None:
+                candidates = candidates & doc_ids
+            for doc_id in candidates:
+                members.setdefault(doc_id, []).append(n)
+
+        query_tokens = [utils.tokenize(query.lower()) for query in queries]
+        distinct = sorted({token for tokens in query_tokens for token in tokens})
+        store, terms = self.store, self.store.terms
+        # jaro winkler values against all the query tokens for each term id
+        rows = {}
+
+        def score(doc_id, attr, indexes):
+            term_ids = store.term_ids_of(doc_id, attr)
+            matrix = []
+            for term_id in term_ids:
+                row = rows.get(term_id)
+                if row is None:
+                    term = terms[term_id]
+                    row = rows[term_id] = {q: cache(term, q) for q in distinct}
+                matrix.append(row)
+
+            matches = []
+            for n in indexes:
+                tokens = query_tokens[n]
+                if not tokens or not matrix:
+                    matches.append(0)
+                else:
+                    matches.append(core.matrix_similarity(
+                        [[row[q] for q in tokens] for row in matrix]))
+            return matches
+
+        documents = ((doc_id, doc_id, indexes) for doc_id, indexes in members.items())
+        weights = utils.attribute_weights(attributes, weights)
+        return core.batch_rank(documents, attributes, weights, score, len(queries),
+                               limit, threshold or 0, boosts)
+
+    def scorer(self, query_tokens, cache):
+        """
+        Get a function that scores an attribute of a stored document against
+        the query tokens, to be used with :func:`search.core.rank`.
+
+        The jaro winkler values of each term against the query tokens are
+        computed once and shared by all the documents containing the term.
+
+        Arguments:
+            query_tokens (list): tokens of the query
+            cache (:class:`search.cache.SimilarityCache`): cache for the jaro
+                winkler values.
+
+        Returns:
+            callable: ``score(document id, attribute)``
+        """
+        store, terms = self.store, self.store.terms
+        # jaro winkler values against the query tokens for each term id
+        rows = {}
+
+        def score(doc_id, attr):
+            term_ids = store.term_ids_of(doc_id, attr)
+            if not query_tokens or not term_ids:
+                return 0
+
+            matrix = []
+            for term_id in term_ids:
+                row = rows.get(term_id)
+                if row is None:
+                    term = terms[term_id]
+                    row = rows[term_id] = [cache(term, q) for q in query_tokens]
+                matrix.append(row)
+            return core.matrix_similarity(matrix)
+
+        return score
+
+    def similar_terms(self, tokens):
+        """
+        Get the terms of the vocabulary that share enough n-grams with at
+        least one of the given tokens (see :mod:`search.ngrams`), or that are
+        within :any:`search.config.TYPO_MAX_DISTANCE` edits from it when
+        :any:`search.config.SIMILAR_TERMS` is ``'bktree'`` (see
+        :mod:`search.bktree`).
+
+        If :any:`search.config.NGRAM_SIMILARITY` is ``0`` all the vocabulary
+        is returned.
+        """
+        if not config.NGRAM_SIMILARITY:
+            return self.vocabulary.terms.keys()
+
+        terms = set()
+        for token in tokens:
+            if config.SIMILAR_TERMS == 'bktree':
+                terms.update(self.typos.find(token, config.TYPO_MAX_DISTANCE))
+            else:
+                terms.update(self.vocabulary.lookup(token))
+        return terms
+
+    def did_you_mean(self, query):
+        """
+        Get the query with its tokens missing from the vocabulary replaced by
+        the closest terms, ``None`` if there is nothing to correct (see
+        :func:`search.bktree.did_you_mean`).
+        """
+        def frequency(term):
+            return sum(len(self.term_documents(attr, term)) for attr in self.attributes)
+
+        return did_you_mean(query, self.typos, frequency)
+
+
+def build_index(model, attributes=None):
+    """
+    Build a new :class:`SearchIndex` for all the rows of the given model and
+    register it, replacing any existing one.
+
+    Arguments:
+        model (:any:`BaseModel`): model class to index
+        attributes (list): attributes to index, defaults to the model
+            ``_search_attributes``
+
+    Returns:
+        SearchIndex: the new index
+    """
+    index = SearchIndex(attributes or model._search_attributes)
+    for obj in model.select():
+        index.add_object(obj)
+
+    _INDEXES[model] = index
+    return index
+
+
+def get_index(model):
+    """Return the :class:`SearchIndex` registered for the model, if any."""
+    return _INDEXES.get(model)
+
+
+def drop_index(model):
+    """Unregister the index of the given model, if any."""
+    _INDEXES.pop(model, None)
+
+
+def get_indexes(model):
+    """
+    Return all the indexes registered for the model: its :class:`SearchIndex`,
+    its :class:`search.suggest.PrefixIndex` and its
+    :class:`search.facets.FacetIndex`, if any, that are kept up to date
+    together by the model signals.
+    """
+    indexes = (get_index(model), suggest.get_prefix_index(model),
+               facets.get_facet_index(model))
+    return [index for index in indexes if index is not None]
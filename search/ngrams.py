@@ -0,0 +1,107 @@
+"""
+Character n-gram index over the vocabulary of a :class:`search.index.SearchIndex`.
+
+Comparing a query token with every term of the vocabulary through the jaro
+winkler algorithm gets slower as the vocabulary grows. The n-gram index allows
+to get only the terms that share enough n-grams with the query token (so that
+`scarpa` finds `scarpe`), and to score only those.
+
+Similarity between two words is computed as in the PostgreSQL ``pg_trgm``
+extension, as the number of shared n-grams divided by the number of distinct
+n-grams of both words.
+"""
+from search import config
+
+
+def ngrams(word, size=None):
+    """
+    Get the set of character n-grams of a word, padded with spaces so that the
+    beginning and the end of the word generate their own n-grams.
+
+    Example:
+        >>> ngrams('sedia')
+        {'  s', ' se', 'sed', 'edi', 'dia', 'ia '}
+    """
+    size = size or config.NGRAM_SIZE
+    padded = '{}{} '.format(' ' * (size - 1), word)
+    return {padded[i:i + size] for i in range(len(padded) - size + 1)}
+
+
+class NgramIndex:
+    """
+    Index of the n-grams of a set of terms.
+
+    Terms are reference counted, so that the same term can be added by more
+    than one source (i.e. more attributes of an index) and is removed only
+    when the last one removes it.
+
+    Attributes:
+        grams (dict): n-gram -> set of terms containing it
+        terms (dict): term -> (number of n-grams, references)
+    """
+
+    def __init__(self, size=None):
+        self.size = size or config.NGRAM_SIZE
+        self.grams = {}
+        self.terms = {}
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __contains__(self, term):
+        return term in self.terms
+
+    def add(self, term):
+        """Add a reference to a term, indexing its n-grams if new."""
+        if term in self.terms:
+            count, refs = self.terms[term]
+            self.terms[term] = (count, refs + 1)
+            return
+
+        grams = ngrams(term, self.size)
+        for gram in grams:
+            self.grams.setdefault(gram, set()).add(term)
+        self.terms[term] = (len(grams), 1)
+
+    def remove(self, term):
+        """Remove a reference to a term, removing its n-grams if it was the last."""
+        count, refs = self.terms[term]
+        if refs > 1:
+            self.terms[term] = (count, refs - 1)
+            return
+
+        del self.terms[term]
+        for gram in ngrams(term, self.size):
+            terms = self.grams[gram]
+            terms.discard(term)
+            if not terms:
+                del self.grams[gram]
+
+    def lookup(self, word, min_similarity=None):
+        """
+        Get the terms similar to ``word``.
+
+        Arguments:
+            word (str): word to look up (it does not have to be in the index)
+            min_similarity (float): minimum n-gram similarity, between 0 and
+                1, for a term to be returned. Defaults to
+                :any:`search.config.NGRAM_SIMILARITY`.
+
+        Returns:
+            dict: similar term -> n-gram similarity with ``word``
+        """
+        if min_similarity is None:
+            min_similarity = config.NGRAM_SIMILARITY
+
+        grams = ngrams(word, self.size)
+        shared = {}
+        for gram in grams:
+            for term in self.grams.get(gram, ()):
+                shared[term] = shared.get(term, 0) + 1
+
+        matches = {}
+        for term, count in shared.items():
+            similarity = count / (len(grams) + self.terms[term][0] - count)
+            if similarity >= min_similarity:
+                matches[term] = similarity
+        return matches
@@ -0,0 +1,152 @@
+"""
+Parallel scoring of the search index documents.
+
+Scoring is pure python and CPU bound, so a single search on a big catalog
+keeps one core busy while the others wait. When
+:any:`search.config.PARALLEL_WORKERS` is set, the candidates of a search
+through a :class:`search.index.SearchIndex` that has at least
+:any:`search.config.PARALLEL_MIN_DOCUMENTS` of them are split in shards scored
+concurrently by a pool of processes, and the top-k of each shard are merged.
+
+The pool survives across searches. Its processes are forked from the current
+one, so they get a copy of the index as it was when the pool was started
+without any serialization (with any other multiprocessing start method, see
+:func:`available`, the candidates are scored serially). The documents changed
+afterwards (see :attr:`search.index.SearchIndex.listeners`) are sent with the
+shards that contain them, and stored by the processes before scoring, so
+results are always the same of the serial path. The pool is replaced only
+when a different index is searched, or once more than
+:any:`search.config.PARALLEL_MAX_CHANGES` documents changed since the fork.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from search import config, core
+from search.cache import SimilarityCache
+
+#: Current process pool
+_pool = None
+#: Index inherited by the pool processes, set before forking them
+_forked_index = None
+#: ids of the documents of `_forked_index` changed since the pool was forked
+_changed = set()
+
+
+def available():
+    """
+    Whether the pool processes are forked, inheriting the index of the
+    current process.
+    """
+    return multiprocessing.get_start_method() == 'fork'
+
+
+def _record_change(doc_id):
+    _changed.add(doc_id)
+
+
+def get_pool(index):
+    """
+    Get a process pool whose processes have a copy of ``index``, starting a
+    new one if needed.
+    """
+    global _pool, _forked_index
+
+    if (_pool is not None and _forked_index is index and
+            len(_changed) <= config.PARALLEL_MAX_CHANGES):
+        return _pool
+
+    shutdown()
+    _forked_index = index
+    _pool = ProcessPoolExecutor(max_workers=config.PARALLEL_WORKERS)
+    # processes are forked on the first submit, so make sure it happens now,
+    # while `_forked_index` is the index the pool is started for.
+    _pool.submit(int).result()
+    index.listeners.append(_record_change)
+    return _pool
+
+
+def shutdown():
+    """Stop the current process pool, if any."""
+    global _pool, _forked_index
+
+    if _pool is not None:
+        _pool.shutdown(wait=True)
+        _forked_index.listeners.remove(_record_change)
+    _pool = _forked_index = None
+    _changed.clear()
+
+
+def _search_shard(doc_ids, changes, query_tokens, attributes, weights, limit, threshold,
+                  after, boosts):
+    """
+    Rank a shard of documents of the inherited index (in the pool processes),
+    storing first the current tokens of its documents changed since the fork.
+    """
+    store = _forked_index.store
+    for doc_id, tokens in changes.items():
+        if doc_id not in store or store.tokens_of(doc_id) != tokens:
+            store.add(doc_id, tokens)
+
+    score = _forked_index.scorer(query_tokens, SimilarityCache())
+    documents = ((doc_id, doc_id) for doc_id in doc_ids)
+    return core.rank(documents, attributes, weights, score, limit, threshold, after, boosts)
+
+
+def _shard_changes(index, doc_ids):
+    """
+    Get the tokens of the documents of a shard changed since the pool was
+    forked, mapping each document id to its tokens, to send them to the
+    process of the shard.
+    """
+    return {doc_id: index.store.tokens_of(doc_id) for doc_id in doc_ids
+            if doc_id in _changed and doc_id in index.store}
+
+
+def _shard_boosts(doc_ids, boosts):
+    """
+    Get the boosts of the documents of a shard only, mapping each document
+    id to its multiplier, to send them to the process of the shard.
+    """
+    if boosts is None:
+        return None
+    return {doc_id: boosts[doc_id] if doc_id < len(boosts) else 1 for doc_id in doc_ids}
+
+
+def search(index, doc_ids, query_tokens, attributes, weights, limit=-1, threshold=0,
+           after=None, boosts=None):
+    """
+    Rank the given documents of the index as :meth:`SearchIndex.search` does,
+    splitting them between the processes of the pool.
+
+    Arguments:
+        index (:class:`search.index.SearchIndex`): index of the documents
+        doc_ids (iterable): ids of the documents to rank
+        query_tokens (list): tokens of the query
+        attributes (list): attributes to look into
+        weights (dict): attribute -> weight, as returned by
+            :func:`search.utils.attribute_weights`
+        limit (int): maximum number of documents to return, ``-1`` for all
+        threshold (float): matching threshold
+        after (tuple): ``(match, document id)`` of the last document of a
+            previous page, see :func:`search.core.rank`
+        boosts (sequence): multiplier of the match of each document, indexed
+            by id, see :func:`search.core.rank`
+
+    Returns:
+        list: ``(document id, match)`` tuples sorted by relevance
+    """
+    pool = get_pool(index)
+
+    doc_ids = list(doc_ids)
+    shards = config.PARALLEL_WORKERS
+    futures = [
+        pool.submit(_search_shard, doc_ids[i::shards],
+                    _shard_changes(index, doc_ids[i::shards]), query_tokens,
+                    attributes, weights, limit, threshold, after,
+                    _shard_boosts(doc_ids[i::shards], boosts))
+        for i in range(shards)
+    ]
+
+    matches = [match for future in futures for match in future.result()]
+    matches.sort(key=lambda m: (-m[1], m[0]))
+    return matches[:limit] if limit > 0 else matches
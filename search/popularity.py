@@ -0,0 +1,251 @@
+"""
+Popularity of the documents, to rank higher the items that sell.
+
+Aggregating the orders of each candidate at query time would cost a database
+query per search, so a :class:`PopularityTable` keeps for each document id
+the units sold, the units sold in the last
+:any:`search.config.POPULARITY_WINDOW_DAYS` days and the number of favorites,
+updated only for the documents whose orders and favorites change, together with the
+ranking multiplier of each document in a flat array indexed by id: blending
+the popularity into the match of a candidate is a single array lookup (see
+:func:`search.core.rank`).
+
+Every process keeps its own table, but the counters come from the database:
+the orders and favorites only record which items changed in the catalog
+change log, and before each search every process counts again from the
+database the items changed since the version of its table (see
+:meth:`models.Item.sync_popularity`), so all of them rank alike.
+
+The popularity of a document is ``raw / (raw + POPULARITY_SCALE)``, where
+``raw`` is the weighted sum of its counters, so it goes from ``0`` (never
+sold nor favorite) towards ``1``, and its match is multiplied by
+``1 + POPULARITY_WEIGHT * popularity``. The threshold still applies to the
+match of the text alone, so the popularity only reorders the results.
+
+As the other indexes, tables are registered per model class.
+
+Example:
+    >>> from models import Item
+    >>> table = Item.build_popularity()
+    >>> table.add_sale(42, 3, time.time())
+    >>> table.popularity(42)  # 3 units sold, 3 of them recently
+    0.3103448275862069
+"""
+from array import array
+import heapq
+import time
+
+from search import config
+
+#: Registered tables, mapping model classes to their :class:`PopularityTable`
+_TABLES = {}
+
+_DAY = 24 * 60 * 60
+
+
+def window_start(now=None):
+    """Get the timestamp of the start of the recent window of sales."""
+    return (time.time() if now is None else now) - config.POPULARITY_WINDOW_DAYS * _DAY
+
+
+class PopularityTable:
+    """
+    Popularity counters of a collection of documents, indexed by id.
+
+    Attributes:
+        units (array): units sold of each document
+        recent (array): units sold in the recent window
+        favorites (array): number of favorites of each document
+        factors (array): match multiplier of each document, for the current
+            :any:`search.config.POPULARITY_WEIGHT`
+        window (list): heap of the ``(timestamp, document id, quantity,
+            epoch)`` sales still in the recent window, the ones of a
+            previous epoch of their document are ignored
+        epochs (array): number of times the counters of each document were
+            reset
+        queued (array): sales of the current epoch of each document in the
+            window heap
+        stale (int): sales of the previous epochs in the window heap
+        version (int): version of the counters in the catalog change log,
+            ``0`` if unknown
+    """
+
+    def __init__(self, version=0):
+        self.units = array('q')
+        self.recent = array('q')
+        self.favorites = array('q')
+        self.factors = array('d')
+        self.epochs = array('q')
+        self.queued = array('q')
+        self.window = []
+        self.stale = 0
+        self.weight = config.POPULARITY_WEIGHT
+        self.version = version
+
+    def __len__(self):
+        return len(self.units)
+
+    def _grow(self, doc_id):
+        missing = doc_id + 1 - len(self.units)
+        if missing > 0:
+            for counters in (self.units, self.recent, self.favorites, self.epochs,
+                             self.queued):
+                counters.extend([0] * missing)
+            self.factors.extend([1.0] * missing)
+
+    def popularity(self, doc_id):
+        """Get the popularity of a document, from ``0`` to ``1``."""
+        if doc_id >= len(self.units):
+            return 0.0
+        raw = (self.units[doc_id] +
+               config.POPULARITY_RECENT_WEIGHT * self.recent[doc_id] +
+               config.POPULARITY_FAVORITE_WEIGHT * self.favorites[doc_id])
+        return raw / (raw + config.POPULARITY_SCALE) if raw > 0 else 0.0
+
+    def _update(self, doc_id):
+        self.factors[doc_id] = 1 + self.weight * self.popularity(doc_id)
+
+    def _queue(self, doc_id, quantity, timestamp):
+        heapq.heappush(self.window, (timestamp, doc_id, quantity, self.epochs[doc_id]))
+        self.queued[doc_id] += 1
+
+    def add_sale(self, doc_id, quantity, timestamp):
+        """
+        Count the units of a document sold (or returned, if negative) by an
+        order placed at ``timestamp``.
+        """
+        self._grow(doc_id)
+        self.units[doc_id] += quantity
+        if timestamp >= window_start():
+            self.recent[doc_id] += quantity
+            self._queue(doc_id, quantity, timestamp)
+        self._update(doc_id)
+
+    def add_favorite(self, doc_id, count=1):
+        """Count the users adding (or removing, if negative) a favorite document."""
+        self._grow(doc_id)
+        self.favorites[doc_id] += count
+        self._update(doc_id)
+
+    def reset(self, doc_id, units, sales, favorites):
+        """
+        Replace the counters of a document, i.e. counted again from the
+        database.
+
+        Arguments:
+            doc_id (int): document id
+            units (int): units sold by all the orders
+            sales (iterable): ``(quantity, timestamp)`` of the units sold by
+                each order of the recent window
+            favorites (int): number of favorites
+        """
+        self._grow(doc_id)
+        self.epochs[doc_id] += 1
+        self.stale += self.queued[doc_id]
+        self.queued[doc_id] = 0
+        self.units[doc_id] = units
+        self.recent[doc_id] = 0
+        self.favorites[doc_id] = favorites
+        start = window_start()
+        for quantity, timestamp in sales:
+            if timestamp >= start:
+                self.recent[doc_id] += quantity
+                self._queue(doc_id, quantity, timestamp)
+        self._update(doc_id)
+
+        # drop the sales of the previous epochs once they are most of the heap
+        if self.stale * 2 > len(self.window):
+            self.window = [entry for entry in self.window if entry[3] == self.epochs[entry[1]]]
+            heapq.heapify(self.window)
+            self.stale = 0
+
+    def expire(self, now=None):
+        """
+        Move out of the recent window the sales older than it.
+
+        Returns:
+            bool: whether any sale was moved out, changing the popularity
+        """
+        start = window_start(now)
+        expired = False
+        while self.window and self.window[0][0] < start:
+            _, doc_id, quantity, epoch = heapq.heappop(self.window)
+            if epoch != self.epochs[doc_id]:
+                self.stale -= 1
+                continue
+            self.queued[doc_id] -= 1
+            self.recent[doc_id] -= quantity
+            self._update(doc_id)
+            expired = True
+        return expired
+
+    def boosts(self):
+        """
+        Get the match multipliers indexed by document id, once the old sales
+        are expired, ``None`` if the popularity is not used.
+        """
+        if self.weight != config.POPULARITY_WEIGHT:
+            self.weight = config.POPULARITY_WEIGHT
+            for doc_id in range(len(self.factors)):
+                self._update(doc_id)
+        if not self.weight:
+            return None
+
+        self.expire()
+        return self.factors
+
+
+def build_table(model, sales=(), favorites=(), version=0):
+    """
+    Build a new :class:`PopularityTable` and register it for the model,
+    replacing any existing one.
+
+    Arguments:
+        model (:any:`BaseModel`): model class of the documents
+        sales (iterable): ``(document id, quantity, timestamp)`` of the units
+            sold by each order
+        favorites (iterable): ``(document id, count)`` of the favorites
+        version (int): version of the counters in the catalog change log
+
+    Returns:
+        PopularityTable: the new table
+    """
+    table = PopularityTable(version)
+    for doc_id, quantity, timestamp in sales:
+        table.add_sale(doc_id, quantity, timestamp)
+    for doc_id, count in favorites:
+        table.add_favorite(doc_id, count)
+
+    _TABLES[model] = table
+    return table
+
+
+def get_table(model):
+    """Return the :class:`PopularityTable` registered for the model, if any."""
+    return _TABLES.get(model)
+
+
+def drop_table(model):
+    """Unregister the popularity table of the given model, if any."""
+    _TABLES.pop(model, None)
+
+
+def expire(model):
+    """
+    Move out of the recent window the old sales of the documents of the
+    model, if it has a table.
+
+    Returns:
+        bool: whether the popularity of any document changed
+    """
+    table = _TABLES.get(model)
+    return table.expire() if table is not None else False
+
+
+def boosts(model):
+    """
+    Get the match multipliers of the documents of the model, indexed by id,
+    ``None`` if the model has no table or the popularity is not used.
+    """
+    table = _TABLES.get(model)
+    return table.boosts() if table is not None else None
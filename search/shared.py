@@ -0,0 +1,246 @@
+"""
+Search index shared by all the processes of the application.
+
+Every gunicorn worker would otherwise build (or map, see :mod:`search.snapshot`)
+its own index at its first request. Here the index of a model is published
+once, by the gunicorn master before it forks the workers (see
+``gunicorn_config.py``), as a snapshot of flat arrays in a shared directory
+(``/dev/shm`` keeps it in memory), and every worker maps it read-only: all of
+them read the same pages, nothing is copied.
+
+Next to the snapshots lives a generation file, an 8 bytes counter mapped in
+memory by every process. Publishing a new index writes the snapshot of the
+next generation and then increments the counter, so a worker notices it on
+its next request by reading a number from memory (:func:`refresh`), without
+any system call, and maps the new snapshot, replaying the changes of its
+overlay made after the snapshot was written.
+
+The items changed meanwhile are not published one by one: every worker
+applies the changes of all the others to its overlay from the change log of
+the catalog (see :meth:`models.BaseModel.sync_search`). A new generation is
+published:
+
+* by the gunicorn master, when the application starts
+* by a worker whose overlay grew past :any:`search.config.SNAPSHOT_MAX_CHANGES`
+  documents, in background, unless another worker published a newer
+  generation meanwhile
+* by ``scripts/build_search_index.py --shared``, i.e. after bulk changes
+
+Publishers take an exclusive lock on the generation file, so concurrent
+publications never write the same generation. The snapshots of the
+generations before the previous one are deleted: processes still mapping them
+keep reading their pages until they move to the new one.
+
+Example:
+    >>> from models import Item
+    >>> from search import shared
+    >>> shared.publish(Item, '/dev/shm/app')  # gunicorn master
+    1
+    >>> shared.refresh(Item, '/dev/shm/app')  # workers, on every request
+    <search.snapshot.SnapshotIndex object at 0x7f...>
+"""
+import fcntl
+import mmap
+import os
+import struct
+import threading
+
+from search import config
+from search.index import get_index
+from search.snapshot import build_snapshot, load_snapshot
+
+#: Generation number, at the start of the generation file
+_GENERATION = struct.Struct('<Q')
+
+#: Attached models, mapping model classes to their :class:`Generation`, the
+#: number of the generation of their registered index and the index
+_ATTACHED = {}
+
+#: Background publications, mapping model classes to their thread
+_PENDING = {}
+_PENDING_LOCK = threading.Lock()
+
+
+def generation_path(directory, model):
+    """Get the path of the generation file of a model."""
+    return os.path.join(directory, '{}.generation'.format(model.__name__.lower()))
+
+
+def snapshot_path(directory, model, generation):
+    """Get the path of the snapshot of a generation of the index of a model."""
+    return os.path.join(directory, '{}.{}.idx'.format(model.__name__.lower(), generation))
+
+
+class Generation:
+    """
+    Generation counter of the shared index of a model, mapped in memory.
+
+    The file is created (with generation ``0``, nothing published) if it
+    does not exist.
+
+    Attributes:
+        path (str): generation file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < _GENERATION.size:
+                os.ftruncate(fd, _GENERATION.size)
+            self.mapped = mmap.mmap(fd, _GENERATION.size)
+        finally:
+            os.close(fd)
+
+    @property
+    def value(self):
+        """Number of the last published generation, ``0`` if none."""
+        return _GENERATION.unpack_from(self.mapped)[0]
+
+    @value.setter
+    def value(self, value):
+        _GENERATION.pack_into(self.mapped, 0, value)
+
+    def lock(self):
+        """
+        Get an exclusive lock on the generation file, to be used as context
+        manager, released when the returned file is closed.
+        """
+        fo = open(self.path, 'rb')
+        fcntl.flock(fo.fileno(), fcntl.LOCK_EX)
+        return fo
+
+
+def _generation(directory, model):
+    attached = _ATTACHED.get(model)
+    if attached is not None and attached[0].path == generation_path(directory, model):
+        return attached[0]
+    os.makedirs(directory, exist_ok=True)
+    return Generation(generation_path(directory, model))
+
+
+def _publish(generation, model, directory, attributes=None):
+    """Publish the next generation, holding the lock of the generation file."""
+    number = generation.value + 1
+    build_snapshot(model, snapshot_path(directory, model, number), attributes)
+    generation.value = number
+
+    # keep the previous one for the processes just about to map it
+    prefix = '{}.'.format(model.__name__.lower())
+    for name in os.listdir(directory):
+        if not (name.startswith(prefix) and name.endswith('.idx')):
+            continue
+        old = name[len(prefix):-len('.idx')]
+        if old.isdigit() and int(old) < number - 1:
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+    return number
+
+
+def publish(model, directory, attributes=None):
+    """
+    Build the index of the model and publish it as the next generation of
+    its shared index.
+
+    Arguments:
+        model (:any:`BaseModel`): model class to index
+        directory (str): directory of the shared index, created if missing
+        attributes (list): attributes to index, defaults to the model
+            ``_search_attributes``
+
+    Returns:
+        int: the published generation
+    """
+    generation = _generation(directory, model)
+    with generation.lock():
+        return _publish(generation, model, directory, attributes)
+
+
+def republish(model, directory):
+    """
+    Publish in background the generation next to the attached one, unless
+    this process is already publishing one. Nothing is published if another
+    process published it meanwhile: all the workers reach the threshold of
+    their overlays together, but only the first one rebuilds the index.
+
+    Returns:
+        threading.Thread: the thread of the publication
+    """
+    generation, number, _ = _ATTACHED[model]
+
+    def run():
+        with model._meta.database.execution_context():
+            with generation.lock():
+                if generation.value == number:
+                    _publish(generation, model, directory)
+
+    with _PENDING_LOCK:
+        thread = _PENDING.get(model)
+        if thread is None or not thread.is_alive():
+            thread = _PENDING[model] = threading.Thread(
+                target=run, daemon=True, name='publish-{}'.format(model.__name__))
+            thread.start()
+        return thread
+
+
+def attach(model, directory):
+    """
+    Map the last published generation of the shared index of the model and
+    register it as its index, publishing the first generation if none was.
+
+    Returns:
+        SnapshotIndex: the registered index
+    """
+    generation = _generation(directory, model)
+    if not generation.value:
+        with generation.lock():
+            # another process may have published it meanwhile
+            if not generation.value:
+                _publish(generation, model, directory)
+
+    while True:
+        number = generation.value
+        try:
+            index = load_snapshot(model, snapshot_path(directory, model, number))
+        except FileNotFoundError:
+            if generation.value == number:
+                raise
+            # replaced by two newer generations meanwhile
+            continue
+        _ATTACHED[model] = (generation, number, index)
+        return index
+
+
+def refresh(model, directory):
+    """
+    Make sure the index of the model maps the last published generation of
+    its shared index, attaching it the first time, and publish the next one
+    once its overlay grows past :any:`search.config.SNAPSHOT_MAX_CHANGES`
+    documents.
+
+    Returns:
+        SnapshotIndex: the registered index
+    """
+    attached = _ATTACHED.get(model)
+    index = get_index(model)
+    if (attached is None or index is not attached[2] or
+            attached[0].path != generation_path(directory, model) or
+            attached[0].value != attached[1]):
+        index = attach(model, directory)
+    if len(index.changes) > config.SNAPSHOT_MAX_CHANGES:
+        republish(model, directory)
+    return index
+
+
+def detach(model):
+    """
+    Stop following the shared index of the model. A publication running in
+    background is completed.
+    """
+    with _PENDING_LOCK:
+        _PENDING.pop(model, None)
+    attached = _ATTACHED.pop(model, None)
+    if attached is not None:
+        attached[0].mapped.close()
@@ -0,0 +1,646 @@
+"""
+Persistent memory mapped snapshots of the search index.
+
+Building a :class:`search.index.SearchIndex` reads and tokenizes all the rows
+of a model, and every process of the application (i.e. every gunicorn
+worker) builds and keeps its own copy. A snapshot is the index written to a
+file as a handful of flat arrays, that a :class:`SnapshotIndex` maps in memory
+read-only: loading it takes no time at all, and all the processes mapping the
+same file share the same pages of the OS page cache.
+
+The file holds, after a fixed preamble (magic, format version and header
+length) and a JSON header describing the sections:
+
+* the vocabulary: the sorted terms, as utf-8 bytes plus their offsets, so that
+  a term id is the position of the term and a term is found by bisection
+* the document ids, sorted, so that the slot of a document is found by
+  bisection, and for each attribute the term ids of all the documents with
+  the offsets where each document starts (as in the
+  :class:`search.store.DocumentStore`, the position of a token is its index
+  inside the attribute tokens)
+* for each attribute the postings, as the sorted document ids containing each
+  term plus the offsets where the documents of each term start
+* the n-gram tables of :class:`search.ngrams.NgramIndex`: the sorted n-grams,
+  the term ids containing each of them and the number of n-grams of each term
+
+Snapshots are never modified: documents changed after the snapshot was
+written are indexed again in a small in-memory :class:`search.index.SearchIndex`
+overlay, that hides their old version. Every process applies to its overlay
+the changes made by the others too, from the change log of the catalog (see
+:meth:`models.BaseModel.sync_search`). A new snapshot is written to a
+temporary file and renamed over the old one, so processes still mapping the
+old file keep reading it until they load the new one, that happens on the
+next :func:`reload_snapshot` after the file changed.
+
+Example:
+    >>> from models import Item
+    >>> from search import snapshot
+    >>> snapshot.build_snapshot(Item, '/var/lib/app/items.idx')
+    >>> snapshot.load_snapshot(Item, '/var/lib/app/items.idx')
+    >>> Item.search('scarpe', Item.select(), limit=10)  # uses the snapshot
+"""
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping, Sequence
+import fcntl
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+from search import config
+from search.bktree import BKTree
+from search.cache import SimilarityCache
+from search.index import _INDEXES, SearchIndex, get_index
+from search.ngrams import ngrams
+from search.store import DocumentStore
+
+#: First bytes of every snapshot file
+MAGIC = b'SRCHSNAP'
+#: Version of the file format, increased on every incompatible change
+FORMAT_VERSION = 1
+#: Magic, format version and length of the JSON header
+_PREAMBLE = struct.Struct('<8sII')
+#: Alignment of the sections inside the file
+_ALIGNMENT = 8
+
+#: Background rebuilds, mapping model classes to their running thread
+_REBUILDS = {}
+
+
+def _aligned(size):
+    return -(-size // _ALIGNMENT) * _ALIGNMENT
+
+
+def _identity(path):
+    """Get what changes when a snapshot file is replaced by a new one."""
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class _Strings(Sequence):
+    """Sequence of sorted strings stored as utf-8 bytes plus their offsets."""
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.raw(i).decode('utf-8')
+
+    def raw(self, i):
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]])
+
+    def find(self, string):
+        """Get the position of a string, or ``-1`` if missing."""
+        encoded = string.encode('utf-8')
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self.raw(middle) < encoded:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self) and self.raw(low) == encoded:
+            return low
+        return -1
+
+
+class _Slots(Mapping):
+    """Mapping of document id -> slot over the sorted document ids."""
+
+    def __init__(self, doc_ids):
+        self.doc_ids = doc_ids
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def __iter__(self):
+        return iter(self.doc_ids)
+
+    def __getitem__(self, doc_id):
+        slot = bisect_left(self.doc_ids, doc_id)
+        if slot < len(self.doc_ids) and self.doc_ids[slot] == doc_id:
+            return slot
+        raise KeyError(doc_id)
+
+
+class SnapshotStore(DocumentStore):
+    """
+    Read-only :class:`search.store.DocumentStore` over the arrays of a
+    snapshot, where the slot of a document is its position among the sorted
+    document ids.
+    """
+
+    def __init__(self, attributes, terms, doc_ids, tokens, offsets):
+        self.attributes = list(attributes)
+        self.terms = terms
+        self.doc_ids = doc_ids
+        self.slots = _Slots(doc_ids)
+        self.tokens = tokens
+        self.offsets = offsets
+
+    def term_id(self, term):
+        raise TypeError('Snapshot stores are read-only')
+
+    def add(self, doc_id, tokens):
+        raise TypeError('Snapshot stores are read-only')
+
+    def remove(self, doc_id):
+        raise TypeError('Snapshot stores are read-only')
+
+
+def _offsets(lengths):
+    offsets = array('I', [0])
+    for length in lengths:
+        offsets.append(offsets[-1] + length)
+    return offsets
+
+
+def _strings(strings):
+    """Get the data and offsets sections of a list of strings."""
+    encoded = [s.encode('utf-8') for s in strings]
+    return array('B', b''.join(encoded)), _offsets(len(e) for e in encoded)
+
+
+def _sections(index):
+    """Get the ``(name, array)`` sections of the snapshot of an index."""
+    store, vocabulary = index.store, index.vocabulary
+    terms = sorted(vocabulary.terms, key=lambda t: t.encode('utf-8'))
+    term_ids = {term: i for i, term in enumerate(terms)}
+    doc_ids = sorted(store.slots)
+
+    data, offsets = _strings(terms)
+    sections = [('terms', data), ('terms.offsets', offsets),
+                ('documents', array('q', doc_ids))]
+
+    for attr in index.attributes:
+        tokens = array('I')
+        offsets = array('I', [0])
+        for doc_id in doc_ids:
+            tokens.extend(term_ids[store.terms[t]] for t in store.term_ids_of(doc_id, attr))
+            offsets.append(len(tokens))
+        sections += [('tokens.' + attr, tokens), ('tokens.offsets.' + attr, offsets)]
+
+        postings = index.postings[attr]
+        documents = array('q')
+        for term in terms:
+            documents.extend(sorted(postings.get(term, ())))
+        offsets = _offsets(len(postings.get(term, ())) for term in terms)
+        sections += [('postings.' + attr, documents), ('postings.offsets.' + attr, offsets)]
+
+    grams = sorted(vocabulary.grams, key=lambda g: g.encode('utf-8'))
+    data, offsets = _strings(grams)
+    gram_terms = [sorted(term_ids[t] for t in vocabulary.grams[g]) for g in grams]
+    sections += [
+        ('grams', data),
+        ('grams.offsets', offsets),
+        ('grams.terms', array('I', (t for ids in gram_terms for t in ids))),
+        ('grams.terms.offsets', _offsets(len(ids) for ids in gram_terms)),
+        ('terms.grams', array('I', (vocabulary.terms[t][0] for t in terms))),
+    ]
+    return sections
+
+
+def write_snapshot(index, path, created=None, version=None):
+    """
+    Write the snapshot of an index, atomically replacing the file at ``path``.
+
+    Arguments:
+        index (:class:`search.index.SearchIndex`): index to write
+        path (str): snapshot file
+        created (float): timestamp of the data of the index, changes made
+            after it are replayed by :func:`load_snapshot`. Defaults to now.
+        version (int): catalog version of the data of the index, if known
+    """
+    sections = _sections(index)
+
+    layout, offset = {}, 0
+    for name, data in sections:
+        layout[name] = [offset, len(data), data.typecode]
+        offset = _aligned(offset + len(data) * data.itemsize)
+
+    header = json.dumps({
+        'attributes': index.attributes,
+        'ngram_size': index.vocabulary.size,
+        'byteorder': sys.byteorder,
+        'created': time.time() if created is None else created,
+        'version': version,
+        'sections': layout,
+    }).encode('utf-8')
+    start = _aligned(_PREAMBLE.size + len(header))
+
+    temporary = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+    with open(temporary, 'wb') as fo:
+        fo.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+        fo.write(header)
+        for name, data in sections:
+            fo.seek(start + layout[name][0])
+            data.tofile(fo)
+        fo.truncate(start + offset)
+        fo.flush()
+        os.fsync(fo.fileno())
+    os.replace(temporary, path)
+
+
+def read_snapshot(path):
+    """
+    Map a snapshot file in memory.
+
+    Returns:
+        tuple: ``(header, sections, identity)``, where ``sections`` maps each
+        section name to a read-only ``memoryview`` of its values
+    """
+    with open(path, 'rb') as fo:
+        stat = os.fstat(fo.fileno())
+        mapped = mmap.mmap(fo.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if len(mapped) < _PREAMBLE.size:
+        raise ValueError('{} is not a search index snapshot'.format(path))
+    magic, version, length = _PREAMBLE.unpack_from(mapped)
+    if magic != MAGIC:
+        raise ValueError('{} is not a search index snapshot'.format(path))
+    if version != FORMAT_VERSION:
+        raise ValueError('Unsupported format version {} of the snapshot {}'.format(
+            version, path))
+
+    header = json.loads(mapped[_PREAMBLE.size:_PREAMBLE.size + length].decode('utf-8'))
+    if header['byteorder'] != sys.byteorder:
+        raise ValueError('Snapshot {} was written with a different byte order'.format(path))
+
+    view = memoryview(mapped)
+    start = _aligned(_PREAMBLE.size + length)
+    sections = {}
+    for name, (offset, count, typecode) in header['sections'].items():
+        offset += start
+        size = count * array(typecode).itemsize
+        sections[name] = view[offset:offset + size].cast(typecode)
+    return header, sections, (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+class SnapshotIndex(SearchIndex):
+    """
+    :class:`search.index.SearchIndex` mapping a snapshot file, plus an
+    in-memory overlay of the documents changed after the snapshot was written.
+
+    Attributes:
+        path (str): snapshot file
+        identity (tuple): inode, modification time and size of the file when
+            mapped, to detect when it is replaced.
+        created (float): timestamp of the data of the snapshot
+        version (int): catalog version of the data of the snapshot, ``None``
+            if unknown
+        store (:class:`SnapshotStore`): tokens of the documents of the snapshot
+        delta (:class:`search.index.SearchIndex`): index of the documents
+            added or changed after the snapshot was written.
+        hidden (set): ids of the snapshot documents removed or changed
+        changes (dict): document id -> ``(timestamp, values)`` of the changes
+            in the overlay, ``values`` is ``None`` for removed documents.
+        listeners (list): callables called with the document id after each
+            change of the overlay.
+    """
+
+    def __init__(self, path):
+        header, sections, self.identity = read_snapshot(path)
+        self.path = path
+        self.created = header['created']
+        self.version = header.get('version')
+        self.attributes = header['attributes']
+        self.ngram_size = header['ngram_size']
+        self.generation = 0
+
+        terms = _Strings(sections['terms'], sections['terms.offsets'])
+        self.store = SnapshotStore(
+            self.attributes, terms, sections['documents'],
+            {attr: sections['tokens.' + attr] for attr in self.attributes},
+            {attr: sections['tokens.offsets.' + attr] for attr in self.attributes},
+        )
+        self.posting_lists = {
+            attr: (sections['postings.' + attr], sections['postings.offsets.' + attr])
+            for attr in self.attributes
+        }
+        self.grams = _Strings(sections['grams'], sections['grams.offsets'])
+        self.gram_terms = sections['grams.terms']
+        self.gram_terms_offsets = sections['grams.terms.offsets']
+        self.term_grams = sections['terms.grams']
+
+        self.delta = SearchIndex(self.attributes)
+        self.hidden = set()
+        self.changes = {}
+        self.listeners = []
+        self._typos = None
+
+    @property
+    def typos(self):
+        """
+        :class:`search.bktree.BKTree` of the snapshot vocabulary, built in
+        the process memory on first use.
+        """
+        if self._typos is None:
+            self._typos = BKTree(self.store.terms)
+        return self._typos
+
+    def __len__(self):
+        return len(self.store) - len(self.hidden) + len(self.delta)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.delta or (
+            doc_id in self.store and doc_id not in self.hidden)
+
+    def _change(self, doc_id, values, timestamp=None):
+        self.changes[doc_id] = (time.time() if timestamp is None else timestamp, values)
+        if doc_id in self.store:
+            self.hidden.add(doc_id)
+        if values is None:
+            self.delta.remove(doc_id)
+        else:
+            self.delta.add(doc_id, values)
+        self._changed(doc_id)
+
+    def add(self, doc_id, values):
+        """
+        Index a document in the overlay, hiding its snapshot version, unless
+        its tokens did not change (i.e. only the availability of an item was
+        saved).
+        """
+        tokens = self._tokenize(values)
+        if doc_id in self.delta:
+            unchanged = self.delta.store.tokens_of(doc_id) == tokens
+        else:
+            unchanged = (doc_id in self.store and doc_id not in self.hidden and
+                         self.store.tokens_of(doc_id) == tokens)
+        if not unchanged:
+            self._change(doc_id, values)
+
+    def remove(self, doc_id):
+        """Remove a document, hiding its snapshot version, if present."""
+        if doc_id in self:
+            self._change(doc_id, None)
+
+    def replay(self, changes):
+        """
+        Apply the changes of the overlay of another snapshot index (the one
+        this index replaces) made after this snapshot was written and after
+        the last change of the same documents in this index.
+        """
+        for doc_id, (timestamp, values) in list(changes.items()):
+            if timestamp < self.created:
+                continue
+            if timestamp > self.changes.get(doc_id, (float('-inf'),))[0]:
+                self._change(doc_id, values, timestamp)
+
+    def documents(self):
+        return set(self.store.doc_ids).difference(self.hidden)
+
+    def term_documents(self, attr, term):
+        term_id = self.store.terms.find(term)
+        if term_id < 0:
+            return ()
+        documents, offsets = self.posting_lists[attr]
+        return documents[offsets[term_id]:offsets[term_id + 1]]
+
+    def candidates(self, query, attributes, weights=None,
+                   threshold=config.THRESHOLD, cache=None):
+        """
+        Get the ids of the snapshot documents that could match the query, as
+        :meth:`search.index.SearchIndex.candidates` does, leaving out the
+        hidden ones.
+        """
+        candidates = super().candidates(query, attributes, weights, threshold, cache)
+        if candidates:
+            candidates -= self.hidden
+        return candidates
+
+    def search(self, query, attributes, weights=None,
+               threshold=config.THRESHOLD, limit=-1, cache=None, doc_ids=None,
+               after=None, boosts=None):
+        """
+        Rank the documents of the snapshot and of the overlay against the
+        query, merging the two rankings. See
+        :meth:`search.index.SearchIndex.search`.
+        """
+        if cache is None:
+            cache = SimilarityCache()
+
+        matches = super().search(query, attributes, weights, threshold, limit, cache,
+                                 doc_ids, after, boosts)
+        if matches is None or not len(self.delta):
+            return matches
+
+        matches += self.delta.search(query, attributes, weights, threshold, limit,
+                                     cache, doc_ids, after, boosts)
+        matches.sort(key=lambda m: (-m[1], m[0]))
+        return matches[:limit] if limit > 0 else matches
+
+    def batch_search(self, queries, attributes, weights=None,
+                     threshold=config.THRESHOLD, limit=-1, cache=None, doc_ids=None,
+                     boosts=None):
+        """
+        Rank the documents of the snapshot and of the overlay against many
+        queries at once, merging the two rankings of each query. See
+        :meth:`search.index.SearchIndex.batch_search`.
+        """
+        if cache is None:
+            cache = SimilarityCache()
+
+        results = super().batch_search(queries, attributes, weights, threshold, limit,
+                                       cache, doc_ids, boosts)
+        if results is None or not len(self.delta):
+            return results
+
+        overlay = self.delta.batch_search(queries, attributes, weights, threshold, limit,
+                                          cache, doc_ids, boosts)
+        for matches, delta_matches in zip(results, overlay):
+            matches += delta_matches
+            matches.sort(key=lambda m: (-m[1], m[0]))
+            if limit > 0:
+                del matches[limit:]
+        return results
+
+    def similar_terms(self, tokens):
+        """
+        Get the terms of the snapshot vocabulary that share enough n-grams
+        with at least one of the given tokens, as
+        :meth:`search.ngrams.NgramIndex.lookup` does, or that are close
+        enough to it in the :attr:`typos` BK-tree, see
+        :meth:`search.index.SearchIndex.similar_terms`.
+        """
+        if not config.NGRAM_SIMILARITY:
+            return self.store.terms
+
+        terms = set()
+        for token in tokens:
+            if config.SIMILAR_TERMS == 'bktree':
+                terms.update(self.typos.find(token, config.TYPO_MAX_DISTANCE))
+                continue
+
+            grams = ngrams(token, self.ngram_size)
+            shared = {}
+            for gram in grams:
+                gram_id = self.grams.find(gram)
+                if gram_id < 0:
+                    continue
+                start, end = self.gram_terms_offsets[gram_id:gram_id + 2]
+                for term_id in self.gram_terms[start:end]:
+                    shared[term_id] = shared.get(term_id, 0) + 1
+
+            for term_id, count in shared.items():
+                similarity = count / (len(grams) + self.term_grams[term_id] - count)
+                if similarity >= config.NGRAM_SIMILARITY:
+                    terms.add(self.store.terms[term_id])
+        return terms
+
+
+def build_snapshot(model, path, attributes=None):
+    """
+    Index all the rows of the given model and write the snapshot of the index
+    to ``path``. The snapshot is not loaded (see :func:`load_snapshot`).
+
+    Arguments:
+        model (:any:`BaseModel`): model class to index
+        path (str): snapshot file
+        attributes (list): attributes to index, defaults to the model
+            ``_search_attributes``
+
+    Returns:
+        SearchIndex: the index written
+    """
+    created = time.time()
+    version = model.catalog_version()
+    index = SearchIndex(attributes or model._search_attributes)
+    for obj in model.select():
+        index.add_object(obj)
+
+    write_snapshot(index, path, created, version)
+    return index
+
+
+def load_snapshot(model, path):
+    """
+    Map the snapshot at ``path`` and register it as the index of the model,
+    replacing any existing one. If the replaced index is a snapshot too, the
+    changes of its overlay not included in the new snapshot are kept.
+
+    Returns:
+        SnapshotIndex: the new index
+    """
+    index = SnapshotIndex(path)
+    current = get_index(model)
+    if isinstance(current, SnapshotIndex):
+        index.replay(current.changes)
+    _INDEXES[model] = index
+    if isinstance(current, SnapshotIndex):
+        # changes made to the old index while the new one was registered
+        index.replay(current.changes)
+    return index
+
+
+def open_snapshot(model, path):
+    """
+    Load the snapshot at ``path`` as the index of the model, building it
+    first if the file does not exist.
+
+    Returns:
+        SnapshotIndex: the new index
+    """
+    if not os.path.exists(path):
+        build_snapshot(model, path)
+    return load_snapshot(model, path)
+
+
+def _try_lock(path):
+    """
+    Get without waiting an exclusive lock on the lock file of the snapshot at
+    ``path``, released when the returned file is closed.
+
+    Returns:
+        file: the locked file, ``None`` if another process holds the lock
+    """
+    fo = open(path + '.lock', 'ab')
+    try:
+        fcntl.flock(fo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        fo.close()
+        return None
+    return fo
+
+
+def rebuild_snapshot(model, path, attributes=None, background=True, lock=None):
+    """
+    Build a new snapshot of the model and load it, by default in a background
+    thread with its own database connection, so that the current index keeps
+    serving the searches meanwhile.
+
+    Arguments:
+        lock (file): lock file of the snapshot (see :func:`_try_lock`),
+            closed when the rebuild is over
+
+    Returns:
+        threading.Thread: the thread of the rebuild, ``None`` if not run in
+        background.
+    """
+    def rebuild():
+        try:
+            build_snapshot(model, path, attributes)
+            load_snapshot(model, path)
+        finally:
+            if lock is not None:
+                lock.close()
+
+    def rebuild_connected():
+        with model._meta.database.execution_context():
+            rebuild()
+
+    if not background:
+        rebuild()
+        return None
+
+    thread = threading.Thread(target=rebuild_connected, daemon=True,
+                              name='rebuild-snapshot-{}'.format(model.__name__))
+    _REBUILDS[model] = thread
+    thread.start()
+    return thread
+
+
+def reload_snapshot(model, path):
+    """
+    Make sure the index of the model maps the current snapshot file: load it
+    if the registered index is not a snapshot of ``path`` or the file was
+    replaced since it was mapped.
+
+    Every process applies to its overlay the changes of all the processes
+    (see :meth:`models.BaseModel.sync_search`), so the overlays grow alike:
+    when they exceed :any:`search.config.SNAPSHOT_MAX_CHANGES` documents the
+    first process getting the lock of the snapshot rebuilds it in background,
+    and the others load the new file once it is replaced.
+
+    Returns:
+        SnapshotIndex: the registered index
+    """
+    index = get_index(model)
+    if (not isinstance(index, SnapshotIndex) or index.path != path or
+            index.identity != _identity(path)):
+        index = load_snapshot(model, path)
+
+    rebuilding = _REBUILDS.get(model)
+    if (len(index.changes) <= config.SNAPSHOT_MAX_CHANGES or
+            (rebuilding is not None and rebuilding.is_alive())):
+        return index
+
+    lock = _try_lock(path)
+    if lock is None:
+        return index
+    if index.identity != _identity(path):
+        # rebuilt by another process meanwhile
+        index = load_snapshot(model, path)
+        if len(index.changes) <= config.SNAPSHOT_MAX_CHANGES:
+            lock.close()
+            return index
+    rebuild_snapshot(model, path, lock=lock)
+    return index
@@ -0,0 +1,207 @@
+"""
+Instrumentation of the searches, to see where the time of a slow search goes
+and to tune the :mod:`search.config` values with data.
+
+Searches run inside :func:`collect` count the documents visited, the
+attributes scored, the (token, query token) pairs compared and how many of
+them were already in the :class:`search.cache.SimilarityCache` of the query,
+and time the tokenization, the jaro winkler computations and the ranking
+(everything else: matrices, positional coefficients, heap). The counters of
+every collected search are added to the process-wide :any:`totals`.
+
+Outside of :func:`collect` nothing is counted, so the searches pay only for
+a thread local lookup. Collection is enabled for all the searches of the
+application with :any:`search.config.COLLECT_STATS`, and for a single
+request by the ``explain`` parameter of the search endpoint (admins only).
+
+Example:
+    >>> from search import stats
+    >>> with stats.collect(force=True) as counters:
+    ...     Item.search('scarpe', Item.select(), limit=10)
+    >>> counters.as_dict()
+    {'searches': 1, 'documents': 120, 'attributes': 174, 'pairs': 312, ...}
+"""
+from contextlib import contextmanager
+import threading
+import time
+
+from search import config, utils
+
+
+#: names of the counters of a search
+COUNTERS = ('documents', 'attributes', 'pairs', 'cache_hits', 'result_cache_hits')
+
+#: names of the timers of a search, in seconds
+TIMERS = ('tokenize', 'similarity', 'rank', 'total')
+
+
+class SearchStats:
+    """
+    Counters and timings of one or more searches.
+
+    Attributes:
+        searches (int): number of collected searches
+        documents (int): documents (or index candidates) visited
+        attributes (int): attributes scored against the query
+        pairs (int): (token, query token) pairs compared
+        cache_hits (int): pairs whose jaro winkler value was already cached
+            by the query
+        result_cache_hits (int): searches served by :any:`search.cache.results`
+        tokenize (float): seconds spent splitting the strings into tokens
+        similarity (float): seconds spent computing jaro winkler values
+        rank (float): seconds spent ranking the documents, apart from the
+            tokenization and the jaro winkler values
+        total (float): seconds spent in the collected searches
+    """
+    __slots__ = ('searches',) + COUNTERS + TIMERS
+
+    def __init__(self):
+        self.searches = 0
+        for name in COUNTERS:
+            setattr(self, name, 0)
+        for name in TIMERS:
+            setattr(self, name, 0.0)
+
+    def add(self, other):
+        """Add the counters and timings of other searches to these ones."""
+        for name in self.__slots__:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def as_dict(self):
+        """
+        Get the counters and the timings, in milliseconds.
+
+        Example:
+            >>> counters.as_dict()
+            {'searches': 1, 'documents': 120, 'attributes': 174, 'pairs': 312,
+             'cache_hits': 140, 'result_cache_hits': 0,
+             'time': {'tokenize': 0.41, 'similarity': 0.22, 'rank': 1.05,
+                      'total': 1.9}}
+        """
+        data = {name: getattr(self, name) for name in ('searches',) + COUNTERS}
+        data['time'] = {name: round(getattr(self, name) * 1000, 3) for name in TIMERS}
+        return data
+
+    def cache(self, cache):
+        """
+        Wrap a :class:`search.cache.SimilarityCache` so that the pairs looked
+        up into it are counted, and their jaro winkler computations timed.
+        """
+        if isinstance(cache, _CountingCache):
+            return cache
+        return _CountingCache(cache, self)
+
+    def tokenizer(self):
+        """Get a :func:`search.utils.tokenize` that is timed."""
+        def tokenize(string):
+            start = time.perf_counter()
+            tokens = utils.tokenize(string)
+            self.tokenize += time.perf_counter() - start
+            return tokens
+        return tokenize
+
+    def scorer(self, score):
+        """Wrap a ``score(document, attribute)`` function counting its calls."""
+        def counted(document, attr):
+            self.attributes += 1
+            return score(document, attr)
+        return counted
+
+    def visit(self, documents):
+        """Iterate over the documents counting them."""
+        for document in documents:
+            self.documents += 1
+            yield document
+
+    @contextmanager
+    def ranking(self):
+        """
+        Time a ranking, apart from the tokenization and the jaro winkler
+        values computed meanwhile, that are timed on their own.
+        """
+        start, nested = time.perf_counter(), self.tokenize + self.similarity
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.rank += elapsed - (self.tokenize + self.similarity - nested)
+
+
+class _CountingCache:
+    """Similarity cache counting the looked up pairs and the cache hits."""
+
+    def __init__(self, cache, stats):
+        self.cache = cache
+        self.pairs = cache.pairs
+        self.stats = stats
+
+    def __len__(self):
+        return len(self.cache)
+
+    def __call__(self, token1, token2):
+        stats = self.stats
+        stats.pairs += 1
+        value = self.pairs.get((token1, token2))
+        if value is not None:
+            stats.cache_hits += 1
+            return value
+
+        start = time.perf_counter()
+        value = self.cache(token1, token2)
+        stats.similarity += time.perf_counter() - start
+        return value
+
+
+#: stats of all the searches collected by the process
+totals = SearchStats()
+
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def current():
+    """Get the stats collected by the current thread, ``None`` if not collecting."""
+    return getattr(_local, 'stats', None)
+
+
+@contextmanager
+def collect(force=False):
+    """
+    Collect the stats of the searches run inside the context, in the current
+    thread.
+
+    Once done, the stats are added to the process :any:`totals`. Nested
+    contexts collect into the stats of the outermost one.
+
+    Arguments:
+        force (bool): collect even if :any:`search.config.COLLECT_STATS` is
+            disabled.
+
+    Yields:
+        :class:`SearchStats`: the collected stats, ``None`` if disabled
+    """
+    if not (force or config.COLLECT_STATS):
+        yield None
+        return
+
+    stats = current()
+    if stats is not None:
+        yield stats
+        return
+
+    stats = _local.stats = SearchStats()
+    stats.searches = 1
+    start = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        stats.total += time.perf_counter() - start
+        _local.stats = None
+        with _lock:
+            totals.add(stats)
+
+
+def reset():
+    """Reset the process :any:`totals`."""
+    with _lock:
+        totals.__init__()
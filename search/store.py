@@ -0,0 +1,119 @@
+"""
+Pre-tokenized document store for the search index.
+
+Every document is stored as the list of the vocabulary term ids of each of
+its attributes, so that scoring a stored document needs no string processing
+at all: the position of a token is its index inside the attribute tokens.
+
+Term ids of all the documents are kept in one flat ``array`` per attribute,
+with a second array holding the offset where the tokens of each document
+slot start (as in a CSR sparse matrix). Updated documents are appended to new
+slots, and the old slots are reclaimed by :meth:`DocumentStore.compact` once
+they are more than :any:`search.config.STORE_MAX_GARBAGE` of the total.
+"""
+from array import array
+
+from search import config
+
+#: document id of the slots whose document was removed or updated
+_EMPTY = -1
+
+
+class DocumentStore:
+    """
+    Compact storage of the tokens of the indexed documents.
+
+    Attributes:
+        attributes (list): names of the stored attributes
+        terms (list): term id -> term
+        term_ids (dict): term -> term id
+        doc_ids (array): slot -> document id (``-1`` for empty slots)
+        slots (dict): document id -> slot
+        tokens (dict): attribute -> flat array of term ids
+        offsets (dict): attribute -> array of the start of each slot tokens
+            inside ``tokens``, with one more item for the end of the last one
+    """
+
+    def __init__(self, attributes):
+        self.attributes = list(attributes)
+        self.terms = []
+        self.term_ids = {}
+        self.doc_ids = array('q')
+        self.slots = {}
+        self.tokens = {attr: array('I') for attr in self.attributes}
+        self.offsets = {attr: array('I', [0]) for attr in self.attributes}
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.slots
+
+    def term_id(self, term):
+        """Get the id of a term, adding it to the terms if new."""
+        try:
+            return self.term_ids[term]
+        except KeyError:
+            term_id = self.term_ids[term] = len(self.terms)
+            self.terms.append(term)
+            return term_id
+
+    def add(self, doc_id, tokens):
+        """
+        Store a document, replacing any previous version of it.
+
+        Arguments:
+            doc_id (int): document id
+            tokens (list): list of tokens (str) for each of the attributes
+        """
+        self.remove(doc_id)
+
+        self.slots[doc_id] = len(self.doc_ids)
+        self.doc_ids.append(doc_id)
+        for attr, attr_tokens in zip(self.attributes, tokens):
+            self.tokens[attr].extend(self.term_id(t) for t in attr_tokens)
+            self.offsets[attr].append(len(self.tokens[attr]))
+
+    def remove(self, doc_id):
+        """Remove a document, if present."""
+        slot = self.slots.pop(doc_id, None)
+        if slot is None:
+            return
+
+        self.doc_ids[slot] = _EMPTY
+        if len(self.doc_ids) - len(self.slots) > len(self.doc_ids) * config.STORE_MAX_GARBAGE:
+            self.compact()
+
+    def term_ids_of(self, doc_id, attr):
+        """Get the term ids of the given attribute of a document."""
+        return self.slot_term_ids(self.slots[doc_id], attr)
+
+    def slot_term_ids(self, slot, attr):
+        """Get the term ids of the given attribute of a document slot."""
+        offsets = self.offsets[attr]
+        return self.tokens[attr][offsets[slot]:offsets[slot + 1]]
+
+    def tokens_of(self, doc_id):
+        """Get the list of tokens (str) for each attribute of a document."""
+        slot = self.slots[doc_id]
+        return [[self.terms[t] for t in self.slot_term_ids(slot, attr)]
+                for attr in self.attributes]
+
+    def compact(self):
+        """Rewrite the arrays dropping the empty slots."""
+        doc_ids = array('q')
+        slots = {}
+        tokens = {attr: array('I') for attr in self.attributes}
+        offsets = {attr: array('I', [0]) for attr in self.attributes}
+
+        for slot, doc_id in enumerate(self.doc_ids):
+            if doc_id == _EMPTY:
+                continue
+            slots[doc_id] = len(doc_ids)
+            doc_ids.append(doc_id)
+            for attr in self.attributes:
+                tokens[attr].extend(self.slot_term_ids(slot, attr))
+                offsets[attr].append(len(tokens[attr]))
+
+        self.doc_ids, self.slots = doc_ids, slots
+        self.tokens, self.offsets = tokens, offsets
@@ -0,0 +1,182 @@
+"""
+Prefix index for the search box autocomplete.
+
+The storefront sends a request on every keystroke, so suggestions cannot go
+through the fuzzy scoring at all: the distinct terms of the suggested
+attributes are kept in a sorted list, where all the terms starting with a
+prefix are a contiguous slice found with a binary search, and ranked by the
+number of documents containing them. Short prefixes match a large part of the
+vocabulary, so their suggestions are cached until the index changes.
+
+As for :mod:`search.index`, prefix indexes are registered per model class and
+kept up to date by the model signals.
+
+Example:
+    >>> from models import Item
+    >>> from search import suggest
+    >>> suggest.build_prefix_index(Item).suggest('sca', limit=3)
+    [('scarpe', 12), ('scarponi', 3), ('scatola', 1)]
+"""
+from bisect import bisect_left, insort
+import heapq
+
+from search import config, utils
+from search.bktree import BKTree, did_you_mean
+
+#: Registered prefix indexes, mapping model classes to their :class:`PrefixIndex`
+_PREFIX_INDEXES = {}
+
+
+class PrefixIndex:
+    """
+    Sorted array of the terms of some attributes, with their document
+    frequency.
+
+    Attributes:
+        attributes (list): names of the indexed attributes
+        terms (list): sorted distinct terms
+        frequencies (dict): term -> number of documents containing it
+        documents (dict): document id -> set of its terms
+        cached (dict): ``(prefix, limit)`` -> suggestions, for the prefixes
+            up to :any:`search.config.SUGGEST_CACHED_PREFIX_LENGTH` long
+    """
+
+    def __init__(self, attributes):
+        self.attributes = list(attributes)
+        self.terms = []
+        self.frequencies = {}
+        self.documents = {}
+        self.cached = {}
+        self._typos = None
+
+    @property
+    def typos(self):
+        """
+        :class:`search.bktree.BKTree` of the terms, built on first use and
+        then kept up to date.
+        """
+        if self._typos is None:
+            self._typos = BKTree(self.terms)
+        return self._typos
+
+    def __len__(self):
+        return len(self.documents)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.documents
+
+    def add(self, doc_id, values):
+        """
+        Add a document to the index, replacing any previous version of it.
+
+        Arguments:
+            doc_id (int): document id
+            values (dict): attribute name -> value (str)
+        """
+        terms = set()
+        for attr in self.attributes:
+            terms.update(utils.tokenize((values[attr] or '').lower()))
+
+        if self.documents.get(doc_id) == terms:
+            return
+
+        self.remove(doc_id)
+        self.cached.clear()
+        self.documents[doc_id] = terms
+        for term in terms:
+            if term not in self.frequencies:
+                insort(self.terms, term)
+                self.frequencies[term] = 0
+                if self._typos is not None:
+                    self._typos.add(term)
+            self.frequencies[term] += 1
+
+    def remove(self, doc_id):
+        """Remove a document from the index, if present."""
+        if doc_id in self.documents:
+            self.cached.clear()
+        for term in self.documents.pop(doc_id, ()):
+            self.frequencies[term] -= 1
+            if not self.frequencies[term]:
+                del self.frequencies[term]
+                del self.terms[bisect_left(self.terms, term)]
+                if self._typos is not None:
+                    self._typos.remove(term)
+
+    def add_object(self, obj):
+        """Add a model instance to the index, using its ``id`` as document id."""
+        self.add(obj.id, {attr: getattr(obj, attr) for attr in self.attributes})
+
+    def remove_object(self, obj):
+        """Remove a model instance from the index."""
+        self.remove(obj.id)
+
+    def suggest(self, prefix, limit=10):
+        """
+        Get the terms starting with ``prefix``, the most frequent first.
+
+        Arguments:
+            prefix (str): beginning of the terms to look up
+            limit (int): maximum number of terms to return
+
+        Returns:
+            list: ``(term, document frequency)`` tuples
+        """
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+
+        cacheable = len(prefix) <= config.SUGGEST_CACHED_PREFIX_LENGTH
+        if cacheable and (prefix, limit) in self.cached:
+            return self.cached[prefix, limit]
+
+        start = bisect_left(self.terms, prefix)
+        # terms starting with the prefix are sorted before the prefix followed
+        # by the highest code point
+        end = bisect_left(self.terms, prefix + '\U0010ffff', start)
+        matches = heapq.nsmallest(
+            limit, self.terms[start:end],
+            key=lambda term: (-self.frequencies[term], term))
+        suggestions = [(term, self.frequencies[term]) for term in matches]
+        if cacheable:
+            self.cached[prefix, limit] = suggestions
+        return suggestions
+
+    def did_you_mean(self, query):
+        """
+        Get the query with its tokens missing from the terms replaced by the
+        closest ones, ``None`` if there is nothing to correct (see
+        :func:`search.bktree.did_you_mean`).
+        """
+        return did_you_mean(query, self.typos, self.frequencies.get)
+
+
+def build_prefix_index(model, attributes=None):
+    """
+    Build a new :class:`PrefixIndex` for all the rows of the given model and
+    register it, replacing any existing one.
+
+    Arguments:
+        model (:any:`BaseModel`): model class to index
+        attributes (list): attributes to index, defaults to the model
+            ``_suggest_attributes``
+
+    Returns:
+        PrefixIndex: the new index
+    """
+    index = PrefixIndex(attributes or model._suggest_attributes)
+    for obj in model.select():
+        index.add_object(obj)
+
+    _PREFIX_INDEXES[model] = index
+    return index
+
+
+def get_prefix_index(model):
+    """Return the :class:`PrefixIndex` registered for the model, if any."""
+    return _PREFIX_INDEXES.get(model)
+
+
+def drop_prefix_index(model):
+    """Unregister the prefix index of the given model, if any."""
+    _PREFIX_INDEXES.pop(model, None)
@@ -44,6 +44,50 @@ def scale_to_one(iterable):
     return [v / m for v in iterable]
 
 
+def attribute_weights(attributes, weights=None):
+    """
+    Map each attribute name to its weight, scaled so that the most important
+    attribute has weight 1.
+
+    If ``weights`` is not provided **or** its length does not match the
+    ``attributes`` one, weights are generated from the attributes position,
+    reversed (first -> more weight).
+
+    Example:
+        >>> attribute_weights(['name', 'category', 'description'])
+        {'name': 1.0, 'category': 0.666667, 'description': 0.333333}
+    """
+    if not weights or len(weights) != len(attributes):
+        # list of integers of the same length of `attributes` as in [3, 2, 1]
+        # for attributes = ['a', 'b', 'c']
+        weights = list(range(len(attributes), 0, -1))
+
+    weights = scale_to_one(weights)
+    return {attr: w for attr, w in zip(attributes, weights)}
+
+
+def similarity_lower_bound(threshold, weight):
+    """
+    Get the minimum jaro winkler value that at least one pair of tokens
+    (query token, attribute token) must reach for an attribute with the given
+    ``weight`` to score a weighted match ``>= threshold``.
+
+    Every token match is a weighted average of the jaro winkler value and of a
+    positional coefficient that is at most ``1``, and the attribute match is
+    the mean of the token matches multiplied by the highest one, so it can
+    never be higher than the square of the best token match.
+
+    Returns:
+        float: the lower bound, ``> 1`` if the attribute cannot reach the
+        threshold at all or ``<= 0`` if any value (even an empty one) can.
+    """
+    if threshold <= 0:
+        return 0
+    best_match = (threshold / weight) ** 0.5
+    match_w, dist_w = config.MATCH_WEIGHT, config.DIST_WEIGHT
+    return (best_match * (match_w + dist_w) - dist_w) / match_w
+
+
 def weighted_average(values, weights):
     """Calculate the weighted mean average between two iterables of `values`
     and matching `weights`
@@ -135,11 +179,29 @@ def position_similarity(token1, token2, phrase1, phrase2):
         the farthest on the maximum available moves possible on ``l1``
 
     """
-    if len(phrase2) == 1:
+    return index_similarity(phrase1.index(token1), phrase2.index(token2),
+                            len(phrase1), len(phrase2))
+
+
+def index_similarity(index1, index2, length1, length2):
+    """
+    Get the normalized inverted movement cost between the token at ``index1``
+    of a phrase of ``length1`` tokens and the one at ``index2`` of a phrase of
+    ``length2`` tokens, as :func:`position_similarity` does, but using the
+    token positions so that repeated words get their own position.
+
+    Arguments:
+        index1 (int): position of the token in the longest phrase
+        index2 (int): position of the token in the shortest phrase
+        length1 (int): length of the longest phrase
+        length2 (int): length of the shortest phrase
+
+    Returns:
+        float: value ``0 -> 1``, where ``1`` represent the same position.
+    """
+    if length2 == 1:
         return 1
-    token1idx = phrase1.index(token1)
-    token2idx = phrase2.index(token2)
-    moves = abs(token1idx - token2idx)
-    max_moves = max_distance(phrase1, word_index=token1idx)
+    moves = abs(index1 - index2)
+    max_moves = max(index1, length1 - (index1 + 1))
 
     return abs(1 - (moves / max_moves))
@@ -0,0 +1,185 @@
+"""
+NumPy scoring engine for the search index.
+
+Same semantics of :func:`search.core.matrix_similarity` and
+:func:`search.core.rank`, but instead of scoring one (document token, query
+token) pair at a time in python the jaro winkler value of each distinct term
+of the candidates is computed once, and then all the per-document aggregation
+(best query token for each token, positional coefficient, mean times max and
+attributes weighting) is done with NumPy operations over the flat token
+arrays of the :class:`search.store.DocumentStore`.
+
+Sums are accumulated in the same order of the python engine, so that the
+matches are exactly the same.
+
+The engine is selected by setting :any:`search.config.ENGINE` to ``'numpy'``.
+"""
+import numpy as np
+
+from search import config
+
+
+def _gather(store, attr, slots):
+    """
+    Get the flat term ids of the given attribute for the given slots.
+
+    Returns:
+        tuple: ``(term ids, document row of each token, position of each
+        token, lengths of the documents)``
+    """
+    offsets = np.frombuffer(store.offsets[attr], dtype=np.uint32)
+    tokens = np.frombuffer(store.tokens[attr], dtype=np.uint32)
+
+    starts = offsets[slots].astype(np.int64)
+    lengths = offsets[slots + 1].astype(np.int64) - starts
+    total = int(lengths.sum())
+
+    rows = np.repeat(np.arange(len(slots)), lengths)
+    # position of each token inside its document
+    firsts = np.cumsum(lengths) - lengths
+    positions = np.arange(total) - np.repeat(firsts, lengths)
+    term_ids = tokens[np.repeat(starts, lengths) + positions]
+    return term_ids, rows, positions, lengths
+
+
+def _weighted(jw, positional):
+    """Weighted average of jaro winkler and positional values, as in python."""
+    match_w, dist_w = config.MATCH_WEIGHT, config.DIST_WEIGHT
+    return (jw * match_w + positional * dist_w) / sum((match_w, dist_w))
+
+
+def attribute_matches(gathered, sim, terms):
+    """
+    Compute the match of one attribute of many documents.
+
+    Arguments:
+        gathered (tuple): the attribute tokens, as returned by ``_gather``
+        sim (numpy.ndarray): ``(query tokens, terms)`` jaro winkler matrix
+        terms (numpy.ndarray): sorted term ids of the ``sim`` columns
+
+    Returns:
+        numpy.ndarray: match of the attribute for each document
+    """
+    term_ids, rows, positions, lengths = gathered
+    query_len = sim.shape[0]
+    result = np.zeros(len(lengths))
+    if query_len == 0 or len(lengths) == 0:
+        return result
+
+    values = sim[:, np.searchsorted(terms, term_ids)]
+
+    totals = np.zeros(len(lengths))
+    highest = np.zeros(len(lengths))
+    token_lengths = lengths[rows]
+
+    # documents at least as long as the query: for each of their tokens take
+    # the first query token with the highest jaro winkler value.
+    longest = token_lengths >= query_len
+    if longest.any():
+        best = values[:, longest].argmax(axis=0)
+        jw = values[:, longest][best, np.arange(len(best))]
+        i = positions[longest]
+        if query_len == 1:
+            positional = np.ones(len(i))
+        else:
+            length = token_lengths[longest]
+            max_moves = np.maximum(i, length - (i + 1))
+            positional = np.abs(1 - (np.abs(i - best) / max_moves))
+        matches = _weighted(jw, positional)
+
+        doc_rows = rows[longest]
+        np.maximum.at(highest, doc_rows, matches)
+        # sum the token matches by position, as the python engine does
+        for position in range(int(i.max()) + 1):
+            at_position = i == position
+            totals[doc_rows[at_position]] += matches[at_position]
+
+    # documents shorter than the query: for each query token take the first
+    # document token with the highest jaro winkler value.
+    shorter = (lengths > 0) & (lengths < query_len)
+    if shorter.any():
+        doc_index = np.flatnonzero(shorter)
+        tokens_mask = shorter[rows]
+        doc_lengths = lengths[doc_index]
+        width = int(doc_lengths.max())
+        # matrix (documents, tokens) with -1 where the documents are shorter
+        local_rows = np.repeat(np.arange(len(doc_index)), doc_lengths)
+        local_positions = positions[tokens_mask]
+
+        for j in range(query_len):
+            padded = np.full((len(doc_index), width), -1.0)
+            padded[local_rows, local_positions] = values[j, tokens_mask]
+            i = padded.argmax(axis=1)
+            jw = padded[np.arange(len(i)), i]
+            max_moves = max(j, query_len - (j + 1))
+            positional = np.where(doc_lengths == 1, 1, np.abs(1 - (np.abs(j - i) / max_moves)))
+            matches = _weighted(jw, positional)
+
+            totals[doc_index] += matches
+            highest[doc_index] = np.maximum(highest[doc_index], matches)
+
+    sizes = np.maximum(lengths, query_len)
+    nonempty = lengths > 0
+    result[nonempty] = (totals[nonempty] / sizes[nonempty]) * highest[nonempty]
+    return result
+
+
+def search(index, doc_ids, query_tokens, attributes, weights,
+           limit=-1, threshold=0, cache=None, after=None, boosts=None):
+    """
+    Rank the given documents of the index as :meth:`SearchIndex.search`
+    does, using NumPy arrays.
+
+    Arguments:
+        index (:class:`search.index.SearchIndex`): index of the documents
+        doc_ids (iterable): ids of the documents to rank
+        query_tokens (list): tokens of the query
+        attributes (list): attributes to look into
+        weights (dict): attribute -> weight, as returned by
+            :func:`search.utils.attribute_weights`
+        limit (int): maximum number of documents to return, ``-1`` for all
+        threshold (float): matching threshold
+        cache (:class:`search.cache.SimilarityCache`): cache for the jaro
+            winkler values
+        after (tuple): ``(match, document id)`` of the last document of a
+            previous page, see :func:`search.core.rank`
+        boosts (sequence): multiplier of the match of each document, indexed
+            by id, see :func:`search.core.rank`
+
+    Returns:
+        list: ``(document id, match)`` tuples sorted by relevance
+    """
+    store = index.store
+    doc_ids = np.fromiter(doc_ids, dtype=np.int64)
+    if len(doc_ids) == 0:
+        return []
+    slots = np.fromiter((store.slots[d] for d in doc_ids.tolist()),
+                        dtype=np.int64, count=len(doc_ids))
+
+    gathered = [_gather(store, attr, slots) for attr in attributes]
+
+    # jaro winkler values of each distinct term of the documents against the query
+    terms = np.unique(np.concatenate([g[0] for g in gathered]))
+    sim = np.array([[cache(store.terms[t], q) for t in terms.tolist()] for q in query_tokens],
+                   dtype=np.float64).reshape(len(query_tokens), len(terms))
+
+    raw = np.column_stack([attribute_matches(g, sim, terms) for g in gathered])
+    # first attribute with the highest match, multiplied by its weight
+    best = raw.argmax(axis=1)
+    attr_weights = np.array([weights[attr] for attr in attributes])
+    matches = raw[np.arange(len(best)), best] * attr_weights[best]
+
+    selected = matches >= threshold
+    if boosts is not None and len(boosts):
+        boosts = np.frombuffer(boosts, dtype=np.float64)
+        boosted = doc_ids < len(boosts)
+        matches[boosted] *= boosts[doc_ids[boosted]]
+    if after is not None:
+        match, doc_id = after
+        selected &= (matches < match) | ((matches == match) & (doc_ids > doc_id))
+    doc_ids, matches = doc_ids[selected], matches[selected]
+    order = np.lexsort((doc_ids, -matches))
+    if limit > 0:
+        order = order[:limit]
+
+    return list(zip(doc_ids[order].tolist(), matches[order].tolist()))
@@ -0,0 +1,241 @@
+"""
+Compiled serializers of the :mod:`schemas`, for the read only responses.
+
+Dumping a resource with `Marshmallow JSONAPI <http://marshmallow-jsonapi.readthedocs.io/>`_
+walks the field objects of the schema, their accessors, the post dump hooks
+and the relationship machinery for every object, while the output of a schema
+only depends on its declared fields. :func:`compile_schema` generates, once,
+a python function for a schema class that reads the attributes of the object
+(also dotted ones, such as ``item.uuid``) and builds the JSONAPI document
+directly, with the same keys in the same order of the schema ``dump``, so
+the json is the same byte by byte.
+
+Strings, integers and floats are converted inline, the other fields through
+their own ``_serialize`` method. Schemas using features not supported here
+(inflection, custom hooks, relationship links, nested, meta or method fields,
+``as_string`` numbers) are not compiled, and keep being dumped by marshmallow.
+
+Compiled serializers are opt-in: with ``COMPILED_SERIALIZERS=on`` all the
+schemas are compiled when :mod:`schemas` is imported and used by
+:any:`BaseSchema.jsonapi` and :any:`BaseSchema.jsonapi_list` when no
+related resource is included.
+
+Example:
+    >>> from schemas import ItemSchema
+    >>> serialize = compile_schema(ItemSchema)
+    >>> serialize(item) == ItemSchema().dump(item).data
+    True
+"""
+import os
+
+from marshmallow import fields as ma_fields
+from marshmallow.utils import ensure_text_type, missing
+from marshmallow_jsonapi import Schema
+from marshmallow_jsonapi.fields import BaseRelationship, Meta, Relationship
+from marshmallow_jsonapi.utils import tpl
+
+#: Whether the schemas are compiled when :mod:`schemas` is imported, set by
+#: the ``COMPILED_SERIALIZERS`` environment variable (``on`` or ``off``)
+ENABLED = os.getenv('COMPILED_SERIALIZERS', 'off') == 'on'
+
+#: Compiled serializers, mapping schema classes to their function
+_SERIALIZERS = {}
+
+#: Field classes converted inline, mapping them to the converting function
+_INLINE = {
+    ma_fields.String: '_text',
+    ma_fields.Integer: 'int',
+    ma_fields.Float: 'float',
+}
+
+
+def _stringify(value):
+    return str(value) if value is not None else None
+
+
+def _text(value):
+    return value if value.__class__ is str else ensure_text_type(value)
+
+
+class _Source:
+    """Lines of the source code of a generated function."""
+
+    def __init__(self):
+        self.lines = []
+        self.namespace = {'_missing': missing, '_stringify': _stringify, '_text': _text}
+
+    def add(self, line, indent=1):
+        self.lines.append('    ' * indent + line)
+
+    def bind(self, name, value):
+        """Make a value available to the generated code, returning its name."""
+        self.namespace[name] = value
+        return name
+
+
+def _access(name, path, default='_missing'):
+    """
+    Get the expression reading a (dotted) attribute of ``name``, evaluating
+    to ``default`` if any attribute along the path is missing, as
+    :func:`marshmallow.utils.get_value` does.
+    """
+    attributes = path.split('.')
+    if not all(attribute.isidentifier() for attribute in attributes):
+        return None
+
+    expression = name
+    for attribute in attributes:
+        expression = 'getattr({}, {!r}, {})'.format(expression, attribute, default)
+    return expression
+
+
+def _relationship(field, value):
+    """Get the expression of the relationship object of ``value``."""
+    if field.self_url or field.related_url or not field.include_resource_linkage:
+        return None
+
+    if field.many:
+        linkage_id = _access('each', field.id_field, 'each')
+        if linkage_id is None:
+            return None
+        linkage = ('[] if {value} is None else [{{"type": {type_!r}, "id": _stringify({id})}} '
+                   'for each in {value}]').format(value=value, type_=field.type_, id=linkage_id)
+    else:
+        linkage_id = _access(value, field.id_field, value)
+        if linkage_id is None:
+            return None
+        linkage = 'None if {value} is None else {{"type": {type_!r}, "id": _stringify({id})}}'\
+            .format(value=value, type_=field.type_, id=linkage_id)
+    return '{{"data": {}}}'.format(linkage)
+
+
+def _generate(schema, source):
+    """
+    Write the body of the serializer of a schema instance, returning whether
+    all its fields are supported.
+
+    As ``format_item`` of marshmallow-jsonapi does, the ``id``,
+    ``attributes`` and ``relationships`` members of the resource object are
+    added when their first field with a value comes, and fields missing from
+    the object are skipped.
+    """
+    source.add('data = {{"type": {!r}}}'.format(schema.opts.type_))
+    source.add('attributes = {}')
+    source.add('relationships = {}')
+    keys = {}
+
+    for index, (name, field) in enumerate(schema.fields.items()):
+        if field.load_only:
+            continue
+        key = field.dump_to or name
+        value = keys[key] = 'v{}'.format(index)
+
+        access = _access('obj', field.attribute or name)
+        if access is None:
+            return False
+        source.add('{} = {}'.format(value, access))
+        source.add('if {} is not _missing:'.format(value))
+
+        if isinstance(field, BaseRelationship):
+            if not isinstance(field, Relationship):
+                return False
+            expression = _relationship(field, value)
+            if expression is None:
+                return False
+            source.add('{} = {}'.format(value, expression), indent=2)
+            container = 'relationships'
+        elif (isinstance(field, (ma_fields.Nested, Meta)) or not field._CHECK_ATTRIBUTE or
+              isinstance(field, ma_fields.Number) and field.as_string):
+            return False
+        elif type(field) in _INLINE:
+            source.add('if {} is not None:'.format(value), indent=2)
+            source.add('{0} = {1}({0})'.format(value, _INLINE[type(field)]), indent=3)
+            container = None if name == 'id' else 'attributes'
+        else:
+            function = source.bind('_serialize_{}'.format(index), field._serialize)
+            source.add('{0} = {1}({0}, {2!r}, obj)'.format(value, function, name), indent=2)
+            container = None if name == 'id' else 'attributes'
+
+        if container is None:
+            source.add('data["id"] = {}'.format(value), indent=2)
+        else:
+            source.add('if not {}:'.format(container), indent=2)
+            source.add('data[{0!r}] = {0}'.format(container), indent=3)
+            source.add('{}[{!r}] = {}'.format(container, key, value), indent=2)
+
+    if not schema.opts.self_url:
+        source.add('return {"data": data}')
+        return True
+
+    arguments = []
+    for name, argument in (schema.opts.self_url_kwargs or {}).items():
+        attribute = tpl(str(argument))
+        if attribute is None:
+            arguments.append('{!r}: {!r}'.format(name, argument))
+        elif attribute in keys:
+            arguments.append('{!r}: {}'.format(name, keys[attribute]))
+        else:
+            return False
+    source.add('url = {!r}.format(**{{{}}})'.format(schema.opts.self_url, ', '.join(arguments)))
+    source.add('data["links"] = {"self": url}')
+    source.add('return {"data": data, "links": {"self": url}}')
+    return True
+
+
+def processors(schema_class):
+    """Get the hooks of a schema class, by tag."""
+    # the hooks are in a defaultdict, looking up the missing tags adds them
+    return {tag: names for tag, names in schema_class.__processors__.items() if names}
+
+
+def compile_schema(schema_class):
+    """
+    Generate the serializer function of a schema class.
+
+    Arguments:
+        schema_class (type): subclass of :class:`marshmallow_jsonapi.Schema`
+
+    Returns:
+        callable: function taking an object and returning the same JSONAPI
+        document of ``schema_class().dump(obj).data``, ``None`` if the
+        schema uses features that cannot be compiled
+    """
+    if (schema_class.opts.inflect is not None or
+            processors(schema_class) != processors(Schema)):
+        return None
+
+    schema = schema_class()
+    source = _Source()
+    source.add('def serialize(obj):', indent=0)
+    if not _generate(schema, source):
+        return None
+
+    code = compile('\n'.join(source.lines), '<serializer {}>'.format(schema_class.__name__), 'exec')
+    exec(code, source.namespace)
+    serialize = source.namespace['serialize']
+    serialize.source = '\n'.join(source.lines)
+    return serialize
+
+
+def compile_schemas(base):
+    """
+    Compile and register the serializers of all the subclasses of a schema,
+    skipping the ones that cannot be compiled.
+
+    Returns:
+        dict: the registered serializers, mapping the schema classes to them
+    """
+    classes = base.__subclasses__()
+    while classes:
+        schema_class = classes.pop()
+        classes.extend(schema_class.__subclasses__())
+
+        serialize = compile_schema(schema_class)
+        if serialize is not None:
+            _SERIALIZERS[schema_class] = serialize
+    return _SERIALIZERS
+
+
+def get_serializer(schema_class):
+    """Return the compiled serializer of the schema class, if any."""
+    return _SERIALIZERS.get(schema_class)
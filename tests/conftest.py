@@ -9,7 +9,9 @@ import pytest
 
 from tests.test_utils import mock_uuid_generator, MockModelCreate
 
+import fragments
 import models
+import search
 
 
 @pytest.fixture(autouse=True, name='mockuuid4')
@@ -38,3 +40,31 @@ def mock_models_create(mocker):
             'models.{}.create'.format(cls.__name__),
             new=MockModelCreate(cls),
         )
+
+
+@pytest.fixture(name='exact_candidates')
+def search_exact_candidates(mocker):
+    """
+    Fixture to disable the n-gram lookup of the search index vocabulary, so
+    that searching through an index returns the same results of a full scan.
+    """
+    mocker.patch.object(search.config, 'NGRAM_SIMILARITY', 0)
+
+
+@pytest.fixture(name='no_result_cache')
+def search_no_result_cache(mocker):
+    """
+    Fixture to disable the search results cache, so that every search of the
+    test is actually ranked, i.e. to compare the search paths.
+    """
+    search.cache.results.bump()
+    mocker.patch.object(search.config, 'RESULT_CACHE_SIZE', 0)
+
+
+@pytest.fixture(autouse=True, name='no_fragments')
+def clear_fragments_cache():
+    """
+    Fixture to empty the cache of the rendered resources before every test,
+    since the tests create again the same rows (same ids) in the database.
+    """
+    fragments.cache.clear()
@@ -0,0 +1,52 @@
+"""
+Test suite for the search benchmark helpers (``scripts/benchmark_search.py``)
+"""
+from scripts import benchmark_search as benchmark
+
+
+def test_build_catalog__deterministic():
+    small = benchmark.build_catalog(5)
+    big = benchmark.build_catalog(10)
+
+    assert [obj.id for obj in big] == list(range(1, 11))
+    assert [obj.name for obj in small] == [obj.name for obj in big[:5]]
+    assert benchmark.build_queries(small, 4) == benchmark.build_queries(big[:5], 4)
+
+
+def test_percentile():
+    values = list(range(100, 0, -1))
+
+    assert benchmark.percentile(values, 50) == 50
+    assert benchmark.percentile(values, 99) == 99
+    assert benchmark.percentile([3], 95) == 3
+
+
+def test_run_mode__same_counts():
+    catalog = benchmark.build_catalog(50)
+    index, _ = benchmark.build_index(catalog)
+    queries = benchmark.build_queries(catalog, 4)
+
+    scan = benchmark.run_mode('scan', catalog, index, queries, 10, rounds=1)
+    indexed = benchmark.run_mode('index', catalog, index, queries, 10, rounds=1)
+
+    assert scan['candidates'] == 50
+    assert 0 < indexed['candidates'] < scan['candidates']
+    assert indexed['pairs'] > 0
+    assert scan['p50'] <= scan['p95'] <= scan['p99']
+
+
+def test_regressions():
+    baseline = {'1000': {'index': {m: 10 for m in benchmark.METRICS}}}
+    results = {
+        '1000': {
+            'index': dict(baseline['1000']['index'], p95=12, pairs=13),
+            'numpy': {m: 100 for m in benchmark.METRICS},
+        },
+    }
+
+    assert benchmark.regressions(results, baseline, 0.25) == [
+        ('1000', 'index', 'pairs', 13, 10),
+    ]
+    assert benchmark.regressions(results, baseline, 0.5, latency_tolerance=0.1) == [
+        ('1000', 'index', 'p95', 12, 10),
+    ]
@@ -6,10 +6,12 @@ import pytest
 from peewee import SqliteDatabase
 
 from app import app
-from models import Address, Item, Order, OrderItem, Picture, User, Favorite
+from models import (Address, CatalogChange, CatalogVersion, Item, Order, OrderItem,
+                    Picture, User, Favorite)
 
 
-TABLES = [Address, Item, Order, OrderItem, Picture, User, Favorite]
+TABLES = [Address, Item, Order, OrderItem, Picture, User, Favorite, CatalogVersion,
+          CatalogChange]
 """
 TABLES = list(BaseModel)
 
@@ -39,7 +41,10 @@ class TestCase:
 
     def setup_method(self):
         """
-        When setting up a new test method clear all the tables
+        When setting up a new test method clear all the tables, but the
+        catalog versions: as in a real database they only grow, so that the
+        search results cached by a test are never valid in the next one.
         """
         for table in TABLES:
-            table.delete().execute()
+            if table is not CatalogVersion:
+                table.delete().execute()
@@ -0,0 +1,137 @@
+"""
+Test suite for the cache of the rendered json of the resources
+(:mod:`fragments`).
+"""
+import http.client as client
+from unittest import mock
+
+import simplejson as json
+
+import fragments
+from fragments import FragmentCache
+from models import Address, Item, Order, Picture, User
+from tests import test_utils
+from tests.test_case import TestCase
+from tests.test_utils import add_address, add_user, open_with_auth
+
+
+class Resource:
+    def __init__(self, id, updated_at):
+        self.id = id
+        self.updated_at = updated_at
+
+
+def test_cache__updated_at():
+    cache = FragmentCache(size=10)
+    resource = Resource(1, 100)
+    cache.put(resource, '{"id": 1}')
+
+    assert cache.get(resource) == '{"id": 1}'
+    assert cache.get(Resource(1, 100)) == '{"id": 1}'
+    assert cache.get(Resource(1, 101)) is None
+    assert cache.get(Resource(2, 100)) is None
+
+    cache.put(Resource(1, 101), '{"id": 1, "new": true}')
+    assert len(cache) == 1
+    assert cache.get(resource) is None
+
+    cache.drop(Resource, 1)
+    assert cache.get(Resource(1, 101)) is None
+
+
+def test_cache__lru():
+    cache = FragmentCache(size=2)
+    cache.put(Resource(1, 0), 'one')
+    cache.put(Resource(2, 0), 'two')
+    cache.get(Resource(1, 0))
+    cache.put(Resource(3, 0), 'three')
+
+    assert len(cache) == 2
+    assert cache.get(Resource(2, 0)) is None
+    assert cache.get(Resource(1, 0)) == 'one'
+
+
+def test_cache__not_cached():
+    cache = FragmentCache(size=0)
+    cache.put(Resource(1, 0), 'one')
+    assert not len(cache)
+
+    cache = FragmentCache(size=2)
+    cache.put(Resource(None, 0), 'unsaved')
+    cache.put(Resource(1, None), 'no updated_at')
+    assert not len(cache)
+
+
+class TestFragments(TestCase):
+    def setup_method(self):
+        super(TestFragments, self).setup_method()
+        item = test_utils.add_item(name='scarpe', category='scarpe', description='rosse')
+        # read back from the database, with a decimal price
+        self.item = Item.get(Item.id == item.id)
+
+    def test_json__reused_until_saved(self):
+        rendered = self.item.json()
+        assert fragments.cache.get(self.item) == rendered
+
+        # reused by the lists, of the same rows read again
+        fragments.cache.put(self.item, '{"cached": true}')
+        assert Item.json_list(Item.select()) == '[{"cached": true}]'
+        assert ''.join(Item.json_stream(Item.select())) == '[{"cached": true}]'
+
+        self.item.name = 'scarpe blu'
+        self.item.save()
+        data = json.loads(Item.json_list(Item.select()))
+        assert data[0]['data']['attributes']['name'] == 'scarpe blu'
+
+    def test_json__not_cached_with_included(self):
+        Picture.create(item=self.item, extension='jpg', uuid='df690434-a488-419f-899e-8853cba1a22b')
+        self.item.json(['pictures'])
+        assert fragments.cache.get(self.item) is None
+
+    def test_json__related_changes(self):
+        assert json.loads(self.item.json())['data']['relationships']['pictures']['data'] == []
+
+        picture = Picture.create(item=self.item, extension='jpg',
+                                 uuid='df690434-a488-419f-899e-8853cba1a22b')
+        linkage = json.loads(self.item.json())['data']['relationships']['pictures']['data']
+        assert linkage == [{'type': 'picture', 'id': str(picture.uuid)}]
+
+        picture.delete_instance()
+        assert json.loads(self.item.json())['data']['relationships']['pictures']['data'] == []
+
+    def test_order_items__changed(self):
+        user = add_user('fragments@email.com', 'password')
+        order = Order.create_order(user, add_address(user), {self.item: 1})
+        order.json()
+
+        order.update_items({self.item: 0}, update_total=False)
+        assert json.loads(order.json())['data']['relationships']['items']['data'] == []
+
+    def test_delete_address__user_changed(self):
+        user = add_user('fragments@email.com', 'password')
+        address = add_address(user)
+        assert len(json.loads(user.json())['data']['relationships']['addresses']['data']) == 1
+
+        resp = open_with_auth(self.app, '/addresses/{}'.format(address.uuid), 'DELETE',
+                              user.email, 'password', None, None)
+        assert resp.status_code == client.NO_CONTENT
+        assert not Address.select().exists()
+
+        user = User.get(User.id == user.id)
+        assert json.loads(user.json())['data']['relationships']['addresses']['data'] == []
+
+    def test_other_worker__related_changes(self):
+        user = add_user('fragments@email.com', 'password')
+        assert json.loads(user.json())['data']['relationships']['addresses']['data'] == []
+        assert json.loads(self.item.json())['data']['relationships']['pictures']['data'] == []
+
+        # changed by another worker, that has its own cache
+        with mock.patch.object(fragments, 'cache', FragmentCache()):
+            add_address(user)
+            Picture.create(item=self.item, extension='jpg',
+                           uuid='df690434-a488-419f-899e-8853cba1a22b')
+
+        user = User.get(User.id == user.id)
+        assert len(json.loads(user.json())['data']['relationships']['addresses']['data']) == 1
+        item = Item.get(Item.id == self.item.id)
+        assert len(json.loads(item.json())['data']['relationships']['pictures']['data']) == 1
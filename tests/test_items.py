@@ -151,6 +151,21 @@ class TestItems(TestCase):
         assert resp.status_code == client.OK
         assert_valid_response(resp.data, EXPECTED_RESULTS['get_items__success'])
 
+    def test_get_items__streamed(self, mocker):
+        mocker.patch.object(utils, 'STREAM_CHUNK_SIZE', 1000)
+        for i in range(20):
+            Item.create(**dict(TEST_ITEM, uuid='{:032x}'.format(i), name='Item {}'.format(i)))
+
+        resp = self.app.get('/items/', buffered=False)
+        chunks = list(resp.response)
+
+        assert resp.status_code == client.OK
+        # the opening bracket is sent before reading the items
+        assert chunks[0] == b'['
+        assert len(chunks) > 2
+        assert all(len(chunk) >= 1000 for chunk in chunks[1:-1])
+        assert b''.join(chunks).decode() == Item.json_list(Item.select())
+
     def test_get_item__success(self):
         item = Item.create(**TEST_ITEM)
         resp = self.app.get('/items/{item_uuid}'.format(item_uuid=item.uuid))
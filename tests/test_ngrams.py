@@ -0,0 +1,43 @@
+"""
+Test suite for the n-gram vocabulary index (:mod:`search.ngrams`)
+"""
+from search.ngrams import NgramIndex, ngrams
+
+
+def test_ngrams():
+    assert ngrams('sedia') == {'  s', ' se', 'sed', 'edi', 'dia', 'ia '}
+    assert ngrams('sedia', size=2) == {' s', 'se', 'ed', 'di', 'ia', 'a '}
+
+
+def test_lookup__similar_terms():
+    index = NgramIndex()
+    for term in ['scarpe', 'scarpine', 'sedie', 'divano']:
+        index.add(term)
+
+    matches = index.lookup('scarpa', min_similarity=0.3)
+
+    assert set(matches) == {'scarpe', 'scarpine'}
+    assert matches['scarpe'] > matches['scarpine']
+
+
+def test_lookup__exact_term():
+    index = NgramIndex()
+    index.add('scarpe')
+
+    assert index.lookup('scarpe') == {'scarpe': 1.0}
+
+
+def test_remove__reference_counted():
+    index = NgramIndex()
+    index.add('scarpe')
+    index.add('scarpe')
+    index.add('sedie')
+
+    index.remove('scarpe')
+    assert 'scarpe' in index
+    assert 'scarpe' in index.lookup('scarpe')
+
+    index.remove('scarpe')
+    assert 'scarpe' not in index
+    assert index.lookup('scarpe', min_similarity=0) == {'sedie': 1 / 12}
+    assert ' sc' not in index.grams
@@ -197,6 +197,27 @@ class TestOrderSchema(TestCase):
         expected_result = EXPECTED_ORDERS['get_orders_list__success']
         assert_valid_response(parsed, expected_result)
 
+    def test_orders_list_include__same_as_json(self):
+        order1 = Order.create(
+            delivery_address=self.addr, user=self.user,
+            uuid='451b3bba-fe4d-470d-bf48-cb306c939bc6',
+        ).add_item(self.item1)
+        order2 = Order.create(
+            delivery_address=self.addr, user=self.user,
+            uuid='27e375f4-3d54-458c-91e4-d8a4fdf3b032',
+        ).add_item(self.item2, 2)
+        include = ['items', 'delivery_address']
+
+        # a new schema for each order, each with its own included resources
+        expected = '[{}]'.format(','.join(
+            OrderSchema(include_data=include).dumps(order).data for order in [order1, order2]
+        ))
+
+        assert OrderSchema.jsonapi_list([order1, order2], include) == expected
+        assert OrderSchema.jsonapi_list([order1, order2], include) == expected
+        assert OrderSchema.jsonapi_list([]) == '[]'
+        assert OrderSchema.cached(include) is OrderSchema.cached(include)
+
     def test_order_validate_fields__fail(self):
         order = {
             'relationships': {
@@ -345,6 +366,21 @@ class TestItemSchema(TestCase):
         expected_result = EXPECTED_ITEMS['get_items_list__success']
         assert_valid_response(data, expected_result)
 
+    def test_get_items_iter__lazy(self):
+        def items():
+            yield self.item1
+            yield self.item2
+            raise AssertionError('read too far')
+
+        parts = ItemSchema.jsonapi_iter(items())
+        assert next(parts) == '['
+        assert next(parts) == self.item1.json()
+        assert next(parts) == ',' + self.item2.json()
+
+        parts = ItemSchema.jsonapi_iter([self.item1, self.item2])
+        assert ''.join(parts) == ItemSchema.jsonapi_list([self.item1, self.item2])
+        assert ''.join(ItemSchema.jsonapi_iter([])) == '[]'
+
     def test_get_item_include_pictures__success(self):
         data, errors = ItemSchema.jsonapi(
             self.item1, include_data=['pictures'])
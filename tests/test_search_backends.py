@@ -0,0 +1,129 @@
+"""
+Test suite for the database candidates backends (:mod:`search.backends`)
+"""
+from peewee import PostgresqlDatabase
+import pytest
+
+from models import Item
+import search
+from search.backends import PostgresBackend, ScanBackend, SqliteBackend
+from tests import test_utils
+from tests.test_case import TestCase
+from tests.test_searchitem import NAMES, get_names
+
+
+QUERIES = [
+    'tavolo sedie', 'tavolo', 'sedia', 'sedie', 'scarpe', 'letto',
+    'scarpette', 'divano', 'legno di tavola',
+]
+
+
+class TestSqliteBackend(TestCase):
+    def setup_method(self, method):
+        super(TestSqliteBackend, self).setup_method()
+        for name in NAMES:
+            test_utils.add_item(name=name, description='random description', category='')
+
+        self.backend = SqliteBackend()
+        self.backend.setup(Item)
+
+    def teardown_method(self, method):
+        self.backend.drop(Item)
+
+    @pytest.fixture
+    def use_backend(self, mocker):
+        mocker.patch.object(search.config, 'CANDIDATES_BACKEND', 'sqlite')
+        mocker.patch.dict(search.backends._INSTANCES, {'sqlite': self.backend})
+
+    def test_candidates__prefix_match(self):
+        candidates = self.backend.candidates(Item, 'sedia', ['name'])
+        names = get_names(Item.select().where(Item.id << candidates))
+
+        assert sorted(names) == sorted(n for n in NAMES if 'sedi' in n)
+
+    def test_candidates__limit(self):
+        assert len(self.backend.candidates(Item, 'scarpe', ['name'], limit=2)) == 2
+
+    def test_candidates__attributes(self):
+        assert self.backend.candidates(Item, 'random', ['name']) == []
+        assert len(self.backend.candidates(Item, 'random', ['description'])) == len(NAMES)
+
+    def test_candidates__fallback(self):
+        assert self.backend.candidates(Item, '', ['name']) is None
+        assert self.backend.candidates(Item, 'sedia', ['price']) is None
+        assert SqliteBackend().candidates(Item, 'sedia', ['name']) is None
+        assert ScanBackend().candidates(Item, 'sedia', ['name']) is None
+
+    def test_candidates__triggers(self):
+        item = test_utils.add_item(name='divano rosso', category='')
+        assert item.id in self.backend.candidates(Item, 'rosso', ['name'])
+
+        item.name = 'divano verde'
+        item.save()
+        assert self.backend.candidates(Item, 'rosso', ['name']) == []
+        assert self.backend.candidates(Item, 'verde', ['name']) == [item.id]
+
+        item.delete_instance()
+        assert item.id not in self.backend.candidates(Item, 'divano', ['name'])
+
+    def test_candidates__allowed_ids(self, mocker):
+        mocker.patch.object(search.config, 'BACKEND_CANDIDATES', 2)
+        spy = mocker.spy(Item._meta.database, 'execute_sql')
+        everything = self.backend.candidates(Item, 'scarpe', ['name'], limit=100)
+        allowed = set(everything[-2:])
+
+        # the allowed rows rank below the first BACKEND_CANDIDATES ones
+        assert self.backend.candidates(Item, 'scarpe', ['name'], ids=allowed) == everything[-2:]
+        assert spy.call_count > 2
+        assert self.backend.candidates(Item, 'scarpe', ['name'], ids=set()) == []
+
+    def test_setup__rebuild_only_when_created(self, mocker):
+        spy = mocker.spy(Item._meta.database, 'execute_sql')
+        SqliteBackend().setup(Item)
+
+        assert not any('rebuild' in call[0][0] for call in spy.call_args_list)
+        assert len(self.backend.candidates(Item, 'scarpe', ['name'])) > 2
+
+    @pytest.mark.usefixtures('use_backend')
+    @pytest.mark.parametrize('query', QUERIES)
+    def test_search__full_scan_of_candidates(self, query, mocker):
+        candidates = self.backend.candidates(Item, query, ['name'])
+        result = Item.search(query, Item.select(), 5, ['name'])
+
+        mocker.patch.object(search.config, 'CANDIDATES_BACKEND', 'scan')
+        expected = Item.search(query, Item.select(), -1, ['name'])
+        expected = [obj for obj in expected if obj.id in candidates][:5]
+
+        assert get_names(result) == get_names(expected)
+
+    @pytest.mark.usefixtures('use_backend')
+    def test_search__scores_only_candidates(self, mocker):
+        spy = mocker.spy(search.core, 'search_matches')
+        Item.search('divano', Item.select(), 5, ['name'])
+
+        dataset = spy.call_args[0][2]
+        assert sorted(get_names(dataset)) == ['divano', 'divano letto']
+
+    @pytest.mark.usefixtures('use_backend')
+    def test_search__filtered_candidates(self, mocker):
+        mocker.patch.object(search.config, 'BACKEND_CANDIDATES', 2)
+        last = self.backend.candidates(Item, 'scarpe', ['name'], limit=100)[-1]
+
+        result = Item.search_matches('scarpe', Item.select(), 5, ['name'], ids={last})
+        assert [obj.id for obj, _ in result] == [last]
+
+    @pytest.mark.usefixtures('use_backend')
+    def test_search__no_candidates(self):
+        assert Item.search('xyzw', Item.select(), 5, ['name']) == []
+
+
+def test_postgres_backend__query(monkeypatch):
+    monkeypatch.setattr(Item._meta, 'database', PostgresqlDatabase(None))
+    sql, params = PostgresBackend().query(Item, ['name', 'category'], ['name'],
+                                          ['scar', 'sedi'], 10)
+
+    document = '''coalesce("name", '') || ' ' || coalesce("category", '')'''
+    assert "to_tsvector('simple', {})".format(document) in sql
+    assert 'word_similarity(%s, {})'.format(document) in sql
+    assert params == ["'scar':* | 'sedi':*", 'scar sedi', "'scar':* | 'sedi':*",
+                      'scar sedi', 10]
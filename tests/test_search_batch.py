@@ -0,0 +1,129 @@
+"""
+Test suite for the batch search of many queries at once
+(:func:`search.core.batch_search`), checking that each query gets the same
+results of a single search.
+"""
+import http.client as client
+
+import pytest
+import simplejson as json
+
+from models import Item
+import search
+from search import core
+from tests import test_utils
+from tests.test_case import TestCase
+from tests.test_search_index import QUERIES
+from tests.test_search_vectorized import ATTRIBUTES, make_index
+from tests.test_searchitem import NAMES, get_names
+
+
+@pytest.mark.parametrize('threshold', [0, 0.4, 0.75])
+@pytest.mark.parametrize('limit', [-1, 3])
+def test_batch_search__same_results(threshold, limit):
+    objects = [Item(id=i, name=name, category='', description='random description')
+               for i, name in enumerate(NAMES)]
+    attributes = ['name', 'description']
+    key = lambda obj: obj.id  # noqa: E731
+
+    results = core.batch_search(QUERIES, attributes, objects, limit, threshold, key=key)
+
+    assert results == [
+        core.search_matches(query, attributes, objects, limit, threshold, key=key)
+        for query in QUERIES
+    ]
+
+
+def test_batch_search__one_pass(mocker):
+    objects = [Item(id=i, name=name, category='', description='') for i, name in enumerate(NAMES)]
+    spy = mocker.spy(search.utils, 'tokenize')
+
+    core.batch_search(['scarpe', 'sedie', 'tavolo'], ['name'], objects)
+
+    # every name is tokenized once, plus the three queries
+    assert spy.call_count == len(NAMES) + 3
+
+
+@pytest.mark.parametrize('limit', [-1, 5])
+def test_index_batch_search__same_results(limit):
+    index = make_index()
+    queries = QUERIES + ['rosso legno cucina']
+
+    results = index.batch_search(queries, ATTRIBUTES, threshold=0.4, limit=limit,
+                                 doc_ids=set(range(0, 300, 2)))
+
+    assert results == [
+        index.search(query, ATTRIBUTES, threshold=0.4, limit=limit, doc_ids=set(range(0, 300, 2)))
+        for query in queries
+    ]
+
+
+def test_index_batch_search__not_indexed_attribute():
+    assert make_index().batch_search(['scarpe'], ['price']) is None
+
+
+class TestBatchSearch(TestCase):
+    @classmethod
+    def setup_class(cls):
+        super(TestBatchSearch, cls).setup_class()
+        Item.delete().execute()
+        for name in NAMES:
+            test_utils.add_item(name=name, description='random description', category='')
+
+    def setup_method(self):
+        pass
+
+    @classmethod
+    def teardown_class(cls):
+        search.drop_index(Item)
+        Item.delete().execute()
+
+    def batch(self, data):
+        resp = self.app.post('/items/db/batch/', data=json.dumps(data))
+        return resp, json.loads(resp.data)
+
+    @pytest.mark.parametrize('indexed', [False, True])
+    def test_batch_search__same_results(self, indexed):
+        if indexed:
+            search.build_index(Item)
+        else:
+            search.drop_index(Item)
+        queries = ['scarpe', 'tavolo sedie', 'xyz']
+
+        results = Item.batch_search(queries, Item.select(), 5)
+
+        assert [get_names(r) for r in results] == [
+            get_names(Item.search(query, Item.select(), 5)) for query in queries
+        ]
+
+    def test_post(self):
+        resp, data = self.batch({'queries': ['poltrona', 'xyz'], 'limit': 10})
+
+        assert resp.status_code == client.OK
+        assert [d['query'] for d in data['data']] == ['poltrona', 'xyz']
+        names = [[r['data']['attributes']['name'] for r in d['data']] for d in data['data']]
+        assert names == [['poltrona', 'poltrona elettrica'], []]
+
+    @pytest.mark.parametrize('data', [
+        {'limit': 10},
+        {'queries': [], 'limit': 10},
+        {'queries': 'scarpe', 'limit': 10},
+        {'queries': ['scarpe', ''], 'limit': 10},
+        {'queries': ['scarpe'] * 101, 'limit': 10},
+    ])
+    def test_post__invalid_queries(self, data):
+        resp, errors = self.batch(data)
+
+        assert resp.status_code == client.BAD_REQUEST
+        assert errors == {'errors': [
+            {'detail': 'Queries must be a list of 1 to 100 non empty strings.'},
+        ]}
+
+    @pytest.mark.parametrize('limit', [None, 0, 101, '10', True])
+    def test_post__invalid_limit(self, limit):
+        resp, errors = self.batch({'queries': ['scarpe'], 'limit': limit})
+
+        assert resp.status_code == client.BAD_REQUEST
+        assert errors == {'errors': [{
+            'detail': 'Limit out of range. must be between 0 and 100. Requested: {}'.format(limit),
+        }]}
@@ -0,0 +1,161 @@
+"""
+Test suite for the BK-tree typo tolerant lookup (:mod:`search.bktree`), and
+its use in the search index and the "did you mean" suggestions.
+"""
+import http.client as client
+import random
+
+import distance
+import pytest
+import simplejson as json
+
+from models import Item
+import search
+from search.bktree import BKTree, did_you_mean
+from search.index import SearchIndex
+from search.snapshot import SnapshotIndex
+from search.suggest import PrefixIndex
+from tests import test_utils
+from tests.test_case import TestCase
+from tests.test_search_vectorized import ATTRIBUTES, WORDS, make_index
+from tests.test_searchitem import NAMES
+
+
+def make_words(count, seed=42):
+    rnd = random.Random(seed)
+    return {''.join(rnd.choice('abcde') for _ in range(rnd.randint(3, 7)))
+            for _ in range(count)}
+
+
+@pytest.mark.parametrize('max_distance', [0, 1, 2])
+def test_find__same_as_brute_force(max_distance):
+    words = make_words(300)
+    tree = BKTree(words)
+
+    for word in list(make_words(20, seed=7)) + ['abcde', '']:
+        expected = {w: distance.levenshtein(word, w) for w in words
+                    if distance.levenshtein(word, w) <= max_distance}
+        assert tree.find(word, max_distance) == expected
+
+
+def test_remove__rebuilds_tree():
+    words = make_words(100)
+    tree = BKTree(words)
+    removed = sorted(words)[::2]
+    for word in removed:
+        tree.remove(word)
+    tree.remove('missing')
+
+    assert len(tree) == len(words) - len(removed)
+    assert set(tree) == words - set(removed)
+    assert tree.removed <= tree.size
+    assert removed[0] not in tree and sorted(words)[1] in tree
+
+    tree.add(removed[0])
+    assert removed[0] in tree
+    assert tree.find(removed[0], 0) == {removed[0]: 0}
+
+
+def test_did_you_mean():
+    tree = BKTree(['scarpe', 'scarpa', 'sedie', 'letto'])
+    frequencies = {'scarpe': 10, 'scarpa': 2, 'sedie': 1, 'letto': 1}
+
+    assert did_you_mean('scarpx ledto', tree, frequencies.get) == 'scarpe letto'
+    assert did_you_mean('sedie letto', tree, frequencies.get) is None
+    assert did_you_mean('zzzzzzz', tree, frequencies.get) is None
+
+
+def test_index_typos__kept_up_to_date():
+    index = SearchIndex(['name'])
+    index.add(1, {'name': 'scarpe rosse'})
+    assert set(index.typos) == {'scarpe', 'rosse'}
+
+    index.add(2, {'name': 'sedie rosse'})
+    index.remove(1)
+    assert set(index.typos) == {'sedie', 'rosse'}
+
+    prefixes = PrefixIndex(['name'])
+    prefixes.add(1, {'name': 'scarpe rosse'})
+    assert set(prefixes.typos) == {'scarpe', 'rosse'}
+    prefixes.add(1, {'name': 'sedie'})
+    assert set(prefixes.typos) == {'sedie'}
+    assert prefixes.did_you_mean('sedxe') == 'sedie'
+
+
+def test_similar_terms__bktree(mocker):
+    mocker.patch.object(search.config, 'SIMILAR_TERMS', 'bktree')
+    index = make_index()
+
+    assert index.similar_terms(['scarpx', 'lexxo']) == {
+        term for term in index.vocabulary.terms
+        if min(distance.levenshtein(term, 'scarpx'), distance.levenshtein(term, 'lexxo')) <= 2
+    }
+    assert index.did_you_mean('sedix di lexxo') == 'sedie letto'
+
+
+def test_snapshot_similar_terms__bktree(mocker, tmpdir):
+    mocker.patch.object(search.config, 'SIMILAR_TERMS', 'bktree')
+    index = make_index()
+    path = str(tmpdir.join('index.snapshot'))
+    search.snapshot.write_snapshot(index, path)
+    mapped = SnapshotIndex(path)
+
+    for word in WORDS:
+        typo = word[:2] + 'x' + word[3:]
+        assert mapped.similar_terms([typo]) == index.similar_terms([typo])
+        assert (mapped.search(typo, ATTRIBUTES, limit=5) ==
+                index.search(typo, ATTRIBUTES, limit=5))
+
+
+class TestDidYouMean(TestCase):
+    @classmethod
+    def setup_class(cls):
+        super(TestDidYouMean, cls).setup_class()
+        Item.delete().execute()
+        for name in NAMES:
+            test_utils.add_item(name=name, description='random description', category='')
+        search.build_index(Item)
+
+    def setup_method(self):
+        pass
+
+    @classmethod
+    def teardown_class(cls):
+        search.drop_index(Item)
+        search.drop_prefix_index(Item)
+        Item.delete().execute()
+
+    def search(self, **params):
+        resp = self.app.get('/items/db/', query_string=params)
+        return resp, json.loads(resp.data)
+
+    def test_search__did_you_mean(self):
+        resp, data = self.search(query='zexto', limit=10, suggest='true')
+
+        assert resp.status_code == client.OK
+        assert data == {'data': [], 'meta': {'did_you_mean': 'letto'}}
+
+    def test_search__not_requested(self):
+        resp, data = self.search(query='zexto', limit=10)
+
+        assert resp.status_code == client.OK
+        assert data == []
+
+    def test_search__results_no_suggestion(self):
+        resp, data = self.search(query='letto', limit=10, suggest='true')
+
+        assert data['data'] and data['meta'] == {'did_you_mean': None}
+
+    @pytest.mark.usefixtures('no_result_cache')
+    def test_search__bktree_candidates(self, mocker):
+        mocker.patch.object(search.config, 'SIMILAR_TERMS', 'bktree')
+        resp, data = self.search(query='zexto', limit=10)
+
+        names = [d['data']['attributes']['name'] for d in data]
+        assert names[0] == 'letto'
+        assert all('letto' in name for name in names)
+
+    def test_prefix_index__did_you_mean(self):
+        index = search.build_prefix_index(Item)
+
+        assert index.did_you_mean('zexto') == 'letto'
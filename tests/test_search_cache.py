@@ -0,0 +1,90 @@
+"""
+Test suite for the search engine caches (:mod:`search.cache`)
+"""
+import jellyfish as jf
+
+import search
+from search.cache import ResultCache, SimilarityCache
+
+
+def test_similarity_cache__same_values():
+    cache = SimilarityCache()
+
+    assert cache('scarpe', 'scarpa') == jf.jaro_winkler('scarpe', 'scarpa')
+    assert cache('scarpe', 'scarpa') == jf.jaro_winkler('scarpe', 'scarpa')
+    assert len(cache) == 1
+
+
+def test_search__each_pair_computed_once(mocker):
+    pairs = []
+
+    def jaro_winkler(s1, s2):
+        pairs.append((s1, s2))
+        return jf.jaro_winkler(s1, s2)
+
+    mocker.patch('search.cache._jaro_winkler', new=jaro_winkler)
+
+    class Obj:
+        def __init__(self, name):
+            self.name = name
+
+    dataset = [Obj('scarpe rosse'), Obj('scarpe blu'), Obj('scarpe rosse da ballo')]
+    results = search.search('scarpe rosse', ['name'], dataset, threshold=0)
+
+    assert len(results) == 3
+    assert len(pairs) == len(set(pairs))
+    assert set(pairs) == {
+        ('scarpe', 'scarpe'), ('scarpe', 'rosse'),
+        ('rosse', 'scarpe'), ('rosse', 'rosse'),
+        ('ballo', 'scarpe'), ('ballo', 'rosse'),
+    }
+
+
+def test_result_cache__lru_eviction():
+    cache = ResultCache(size=2)
+    cache.put('scarpe', [1, 2])
+    cache.put('sedie', [3])
+    cache.get('scarpe')
+    cache.put('tavolo', [4])
+
+    assert cache.get('scarpe') == [1, 2]
+    assert cache.get('sedie') is None
+    assert cache.get('tavolo') == [4]
+    assert len(cache) == 2
+
+
+def test_result_cache__bump_invalidates():
+    cache = ResultCache(size=2)
+    cache.put('scarpe', [1, 2])
+    cache.bump()
+
+    assert cache.get('scarpe') is None
+
+
+def test_result_cache__version_changed():
+    cache = ResultCache(size=2)
+    cache.check('1:2017-02-20 10:00:00')
+    cache.put('scarpe', [1, 2])
+    cache.check('1:2017-02-20 10:00:00')
+    assert cache.get('scarpe') == [1, 2]
+
+    cache.check('2:2017-02-20 10:05:00')
+    assert cache.version == '2:2017-02-20 10:05:00'
+    assert cache.get('scarpe') is None
+
+
+def test_result_cache__disabled():
+    cache = ResultCache(size=0)
+    cache.put('scarpe', [1, 2])
+
+    assert cache.get('scarpe') is None
+
+
+def test_result_cache__long_rankings(mocker):
+    mocker.patch.object(search.config, 'RESULT_CACHE_MAX_RESULTS', 2)
+    cache = ResultCache(size=2)
+    cache.put('scarpe', [1, 2])
+    cache.put('sedie', [3, 4, 5])
+
+    assert cache.get('scarpe') == [1, 2]
+    assert cache.get('sedie') is None
@@ -0,0 +1,213 @@
+"""
+Test suite for the cursor based pagination of the search results
+(:mod:`search.cursor`), checking that the pages put together are the same
+ranking of a single search.
+"""
+import datetime
+import http.client as client
+
+import pytest
+import simplejson as json
+
+from models import CatalogChange, Item
+import search
+from search import cursor
+from tests import test_utils
+from tests.test_case import TestCase
+from tests.test_search_vectorized import ATTRIBUTES, make_index
+from tests.test_searchitem import NAMES
+
+
+def pages(search_page, size):
+    """Collect all the pages of a search, continuing from each last result."""
+    results, after = [], None
+    while True:
+        page = search_page(size, after)
+        results.extend(page)
+        if len(page) < size:
+            return results
+        after = page[-1]
+
+
+def test_encode__round_trip():
+    token = cursor.encode(0.8123456789012345, 42, 7)
+
+    assert cursor.decode(token) == (0.8123456789012345, 42, 7)
+
+
+@pytest.mark.parametrize('token', ['', 'abc', cursor.encode('0.5', 1, 1)[:-2], 'W10=',
+                                   cursor.encode(True, 1, 1), cursor.encode(0.5, 1, '1'),
+                                   cursor.encode(0.5, 1, True)])
+def test_decode__invalid(token):
+    with pytest.raises(ValueError):
+        cursor.decode(token)
+
+
+@pytest.mark.parametrize('engine', ['python', 'numpy'])
+@pytest.mark.parametrize('query', ['tavolo sedie', 'scarpe', 'rosso legno cucina'])
+def test_index_pages__same_ranking(mocker, engine, query):
+    mocker.patch.object(search.config, 'ENGINE', engine)
+    index = make_index()
+    expected = index.search(query, ATTRIBUTES, threshold=0.4)
+
+    def search_page(size, after):
+        if after is not None:
+            after = (after[1], after[0])
+        return index.search(query, ATTRIBUTES, threshold=0.4, limit=size, after=after)
+
+    assert len(expected) > 7
+    assert pages(search_page, 7) == expected
+
+
+def test_full_scan_pages__same_ranking():
+    objects = [Item(id=i, name=name, category='', description='') for i, name in enumerate(NAMES)]
+    expected = search.core.search_matches('tavolo sedie', ['name'], objects, threshold=0.4,
+                                          key=lambda obj: obj.id)
+
+    def search_page(size, after):
+        if after is not None:
+            after = (after[1], after[0].id)
+        return search.core.search_matches('tavolo sedie', ['name'], objects, size,
+                                          threshold=0.4, key=lambda obj: obj.id, after=after)
+
+    assert pages(search_page, 3) == expected
+
+
+class TestSearchPagination(TestCase):
+    @classmethod
+    def setup_class(cls):
+        super(TestSearchPagination, cls).setup_class()
+        Item.delete().execute()
+        for name in NAMES:
+            test_utils.add_item(name=name, description='random description', category='')
+
+    def setup_method(self):
+        pass
+
+    @classmethod
+    def teardown_class(cls):
+        search.drop_index(Item)
+        Item.delete().execute()
+
+    def search(self, **params):
+        resp = self.app.get('/items/db/', query_string=params)
+        return resp, json.loads(resp.data)
+
+    def names(self, data):
+        return [d['data']['attributes']['name'] for d in data]
+
+    def all_pages(self, query, limit):
+        names, token = [], ''
+        while token is not None:
+            resp, data = self.search(query=query, limit=limit, cursor=token)
+            assert resp.status_code == client.OK
+            names.extend(self.names(data['data']))
+            token = data['meta']['cursor']
+        return names
+
+    @pytest.mark.parametrize('indexed', [False, True])
+    def test_pages__same_ranking(self, indexed):
+        if indexed:
+            search.build_index(Item)
+        else:
+            search.drop_index(Item)
+        resp, data = self.search(query='tavolo sedie', limit=100)
+
+        assert len(data) > 3
+        assert self.all_pages('tavolo sedie', 3) == self.names(data)
+
+    def test_last_page__no_cursor(self):
+        resp, data = self.search(query='poltrona', limit=10, cursor='')
+
+        assert self.names(data['data']) == ['poltrona', 'poltrona elettrica']
+        assert data['meta'] == {'cursor': None}
+
+    def test_cursor__invalid(self):
+        resp, data = self.search(query='tavolo', limit=3, cursor='xyz')
+
+        assert resp.status_code == client.BAD_REQUEST
+        assert data == {'errors': [{'detail': 'Invalid cursor: xyz'}]}
+
+    def test_cursor__catalog_changed(self):
+        resp, data = self.search(query='tavolo', limit=3, cursor='')
+        item = Item.get(Item.name == 'poltrona')
+        item.description += ' e comoda'
+        item.save()
+        resp, data = self.search(query='tavolo', limit=3, cursor=data['meta']['cursor'])
+
+        assert resp.status_code == client.BAD_REQUEST
+        assert data == {'errors': [
+            {'detail': 'Expired cursor, the items changed: restart the search.'},
+        ]}
+
+    def test_cursor__unrelated_changes(self):
+        resp, first = self.search(query='tavolo', limit=3, cursor='')
+        item = Item.get(Item.name == 'poltrona')
+        # i.e. an order of the item
+        item.availability -= 1
+        item.save()
+        item.save()
+
+        resp, second = self.search(query='tavolo', limit=3, cursor=first['meta']['cursor'])
+        assert resp.status_code == client.OK
+        assert not set(self.names(first['data'])) & set(self.names(second['data']))
+
+        # out of stock, it is not found filtering the items in stock anymore
+        item.availability = 0
+        item.save()
+        resp, data = self.search(query='tavolo', limit=3, cursor=first['meta']['cursor'])
+        assert resp.status_code == client.BAD_REQUEST
+
+    def test_cursor__other_worker(self, mocker):
+        resp, first = self.search(query='tavolo', limit=3, cursor='')
+        token = first['meta']['cursor']
+
+        # another worker, with its own caches, continues the same ranking
+        mocker.patch.object(search.cache, 'results', search.cache.ResultCache())
+        resp, second = self.search(query='tavolo', limit=3, cursor=token)
+        assert resp.status_code == client.OK
+        assert not set(self.names(first['data'])) & set(self.names(second['data']))
+
+        # an item changed by another worker, without the signals of this one
+        item = Item.get(Item.name == 'poltrona')
+        with Item._meta.database.transaction():
+            Item.update(name='poltroncina').where(Item.id == item.id).execute()
+            CatalogChange.record(Item._meta.db_table, item.id)
+        resp, data = self.search(query='tavolo', limit=3, cursor=token)
+        assert resp.status_code == client.BAD_REQUEST
+        item.save()
+
+        # or deleted
+        extra = test_utils.add_item(name='sgabello', description='', category='')
+        resp, data = self.search(query='tavolo', limit=3, cursor='')
+        with Item._meta.database.transaction():
+            Item.delete().where(Item.id == extra.id).execute()
+            CatalogChange.record(Item._meta.db_table, extra.id)
+        resp, data = self.search(query='tavolo', limit=3, cursor=data['meta']['cursor'])
+        assert resp.status_code == client.BAD_REQUEST
+
+    def test_cursor__clock_set_back(self):
+        # i.e. saved before a DST fall back, the items saved now look older
+        later = datetime.datetime.now() + datetime.timedelta(hours=1)
+        Item.update(updated_at=later).execute()
+        resp, data = self.search(query='tavolo', limit=3, cursor='')
+
+        item = Item.get(Item.name == 'poltrona')
+        item.description += ' e morbida'
+        item.save()
+
+        resp, data = self.search(query='tavolo', limit=3, cursor=data['meta']['cursor'])
+        assert resp.status_code == client.BAD_REQUEST
+
+    def test_pages__cached(self, mocker):
+        mocker.patch.object(search.config, 'RESULT_CACHE_SIZE', 10)
+        # not the pages cached by the other tests
+        search.cache.results.bump()
+        resp, first = self.search(query='tavolo', limit=3, cursor='')
+        spy = mocker.spy(Item, '_search')
+        resp, second = self.search(query='tavolo', limit=3, cursor=first['meta']['cursor'])
+        resp, again = self.search(query='tavolo', limit=3, cursor=first['meta']['cursor'])
+
+        assert spy.call_count == 1
+        assert again == second
+        assert not set(self.names(first['data'])) & set(self.names(second['data']))
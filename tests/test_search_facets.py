@@ -0,0 +1,196 @@
+"""
+Test suite for the facet filters (:mod:`search.facets`) and their use in the
+``/items/db/`` search endpoint.
+"""
+from decimal import Decimal
+import http.client as client
+
+import simplejson as json
+
+from models import CatalogChange, Item
+import search
+from search.facets import FacetIndex
+from tests import test_utils
+from tests.test_case import TestCase
+
+
+def get_index():
+    index = FacetIndex(['category'], ['price', 'availability'])
+    index.add(1, {'category': 'scarpe', 'price': Decimal('20'), 'availability': 0})
+    index.add(2, {'category': 'scarpe', 'price': Decimal('35.50'), 'availability': 4})
+    index.add(3, {'category': 'sedie', 'price': Decimal('35.50'), 'availability': 1})
+    index.add(4, {'category': 'sedie', 'price': Decimal('99'), 'availability': 12})
+    return index
+
+
+def test_filter__terms():
+    index = get_index()
+
+    assert index.filter(terms={'category': 'sedie'}) == {3, 4}
+    assert index.filter(terms={'category': 'divani'}) == set()
+    assert index.filter() is None
+
+
+def test_filter__ranges():
+    index = get_index()
+
+    assert index.filter(ranges={'price': (Decimal('35.50'), None)}) == {2, 3, 4}
+    assert index.filter(ranges={'price': (None, Decimal('35.50'))}) == {1, 2, 3}
+    assert index.filter(ranges={'price': (21, 98)}) == {2, 3}
+    assert index.filter(ranges={'availability': (1, None)}) == {2, 3, 4}
+
+
+def test_filter__combined():
+    index = get_index()
+    ids = index.filter(terms={'category': 'scarpe'},
+                       ranges={'price': (30, None), 'availability': (1, None)})
+
+    assert ids == {2}
+
+
+def test_counts():
+    index = get_index()
+
+    assert index.counts({1, 2, 3}, 'category') == {'scarpe': 2, 'sedie': 1}
+    assert index.counts([], 'category') == {}
+
+
+def test_add__replaces_document():
+    index = get_index()
+    index.add(1, {'category': 'sedie', 'price': Decimal('50'), 'availability': 3})
+    index.remove(4)
+    index.remove(12345)
+
+    assert index.filter(terms={'category': 'sedie'}) == {1, 3}
+    assert index.filter(ranges={'price': (40, None)}) == {1}
+    assert len(index) == 3
+
+
+class TestSearchFacets(TestCase):
+    def setup_method(self):
+        super(TestSearchFacets, self).setup_method()
+        search.drop_facet_index(Item)
+        self.items = {
+            'scarpe da ballo': self.add_item('scarpe da ballo', 'calzature', '20.00', 3),
+            'scarpe rosse': self.add_item('scarpe rosse', 'calzature', '45.00', 0),
+            'scarpette': self.add_item('scarpette', 'bambini', '15.00', 8),
+            'divano letto': self.add_item('divano letto', 'arredamento', '300.00', 1),
+        }
+
+    @classmethod
+    def teardown_class(cls):
+        search.drop_facet_index(Item)
+        search.drop_index(Item)
+
+    def add_item(self, name, category, price, availability):
+        item = test_utils.add_item(name=name, category=category, price=price,
+                                   description='random description')
+        item.availability = availability
+        item.save()
+        return item
+
+    def search(self, **params):
+        resp = self.app.get('/items/db/', query_string=params)
+        return resp, json.loads(resp.data)
+
+    def names(self, data):
+        return [d['data']['attributes']['name'] for d in data]
+
+    def test_search__no_filters(self):
+        resp, data = self.search(query='scarpe', limit=10)
+
+        assert resp.status_code == client.OK
+        assert sorted(self.names(data)) == ['scarpe da ballo', 'scarpe rosse', 'scarpette']
+
+    def test_search__no_filters_no_facet_index(self):
+        self.search(query='scarpe', limit=10)
+        assert search.get_facet_index(Item) is None
+
+        self.search(query='scarpe', limit=10, facets='1')
+        assert search.get_facet_index(Item) is not None
+
+    def test_search__category(self):
+        resp, data = self.search(query='scarpe', limit=10, category='calzature')
+        assert sorted(self.names(data)) == ['scarpe da ballo', 'scarpe rosse']
+
+    def test_search__price_range(self):
+        resp, data = self.search(query='scarpe', limit=10, min_price='16', max_price='45')
+        assert sorted(self.names(data)) == ['scarpe da ballo', 'scarpe rosse']
+
+        resp, data = self.search(query='scarpe', limit=10, max_price='19.99')
+        assert self.names(data) == ['scarpette']
+
+    def test_search__in_stock(self):
+        resp, data = self.search(query='scarpe', limit=10, in_stock='true')
+        assert sorted(self.names(data)) == ['scarpe da ballo', 'scarpette']
+
+    def test_search__facet_counts(self):
+        resp, data = self.search(query='scarpe', limit=10, in_stock='1', facets='1')
+
+        assert resp.status_code == client.OK
+        assert sorted(self.names(data['data'])) == ['scarpe da ballo', 'scarpette']
+        assert data['meta'] == {'facets': {'category': {'calzature': 1, 'bambini': 1}}}
+
+    def test_search__facet_counts_all_pages(self):
+        for limit in (1, 2, 10):
+            resp, data = self.search(query='scarpe', limit=limit, facets='1')
+
+            assert len(data['data']) == min(limit, 3)
+            assert data['meta'] == {'facets': {'category': {'calzature': 2, 'bambini': 1}}}
+
+        resp, first = self.search(query='scarpe', limit=2, facets='1', cursor='')
+        resp, second = self.search(query='scarpe', limit=2, facets='1',
+                                   cursor=first['meta']['cursor'])
+        assert len(second['data']) == 1
+        assert second['meta']['facets'] == first['meta']['facets']
+
+    def test_search__invalid_filters(self):
+        resp, data = self.search(query='scarpe', limit=10, min_price='abc', max_price='nan')
+
+        assert resp.status_code == client.BAD_REQUEST
+        assert data == {'errors': [
+            {'detail': 'Invalid min_price: abc'},
+            {'detail': 'Invalid max_price: nan'},
+        ]}
+
+    def test_search__index_candidates_restricted(self, mocker):
+        index = search.build_index(Item)
+        scorer, scored = index.scorer, set()
+
+        def recording_scorer(query_tokens, cache):
+            score = scorer(query_tokens, cache)
+
+            def record(doc_id, attr):
+                scored.add(doc_id)
+                return score(doc_id, attr)
+            return record
+
+        mocker.patch.object(index, 'scorer', new=recording_scorer)
+        resp, data = self.search(query='scarpe', limit=10, category='bambini')
+
+        assert self.names(data) == ['scarpette']
+        assert scored == {self.items['scarpette'].id}
+
+    def test_facets__updated_by_hooks(self):
+        item = self.items['scarpe rosse']
+        self.search(query='scarpe', limit=10)
+
+        item.availability = 5
+        item.save()
+        resp, data = self.search(query='scarpe', limit=10, in_stock='true')
+        assert 'scarpe rosse' in self.names(data)
+
+        item.delete_instance()
+        resp, data = self.search(query='scarpe', limit=10, category='calzature')
+        assert self.names(data) == ['scarpe da ballo']
+
+    def test_facets__changed_by_other_worker(self):
+        self.search(query='scarpe', limit=10, category='calzature')
+        item = self.items['scarpette']
+
+        # changed by the queries of another process, without signals here
+        with Item._meta.database.transaction():
+            Item.update(category='calzature').where(Item.id == item.id).execute()
+            CatalogChange.record(Item._meta.db_table, item.id)
+        resp, data = self.search(query='scarpe', limit=10, category='calzature')
+        assert sorted(self.names(data)) == ['scarpe da ballo', 'scarpe rosse', 'scarpette']
@@ -0,0 +1,253 @@
+"""
+Test suite for the search index (:mod:`search.index`), checking that searching
+through the index returns the same results of the full scan.
+"""
+import http.client as client
+
+import pytest
+import simplejson as json
+
+from models import CatalogChange, Item
+import search
+from tests import test_utils
+from tests.test_case import TestCase
+from tests.test_utils import format_jsonapi_request
+from tests.test_searchitem import NAMES, get_names
+
+
+QUERIES = [
+    'tavolo sedie', 'tavolo', 'sedia', 'sedie', 'scarpe', 'letto',
+    'scarpette', 'scarponi', 'divano', 'legno di tavola', 'xyz', '',
+]
+
+
+class TestSearchIndex(TestCase):
+    @classmethod
+    def setup_class(cls):
+        super(TestSearchIndex, cls).setup_class()
+        Item.delete().execute()
+        for i, name in enumerate(NAMES):
+            test_utils.add_item(
+                name=name,
+                description='random description {}'.format(name),
+                category=['arredamento', 'abbigliamento', 'scarpe'][i % 3],
+            )
+        cls.index = search.build_index(Item)
+
+    def setup_method(self):
+        pass
+
+    @classmethod
+    def teardown_class(cls):
+        search.drop_index(Item)
+        Item.delete().execute()
+
+    def full_scan(self, query, limit=-1, dataset=None, **kwargs):
+        search.drop_index(Item)
+        try:
+            return Item.search(query, dataset or Item.select(), limit, **kwargs)
+        finally:
+            search.index._INDEXES[Item] = self.index
+
+    @pytest.mark.usefixtures('exact_candidates')
+    @pytest.mark.parametrize('query', QUERIES)
+    def test_index_search__same_results(self, query):
+        expected = self.full_scan(query, 10)
+        result = Item.search(query, Item.select(), 10)
+
+        assert get_names(result) == get_names(expected)
+
+    @pytest.mark.usefixtures('exact_candidates')
+    @pytest.mark.parametrize('query', QUERIES)
+    def test_index_search__high_threshold(self, query):
+        expected = self.full_scan(query, threshold=0.9)
+        result = Item.search(query, Item.select(), threshold=0.9)
+
+        assert get_names(result) == get_names(expected)
+
+    @pytest.mark.usefixtures('exact_candidates')
+    @pytest.mark.parametrize('query', QUERIES)
+    def test_index_search__low_threshold(self, query):
+        expected = self.full_scan(query, threshold=0.4)
+        result = Item.search(query, Item.select(), threshold=0.4)
+
+        assert get_names(result) == get_names(expected)
+
+    @pytest.mark.parametrize('query', QUERIES)
+    def test_index_search__ngram_candidates(self, query):
+        expected = get_names(self.full_scan(query))
+        result = get_names(Item.search(query, Item.select()))
+
+        assert result[:3] == expected[:3]
+        assert set(result) <= set(expected)
+
+    @pytest.mark.usefixtures('exact_candidates')
+    def test_index_search__list_dataset(self):
+        dataset = list(Item.select().where(Item.category == 'scarpe'))
+        expected = self.full_scan('scarpe', dataset=dataset)
+        result = Item.search('scarpe', dataset)
+
+        assert get_names(result) == get_names(expected)
+
+    def test_candidates__subset(self):
+        candidates = self.index.candidates(
+            'divano', ['name', 'category', 'description'], threshold=0.9)
+        names = get_names(Item.select().where(Item.id << list(candidates)))
+
+        assert 'divano' in names
+        assert 'divano letto' in names
+        assert len(candidates) < len(NAMES)
+
+    def test_similar_terms__typo(self):
+        assert 'scarpe' in self.index.similar_terms(['scarpa'])
+        assert 'sedie' in self.index.similar_terms(['sedia'])
+        assert 'divano' not in self.index.similar_terms(['sedia'])
+
+    def test_candidates__no_threshold(self):
+        assert self.index.candidates('divano', ['name'], threshold=0) is None
+
+    def test_candidates__not_indexed_attribute(self):
+        assert self.index.candidates('divano', ['price']) is None
+
+
+class TestSearchIndexUpdates(TestCase):
+    def setup_method(self):
+        super(TestSearchIndexUpdates, self).setup_method()
+        self.index = search.build_index(Item)
+
+    @classmethod
+    def teardown_class(cls):
+        search.drop_index(Item)
+
+    def test_create_item__indexed(self):
+        data = format_jsonapi_request('item', {
+            'name': 'scarpe da ballo',
+            'price': 20.20,
+            'description': 'scarpe rosse',
+            'availability': 1,
+            'category': 'scarpe',
+        })
+        resp = self.app.post('/items/', data=json.dumps(data),
+                             content_type='application/json')
+        assert resp.status_code == client.CREATED
+
+        item = Item.get()
+        assert len(self.index) == 1
+        assert self.index.postings['name']['ballo'] == {item.id: [1]}
+        assert self.index.postings['description']['scarpe'] == {item.id: [0]}
+
+    def test_patch_item__reindexed(self):
+        item = test_utils.add_item(name='scarpe da ballo', description='rosse')
+        data = format_jsonapi_request('item', {'name': 'divano letto'})
+        resp = self.app.patch('/items/{}'.format(item.uuid), data=json.dumps(data),
+                              content_type='application/json')
+        assert resp.status_code == client.OK
+
+        assert 'ballo' not in self.index.postings['name']
+        assert self.index.postings['name']['divano'] == {item.id: [0]}
+        assert get_names(Item.search('divano', Item.select())) == ['divano letto']
+
+    def test_delete_item__removed(self):
+        item = test_utils.add_item(name='scarpe da ballo')
+        other = test_utils.add_item(name='scarpe da ginnastica')
+
+        resp = self.app.delete('/items/{}'.format(item.uuid))
+        assert resp.status_code == client.NO_CONTENT
+
+        assert item.id not in self.index
+        assert self.index.postings['name']['scarpe'] == {other.id: [0]}
+        assert 'ballo' not in self.index.postings['name']
+
+    def test_remove__missing_document(self):
+        self.index.remove(12345)
+        assert len(self.index) == 0
+
+    def test_other_worker_changes__reindexed(self):
+        item = test_utils.add_item(name='scarpe da ballo')
+        other = test_utils.add_item(name='scarpe da ginnastica')
+        Item.sync_search()
+
+        # changed by the queries of another process, without signals here
+        with Item._meta.database.transaction():
+            Item.update(name='divano letto').where(Item.id == item.id).execute()
+            CatalogChange.record(Item._meta.db_table, item.id)
+        assert get_names(Item.search('divano', Item.select())) == ['divano letto']
+        assert self.index.postings['name']['divano'] == {item.id: [0]}
+
+        with Item._meta.database.transaction():
+            Item.delete().where(Item.id == other.id).execute()
+            CatalogChange.record(Item._meta.db_table, other.id)
+        assert get_names(Item.search('scarpe', Item.select())) == []
+        assert other.id not in self.index
+
+
+class TestSearchResultCache(TestCase):
+    def setup_method(self):
+        super(TestSearchResultCache, self).setup_method()
+        for name in ['scarpe da ballo', 'scarpe rosse', 'divano letto']:
+            test_utils.add_item(name=name, description='random description', category='')
+
+    def enable_cache(self, mocker):
+        mocker.patch.object(search.config, 'RESULT_CACHE_SIZE', 10)
+        return mocker.spy(Item, '_search')
+
+    def test_search__cached(self, mocker):
+        spy = self.enable_cache(mocker)
+        expected = get_names(Item.search('scarpe', Item.select(), 10))
+        result = get_names(Item.search('  SCARPE ', Item.select(), 10))
+
+        assert result == expected == ['scarpe rosse', 'scarpe da ballo']
+        assert spy.call_count == 1
+
+    def test_search__different_arguments(self, mocker):
+        spy = self.enable_cache(mocker)
+        Item.search('scarpe', Item.select(), 10)
+        Item.search('scarpe', Item.select(), 1)
+        Item.search('scarpe', Item.select(), 10, threshold=0.5)
+        Item.search('scarpe', Item.select().where(Item.name != 'scarpe rosse'), 10)
+
+        assert spy.call_count == 4
+
+    def test_search__list_dataset_not_cached(self, mocker):
+        spy = self.enable_cache(mocker)
+        Item.search('scarpe', list(Item.select()), 10)
+        Item.search('scarpe', list(Item.select()), 10)
+
+        assert spy.call_count == 2
+
+    def test_save_item__invalidates(self, mocker):
+        spy = self.enable_cache(mocker)
+        Item.search('scarpe', Item.select(), 10)
+
+        item = test_utils.add_item(name='scarpe', description='random description', category='')
+        assert get_names(Item.search('scarpe', Item.select(), 10))[0] == 'scarpe'
+
+        item.delete_instance()
+        assert 'scarpe' not in get_names(Item.search('scarpe', Item.select(), 10))
+        assert spy.call_count == 3
+
+    def test_catalog_version__counter(self):
+        version = Item.catalog_version()
+        item = test_utils.add_item(name='scarpe', description='random description', category='')
+        assert Item.catalog_version() == version + 1
+
+        item.delete_instance()
+        assert Item.catalog_version() == version + 2
+
+    def test_other_worker_changes__invalidate(self, mocker):
+        spy = self.enable_cache(mocker)
+        Item.search('scarpe', Item.select(), 10)
+
+        # changed by the queries of another process, without signals here
+        item = Item.get(Item.name == 'scarpe rosse')
+        with Item._meta.database.transaction():
+            Item.update(name='divano').where(Item.id == item.id).execute()
+            CatalogChange.record(Item._meta.db_table, item.id)
+        assert get_names(Item.search('scarpe', Item.select(), 10)) == ['scarpe da ballo']
+
+        item = Item.get(Item.name == 'scarpe da ballo')
+        with Item._meta.database.transaction():
+            Item.delete().where(Item.id == item.id).execute()
+            CatalogChange.record(Item._meta.db_table, item.id)
+        assert get_names(Item.search('scarpe', Item.select(), 10)) == []
+        assert spy.call_count == 3
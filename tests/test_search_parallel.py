@@ -0,0 +1,99 @@
+"""
+Test suite for the parallel search mode (:mod:`search.parallel`), that must
+return the same results of the serial one.
+"""
+import pytest
+
+from models import Item
+import search
+from search import parallel
+from tests import test_utils
+from tests.test_case import TestCase
+from tests.test_search_index import QUERIES
+from tests.test_searchitem import NAMES, get_names
+
+
+@pytest.fixture
+def parallel_mode(mocker):
+    mocker.patch.object(search.config, 'PARALLEL_WORKERS', 2)
+    mocker.patch.object(search.config, 'PARALLEL_MIN_DOCUMENTS', 1)
+
+
+class TestParallelSearch(TestCase):
+    @classmethod
+    def setup_class(cls):
+        super(TestParallelSearch, cls).setup_class()
+        Item.delete().execute()
+        for name in NAMES:
+            test_utils.add_item(name=name, description='random description',
+                                category='arredamento')
+        cls.index = search.build_index(Item)
+
+    def setup_method(self):
+        pass
+
+    @classmethod
+    def teardown_class(cls):
+        parallel.shutdown()
+        search.drop_index(Item)
+        Item.delete().execute()
+
+    @pytest.mark.parametrize('query', QUERIES)
+    @pytest.mark.parametrize('limit', [-1, 3, 10])
+    def test_parallel_search__same_results(self, mocker, query, limit):
+        expected = self.index.search(query, Item._search_attributes, limit=limit)
+
+        mocker.patch.object(search.config, 'PARALLEL_WORKERS', 2)
+        mocker.patch.object(search.config, 'PARALLEL_MIN_DOCUMENTS', 1)
+        spy = mocker.spy(parallel, 'search')
+        result = self.index.search(query, Item._search_attributes, limit=limit)
+
+        assert result == expected
+        assert spy.called == bool(self.index.candidates(query, Item._search_attributes))
+
+    @pytest.mark.usefixtures('parallel_mode')
+    def test_parallel_search__index_updated(self):
+        assert get_names(Item.search('poltrona', Item.select(), 1)) == ['poltrona']
+        pool = parallel._pool
+
+        item = Item.get(Item.name == 'divano')
+        item.name = 'poltroncina'
+        item.save()
+        added = test_utils.add_item(name='poltroncina blu', description='random description',
+                                    category='arredamento')
+
+        # the changes are sent to the processes of the same pool
+        assert get_names(Item.search('poltroncina', Item.select(), 2)) == [
+            'poltroncina', 'poltroncina blu']
+        assert parallel._pool is pool
+
+        added.delete_instance()
+        item.name = 'divano'
+        item.save()
+        assert get_names(Item.search('poltroncina', Item.select(), 1)) == ['poltrona']
+        assert parallel._pool is pool
+
+    @pytest.mark.usefixtures('parallel_mode')
+    def test_parallel_search__too_many_changes(self, mocker):
+        mocker.patch.object(search.config, 'PARALLEL_MAX_CHANGES', 1)
+        assert get_names(Item.search('poltrona', Item.select(), 1)) == ['poltrona']
+        pool = parallel._pool
+
+        for name in ['divano', 'poltrona']:
+            item = Item.get(Item.name == name)
+            item.name = name + ' nuovo'
+            item.save()
+            item.name = name
+            item.save()
+
+        assert get_names(Item.search('poltrona', Item.select(), 1)) == ['poltrona']
+        assert parallel._pool is not pool
+        assert not parallel._changed
+
+    @pytest.mark.usefixtures('parallel_mode')
+    def test_parallel_search__not_forked(self, mocker):
+        mocker.patch.object(parallel.multiprocessing, 'get_start_method', return_value='spawn')
+        spy = mocker.spy(parallel, 'search')
+
+        assert get_names(Item.search('poltrona', Item.select(), 1)) == ['poltrona']
+        assert not spy.called
@@ -0,0 +1,296 @@
+"""
+Test suite for the popularity of the items (:mod:`search.popularity`) and its
+blending into the search ranking.
+"""
+from array import array
+import random
+import time
+
+import pytest
+
+from models import CatalogChange, Favorite, Item, Order
+import search
+from search import core, parallel, popularity
+from search.popularity import PopularityTable
+from tests import test_utils
+from tests.test_case import TestCase
+from tests.test_search_index import QUERIES
+from tests.test_search_vectorized import ATTRIBUTES, make_index
+from tests.test_searchitem import NAMES, get_names
+from tests.test_utils import mock_datetime
+
+DAY = 24 * 60 * 60
+
+
+def random_boosts(size, seed=3):
+    rnd = random.Random(seed)
+    return array('d', (1 + rnd.random() for _ in range(size)))
+
+
+def blended(matches, boosts):
+    """Rank the matches by text with their boost, as a reference."""
+    results = [(key, match * (boosts[key] if key < len(boosts) else 1))
+               for key, match in matches]
+    return sorted(results, key=lambda m: (-m[1], m[0]))
+
+
+@pytest.fixture
+def weight(mocker):
+    mocker.patch.object(search.config, 'POPULARITY_WEIGHT', 1)
+
+
+def test_table__counters(mocker):
+    mocker.patch.object(search.config, 'POPULARITY_SCALE', 10)
+    table = PopularityTable()
+    now = time.time()
+
+    table.add_sale(3, 2, now - 60 * DAY)
+    table.add_sale(3, 1, now - DAY)
+    table.add_favorite(3)
+    table.add_favorite(5, 2)
+
+    assert len(table) == 6
+    assert list(table.units) == [0, 0, 0, 3, 0, 0]
+    assert list(table.recent) == [0, 0, 0, 1, 0, 0]
+    assert list(table.favorites) == [0, 0, 0, 1, 0, 2]
+    # 3 units, 1 recent (counting twice more) and a favorite
+    assert table.popularity(3) == 6 / 16
+    assert table.popularity(0) == table.popularity(100) == 0
+
+    table.expire(now + 30 * DAY)
+    assert table.recent[3] == 0 and not table.window
+    assert table.popularity(3) == 4 / 14
+
+
+def test_table__reset():
+    table = PopularityTable()
+    now = time.time()
+    table.add_sale(3, 2, now - DAY)
+    table.add_sale(4, 1, now - DAY)
+
+    # counted again, the sales already in the window are replaced
+    table.reset(3, 5, [(2, now - DAY), (1, now - 2 * DAY)], 4)
+    assert (table.units[3], table.recent[3], table.favorites[3]) == (5, 3, 4)
+    sales = [(2, now - DAY), (1, now - 2 * DAY)]
+    table.reset(3, 5, sales, 4)
+    assert len(table.window) == 6 and table.stale == 3
+    # the old sales are dropped once they are most of the window
+    table.reset(3, 5, sales, 4)
+    assert len(table.window) == 3 and table.stale == 0
+
+    table.expire(now + 30 * DAY)
+    assert table.recent[3] == table.recent[4] == 0
+    assert not table.window and table.stale == 0
+
+
+def test_table__boosts(mocker):
+    table = PopularityTable()
+    table.add_sale(1, 20, time.time())
+    assert table.boosts() is None
+
+    mocker.patch.object(search.config, 'POPULARITY_WEIGHT', 0.5)
+    boosts = table.boosts()
+    assert boosts[0] == 1
+    assert boosts[1] == 1 + 0.5 * table.popularity(1)
+
+    table.add_favorite(0)
+    assert boosts[0] == 1 + 0.5 * table.popularity(0)
+
+
+@pytest.mark.parametrize('limit', [-1, 1, 5, 20])
+def test_search_matches__boosted(limit):
+    objects = [Item(id=i, name=name, category='', description='') for i, name in enumerate(NAMES)]
+    boosts = random_boosts(len(NAMES) - 5)
+    key = lambda obj: obj.id  # noqa: E731
+
+    for query in QUERIES:
+        matches = core.search_matches(query, ['name'], objects, threshold=0.5, key=key)
+        expected = blended([(obj.id, match) for obj, match in matches], boosts)
+        if limit > 0:
+            expected = expected[:limit]
+
+        results = core.search_matches(query, ['name'], objects, limit, threshold=0.5, key=key,
+                                      boosts=boosts)
+        assert [(obj.id, match) for obj, match in results] == expected
+
+
+@pytest.mark.parametrize('engine', ['python', 'numpy'])
+@pytest.mark.parametrize('limit', [-1, 5])
+def test_index_search__boosted(mocker, engine, limit):
+    mocker.patch.object(search.config, 'ENGINE', engine)
+    index = make_index()
+    boosts = random_boosts(250)
+
+    for query in QUERIES:
+        expected = blended(index.search(query, ATTRIBUTES, threshold=0.5), boosts)
+        if limit > 0:
+            expected = expected[:limit]
+
+        results = index.search(query, ATTRIBUTES, threshold=0.5, limit=limit, boosts=boosts)
+        assert [doc_id for doc_id, _ in results] == [doc_id for doc_id, _ in expected]
+        assert [m for _, m in results] == pytest.approx([m for _, m in expected])
+
+
+def test_index_batch_search__boosted():
+    index = make_index()
+    boosts = random_boosts(300)
+
+    assert index.batch_search(QUERIES, ATTRIBUTES, limit=5, boosts=boosts) == [
+        index.search(query, ATTRIBUTES, limit=5, boosts=boosts) for query in QUERIES
+    ]
+
+
+def test_parallel_search__boosted(mocker):
+    index = make_index()
+    boosts = random_boosts(300)
+    expected = index.search('tavolo sedie', ATTRIBUTES, threshold=0.4, limit=10, boosts=boosts)
+
+    mocker.patch.object(search.config, 'PARALLEL_WORKERS', 2)
+    mocker.patch.object(search.config, 'PARALLEL_MIN_DOCUMENTS', 1)
+    try:
+        assert index.search('tavolo sedie', ATTRIBUTES, threshold=0.4, limit=10,
+                            boosts=boosts) == expected
+    finally:
+        parallel.shutdown()
+
+
+def counters(table, ids):
+    return [[getattr(table, name)[i] if i < len(table) else 0 for i in ids]
+            for name in ('units', 'recent', 'favorites')]
+
+
+class TestItemsPopularity(TestCase):
+    @pytest.fixture(autouse=True)
+    def clock(self, mocker):
+        # orders are created at a fixed date, see the mock_create fixture
+        now = mock_datetime().timestamp() + DAY
+        mocker.patch.object(popularity, 'time', mocker.Mock(time=lambda: now))
+
+    def setup_method(self):
+        super(TestItemsPopularity, self).setup_method()
+        # read back from the database, with decimal prices
+        self.items = [
+            Item.get(Item.id == test_utils.add_item(name=name, category='',
+                                                    description='random').id)
+            for name in ['scarpe da ballo', 'scarpe rosse', 'scarpe verdi', 'divano']
+        ]
+        self.user = test_utils.add_user('user@email.com', 'password')
+        self.address = test_utils.add_address(self.user)
+
+    def teardown_method(self):
+        popularity.drop_table(Item)
+        search.drop_index(Item)
+
+    def order(self, *items):
+        return Order.create_order(self.user, self.address, {item: 2 for item in items})
+
+    def test_build_popularity(self):
+        old = self.order(self.items[0], self.items[1])
+        old.created_at = old.created_at.replace(year=old.created_at.year - 1)
+        old.save()
+        self.order(self.items[1])
+        Favorite.create(uuid='1' * 32, user=self.user, item=self.items[2])
+
+        table = Item.build_popularity()
+        ids = [item.id for item in self.items]
+
+        assert popularity.get_table(Item) is table
+        assert counters(table, ids) == [[2, 4, 0, 0], [0, 2, 0, 0], [0, 0, 1, 0]]
+
+    def test_orders__update_table(self):
+        table = Item.build_popularity()
+        first, second = self.items[0], self.items[1]
+
+        order = self.order(first)
+        assert Item.sync_popularity()
+        assert table.units[first.id] == table.recent[first.id] == 2
+
+        order.update_items({first: 5, second: 1})
+        Item.sync_popularity()
+        assert table.units[first.id] == 5 and table.units[second.id] == 1
+
+        order.update_items({second: 0})
+        Item.sync_popularity()
+        assert table.units[second.id] == 0
+
+        order.empty_order()
+        Item.sync_popularity()
+        assert table.units[first.id] == 0
+        assert not Item.sync_popularity()
+
+        order = self.order(first, second)
+        Item.sync_popularity()
+        order.delete_instance(recursive=True)
+        Item.sync_popularity()
+        assert table.units[first.id] == table.units[second.id] == 0
+        assert table.recent[first.id] == 0
+
+    def test_favorites__update_table(self):
+        table = Item.build_popularity()
+        item = self.items[3]
+
+        favorite = self.user.add_favorite(item)
+        Item.sync_popularity()
+        assert table.favorites[item.id] == 1
+
+        favorite.delete_instance()
+        Item.sync_popularity()
+        assert table.favorites[item.id] == 0
+
+    @pytest.mark.usefixtures('weight')
+    def test_other_worker__same_ranking(self, mocker):
+        mocker.patch.object(search.config, 'RESULT_CACHE_SIZE', 10)
+        table = Item.build_popularity()
+        assert get_names(Item.search('scarpe', Item.select()))[0] != 'scarpe verdi'
+
+        # favorites added by the queries of another process, without signals here
+        item = self.items[2]
+        with Item._meta.database.transaction():
+            Favorite.insert_many([
+                {'uuid': str(i) * 32, 'user': self.user, 'item': item} for i in range(3)
+            ]).execute()
+            CatalogChange.record(Item._popularity_version, item.id)
+        assert get_names(Item.search('scarpe', Item.select()))[0] == 'scarpe verdi'
+        assert table.favorites[item.id] == 3
+
+    @pytest.mark.usefixtures('weight')
+    @pytest.mark.parametrize('indexed', [False, True])
+    def test_search__sold_items_first(self, indexed):
+        if indexed:
+            search.build_index(Item)
+        Item.build_popularity()
+        names = get_names(Item.search('scarpe', Item.select()))
+        assert names[0] == 'scarpe rosse'
+
+        self.order(self.items[2])
+        assert get_names(Item.search('scarpe', Item.select()))[0] == 'scarpe verdi'
+
+        # favorites too change the ranking, also of the cached results
+        # 2 recent units count as 6, more than 6 favorites are needed
+        for i in range(7):
+            user = test_utils.add_user('user{}@email.com'.format(i), 'password')
+            user.add_favorite(self.items[1])
+        assert get_names(Item.search('scarpe', Item.select()))[0] == 'scarpe rosse'
+        assert get_names(Item.search('divano', Item.select())) == ['divano']
+
+    @pytest.mark.usefixtures('weight')
+    def test_search__cached_results_reranked(self, mocker):
+        mocker.patch.object(search.config, 'RESULT_CACHE_SIZE', 10)
+        old = Order.create_order(self.user, self.address, {self.items[1]: 4})
+        old.created_at = old.created_at.replace(year=old.created_at.year - 1)
+        old.save()
+        Item.build_popularity()
+        recent = self.order(self.items[2])
+        assert get_names(Item.search('scarpe', Item.select()))[0] == 'scarpe verdi'
+
+        # the returned units change no item
+        recent.empty_order()
+        assert get_names(Item.search('scarpe', Item.select()))[0] == 'scarpe rosse'
+
+        self.order(self.items[2])
+        assert get_names(Item.search('scarpe', Item.select()))[0] == 'scarpe verdi'
+
+        # the recent sales leave the window
+        later = popularity.time.time() + (search.config.POPULARITY_WINDOW_DAYS + 1) * DAY
+        mocker.patch.object(popularity, 'time', mocker.Mock(time=lambda: later))
+        assert get_names(Item.search('scarpe', Item.select()))[0] == 'scarpe rosse'
@@ -0,0 +1,81 @@
+"""
+Test suite for the bounded top-k ranking of the search engine
+(:func:`search.core.rank`)
+"""
+import random
+
+from search import utils
+from search.core import rank
+
+ATTRIBUTES = ['name', 'category', 'description']
+WEIGHTS = utils.attribute_weights(ATTRIBUTES)
+
+
+def make_documents(count, seed=42):
+    rnd = random.Random(seed)
+    return [
+        # scores rounded to get some matching documents
+        {attr: round(rnd.random(), 1) for attr in ATTRIBUTES}
+        for _ in range(count)
+    ]
+
+
+def full_sort(documents, threshold=0):
+    """Reference ranking: score everything, then sort."""
+    matches = []
+    for key, doc in enumerate(documents):
+        attr = max(ATTRIBUTES, key=lambda a: doc[a])
+        match = doc[attr] * WEIGHTS[attr]
+        if match >= threshold:
+            matches.append((key, match))
+    matches.sort(key=lambda m: m[1], reverse=True)
+    return matches
+
+
+def test_rank__same_as_full_sort():
+    documents = make_documents(500)
+    expected = full_sort(documents, threshold=0.3)
+
+    def score(key, attr):
+        return documents[key][attr]
+
+    for limit in [-1, 1, 5, 10, 100, 1000]:
+        result = rank(((k, k) for k in range(len(documents))),
+                      ATTRIBUTES, WEIGHTS, score, limit, 0.3)
+
+        expected_limit = expected[:limit] if limit > 0 else expected
+        assert [(key, match) for key, match in result] == expected_limit
+
+
+def test_rank__prunes_attributes():
+    documents = [{'name': 1, 'category': 0, 'description': 0}] * 3
+    documents += [{'name': 0.9, 'category': 1, 'description': 1}] * 100
+    calls = []
+
+    def score(key, attr):
+        calls.append(attr)
+        return documents[key][attr]
+
+    result = rank(((k, k) for k in range(len(documents))),
+                  ATTRIBUTES, WEIGHTS, score, limit=3)
+
+    assert [key for key, _ in result] == [0, 1, 2]
+    # once the top 3 documents have a match of 1 no other document can beat
+    # them after its name is scored, since the other attributes are lighter.
+    assert calls[:9] == ATTRIBUTES * 3
+    assert calls[9:] == ['name'] * 100
+
+
+def test_rank__threshold_prunes_lighter_attributes():
+    documents = [{'name': 0.5, 'category': 1, 'description': 1}]
+    calls = []
+
+    def score(key, attr):
+        calls.append(attr)
+        return documents[key][attr]
+
+    result = rank([(0, 0)], ATTRIBUTES, WEIGHTS, score, threshold=0.75)
+
+    assert result == []
+    # category and description weights are lower than the threshold
+    assert calls == ['name']
@@ -0,0 +1,164 @@
+"""
+Test suite for the search index shared by the application processes
+(:mod:`search.shared`).
+"""
+import os
+from unittest import mock
+
+import pytest
+
+import models
+from models import Item
+import search
+from search import shared
+from search.index import _INDEXES
+from search.snapshot import SnapshotIndex
+import gunicorn_config
+from tests import test_utils
+from tests.test_case import TestCase
+from tests.test_searchitem import get_names
+
+
+@pytest.fixture(name='directory')
+def shared_directory(tmpdir):
+    yield str(tmpdir.join('shared'))
+    shared.detach(Item)
+
+
+def test_generation__shared_by_mappings(tmpdir):
+    path = str(tmpdir.join('item.generation'))
+    first, second = shared.Generation(path), shared.Generation(path)
+    assert first.value == 0
+
+    first.value = 3
+    assert second.value == 3
+
+    pid = os.fork()
+    if pid == 0:
+        shared.Generation(path).value = 4
+        os._exit(0)
+    os.waitpid(pid, 0)
+    assert first.value == second.value == 4
+
+
+class TestSharedIndex(TestCase):
+    def setup_method(self):
+        super(TestSharedIndex, self).setup_method()
+        for name in ['scarpe da ballo', 'scarpe rosse', 'divano letto']:
+            test_utils.add_item(name=name, category='', description='random')
+
+    @classmethod
+    def teardown_class(cls):
+        search.drop_index(Item)
+
+    def test_publish__next_generation(self, directory):
+        assert shared.publish(Item, directory) == 1
+        assert shared.publish(Item, directory) == 2
+        assert shared.publish(Item, directory) == 3
+
+        # only the last two generations are kept
+        assert sorted(os.listdir(directory)) == ['item.2.idx', 'item.3.idx', 'item.generation']
+        assert len(SnapshotIndex(shared.snapshot_path(directory, Item, 3))) == 3
+
+    def test_attach__publishes_first_generation(self, directory):
+        index = shared.attach(Item, directory)
+
+        assert search.get_index(Item) is index
+        assert index.path == shared.snapshot_path(directory, Item, 1)
+        assert sorted(get_names(Item.search('scarpe', Item.select()))) == [
+            'scarpe da ballo', 'scarpe rosse']
+
+    def test_refresh__new_generation(self, directory):
+        shared.publish(Item, directory)
+        index = shared.refresh(Item, directory)
+        assert shared.refresh(Item, directory) is index
+        assert index.path == shared.snapshot_path(directory, Item, 1)
+
+        test_utils.add_item(name='scarpe nuove', category='', description='random')
+        assert set(index.changes) == {Item.get(Item.name == 'scarpe nuove').id}
+
+        # published by another process
+        pid = os.fork()
+        if pid == 0:
+            with mock.patch.object(shared, '_ATTACHED', {}):
+                shared.publish(Item, directory)
+            os._exit(0)
+        os.waitpid(pid, 0)
+
+        refreshed = shared.refresh(Item, directory)
+        assert refreshed is not index
+        assert refreshed.path == shared.snapshot_path(directory, Item, 2)
+        assert not refreshed.changes
+        assert sorted(get_names(Item.search('scarpe', Item.select()))) == [
+            'scarpe da ballo', 'scarpe nuove', 'scarpe rosse']
+
+    def test_refresh__index_dropped(self, directory):
+        index = shared.refresh(Item, directory)
+        search.drop_index(Item)
+
+        assert shared.refresh(Item, directory) is not index
+        assert search.get_index(Item) is not None
+
+    def test_change__seen_by_other_workers(self, directory, mocker):
+        threads = []
+        mocker.patch.object(shared.threading, 'Thread', side_effect=lambda target, **kwargs: (
+            threads.append(target) or mock.Mock()))
+        mocker.patch.object(Item._meta.database, 'execution_context', mock.MagicMock())
+
+        # two workers, each with its own index of the first generation
+        other_worker = {}, {}
+        with mock.patch.object(shared, '_ATTACHED', other_worker[0]), \
+                mock.patch.object(models, '_SYNCED_VERSIONS', other_worker[1]), \
+                mock.patch.dict(_INDEXES):
+            other = shared.refresh(Item, directory)
+            Item.sync_search()
+        index = shared.refresh(Item, directory)
+        assert index is not other
+
+        item = Item.get(Item.name == 'scarpe rosse')
+        item.name = 'divano rosso'
+        item.save()
+        test_utils.add_item(name='scarpe nuove', category='', description='random')
+        assert shared.refresh(Item, directory) is index
+        # nothing published for the changes
+        assert not threads
+
+        with mock.patch.object(shared, '_ATTACHED', other_worker[0]), \
+                mock.patch.object(models, '_SYNCED_VERSIONS', other_worker[1]), \
+                mock.patch.dict(_INDEXES, {Item: other}):
+            assert shared.refresh(Item, directory) is other
+            assert sorted(get_names(Item.search('scarpe', Item.select()))) == [
+                'scarpe da ballo', 'scarpe nuove']
+            assert get_names(Item.search('divano rosso', Item.select(), 1)) == [
+                'divano rosso']
+            assert set(other.changes) == set(index.changes)
+
+        # past the threshold the first worker publishes the next generation
+        mocker.patch.object(search.config, 'SNAPSHOT_MAX_CHANGES', 1)
+        shared.refresh(Item, directory)
+        with mock.patch.object(shared, '_ATTACHED', other_worker[0]), \
+                mock.patch.object(shared, '_PENDING', {}), \
+                mock.patch.dict(_INDEXES, {Item: other}):
+            shared.refresh(Item, directory)
+        assert len(threads) == 2
+        for run in threads:
+            run()
+
+        generation = shared.Generation(shared.generation_path(directory, Item))
+        assert generation.value == 2
+        refreshed = shared.refresh(Item, directory)
+        assert refreshed.path == shared.snapshot_path(directory, Item, 2)
+        assert not refreshed.changes
+
+    def test_gunicorn_on_starting(self, directory, mocker):
+        server = mock.Mock()
+        gunicorn_config.on_starting(server)
+        assert not os.path.exists(directory)
+
+        mocker.patch.object(search.config, 'SHARED_INDEX_DIR', directory)
+        mocker.patch.object(Item._meta.database, 'execution_context', mock.MagicMock())
+        gunicorn_config.on_starting(server)
+
+        generation = shared.Generation(shared.generation_path(directory, Item))
+        assert generation.value == 1
+        assert server.log.info.called
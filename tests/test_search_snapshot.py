@@ -0,0 +1,241 @@
+"""
+Test suite for the memory mapped search index snapshots (:mod:`search.snapshot`),
+checking that searching through a snapshot returns the same results of the
+index it was written from.
+"""
+import pytest
+
+from models import CatalogChange, Item
+import search
+from search import snapshot
+from search.snapshot import SnapshotIndex
+from tests import test_utils
+from tests.test_case import TestCase
+from tests.test_search_index import QUERIES
+from tests.test_search_vectorized import ATTRIBUTES, make_index
+from tests.test_searchitem import get_names
+
+
+@pytest.fixture(name='path')
+def snapshot_path(tmpdir):
+    return str(tmpdir.join('index.snapshot'))
+
+
+def load(index, path):
+    snapshot.write_snapshot(index, path)
+    return SnapshotIndex(path)
+
+
+@pytest.mark.parametrize('query', QUERIES + ['rosso legno cucina', 'sedia rosa'])
+@pytest.mark.parametrize('threshold', [0.4, 0.75])
+def test_search__same_results(path, query, threshold):
+    index = make_index()
+    mapped = load(index, path)
+
+    assert len(mapped) == len(index)
+    assert mapped.similar_terms([query]) == index.similar_terms([query])
+    assert (mapped.search(query, ATTRIBUTES, threshold=threshold) ==
+            index.search(query, ATTRIBUTES, threshold=threshold))
+
+
+@pytest.mark.usefixtures('exact_candidates')
+@pytest.mark.parametrize('engine', ['python', 'numpy'])
+def test_search__exact_candidates(path, mocker, engine):
+    mocker.patch.object(search.config, 'ENGINE', engine)
+    index = make_index()
+    mapped = load(index, path)
+
+    for query in QUERIES:
+        assert (mapped.search(query, ATTRIBUTES, limit=10) ==
+                index.search(query, ATTRIBUTES, limit=10))
+
+
+def test_store__read_only(path):
+    index = make_index()
+    mapped = load(index, path)
+
+    assert mapped.store.tokens_of(42) == index.store.tokens_of(42)
+    assert 42 in mapped.store and 1000 not in mapped.store
+    with pytest.raises(TypeError):
+        mapped.store.add(1000, [[], [], []])
+
+
+def test_overlay__same_results(path):
+    index = make_index()
+    mapped = load(index, path)
+    changes = [
+        (1000, {'name': 'sedia rossa', 'category': 'arredamento', 'description': ''}),
+        (3, {'name': 'tavolo di legno', 'category': '', 'description': 'cucina'}),
+        (4, None),
+        (1001, None),
+    ]
+    for doc_id, values in changes:
+        for target in (index, mapped):
+            if values is None:
+                target.remove(doc_id)
+            else:
+                target.add(doc_id, values)
+
+    assert len(mapped) == len(index)
+    assert 1000 in mapped and 4 not in mapped and 3 in mapped
+    for query in QUERIES + ['sedia rossa', 'tavolo legno cucina']:
+        for limit in (-1, 3):
+            assert (mapped.search(query, ATTRIBUTES, limit=limit) ==
+                    index.search(query, ATTRIBUTES, limit=limit))
+    assert mapped.search('tavolo', ATTRIBUTES, doc_ids={3, 4}) == \
+        index.search('tavolo', ATTRIBUTES, doc_ids={3, 4})
+    assert (mapped.batch_search(QUERIES, ATTRIBUTES, limit=3) ==
+            index.batch_search(QUERIES, ATTRIBUTES, limit=3))
+
+
+def test_overlay__unchanged_tokens(path):
+    index = make_index()
+    mapped = load(index, path)
+    values = dict(zip(ATTRIBUTES, (' '.join(tokens) for tokens in index.store.tokens_of(3))))
+
+    mapped.add(3, values)
+    mapped.add(3, dict(values, name=values['name'].upper()))
+    assert not mapped.changes and not mapped.hidden
+    assert mapped.generation == 0
+
+    mapped.add(3, dict(values, name='tavolo'))
+    mapped.add(3, dict(values, name='tavolo'))
+    assert list(mapped.changes) == [3] and mapped.generation == 1
+
+
+def test_replace__old_mapping_still_valid(path):
+    index = make_index()
+    old = load(index, path)
+    expected = old.search('tavolo', ATTRIBUTES)
+
+    index.remove(0)
+    new = load(index, path)
+
+    assert new.identity != old.identity
+    assert old.search('tavolo', ATTRIBUTES) == expected
+    assert new.search('tavolo', ATTRIBUTES) == index.search('tavolo', ATTRIBUTES)
+
+
+def test_read__invalid_file(tmpdir):
+    path = tmpdir.join('invalid')
+    path.write(b'x' * 64, mode='wb')
+
+    with pytest.raises(ValueError):
+        SnapshotIndex(str(path))
+
+
+def test_replay__changes_after_snapshot(path):
+    index = make_index()
+    old = load(index, path)
+    old.remove(1)
+    old.created = old.changes[1][0]
+    old.remove(2)
+
+    snapshot.write_snapshot(index, path, created=old.changes[1][0] + 1e-6)
+    new = SnapshotIndex(path)
+    new.replay(old.changes)
+
+    assert list(new.changes) == [2]
+    assert 1 in new and 2 not in new
+
+
+class TestSnapshotItems(TestCase):
+    def setup_method(self):
+        super(TestSnapshotItems, self).setup_method()
+        for name in ['scarpe da ballo', 'scarpe rosse', 'divano letto']:
+            test_utils.add_item(name=name, category='', description='random')
+
+    @classmethod
+    def teardown_class(cls):
+        search.drop_index(Item)
+
+    def test_load_snapshot__used_by_search(self, path):
+        snapshot.build_snapshot(Item, path)
+        index = snapshot.load_snapshot(Item, path)
+
+        assert search.get_index(Item) is index
+        assert sorted(get_names(Item.search('scarpe', Item.select()))) == [
+            'scarpe da ballo', 'scarpe rosse']
+
+    def test_item_changes__in_overlay(self, path):
+        index = snapshot.open_snapshot(Item, path)
+        item = Item.get(Item.name == 'scarpe rosse')
+        item.name = 'divano rosso'
+        item.save()
+        test_utils.add_item(name='scarpe nuove', category='', description='random')
+
+        assert set(index.changes) == {item.id, Item.get(Item.name == 'scarpe nuove').id}
+        assert sorted(get_names(Item.search('scarpe', Item.select()))) == [
+            'scarpe da ballo', 'scarpe nuove']
+
+        snapshot.rebuild_snapshot(Item, path, background=False)
+        rebuilt = search.get_index(Item)
+        assert rebuilt is not index
+        assert sorted(get_names(Item.search('scarpe', Item.select()))) == [
+            'scarpe da ballo', 'scarpe nuove']
+        assert not rebuilt.changes
+
+    def test_item_saved__tokens_unchanged(self, path):
+        index = snapshot.open_snapshot(Item, path)
+        item = Item.get(Item.name == 'scarpe rosse')
+        item.availability += 1
+        item.save()
+
+        assert not index.changes and index.generation == 0
+
+    def test_reload_snapshot__file_replaced(self, path, mocker):
+        snapshot.build_snapshot(Item, path)
+        index = snapshot.reload_snapshot(Item, path)
+        assert snapshot.reload_snapshot(Item, path) is index
+
+        test_utils.add_item(name='scarpe nuove', category='', description='random')
+        snapshot.build_snapshot(Item, path)
+        reloaded = snapshot.reload_snapshot(Item, path)
+        assert reloaded is not index
+        assert not reloaded.changes
+
+        rebuild = mocker.patch.object(snapshot, 'rebuild_snapshot')
+        mocker.patch.object(search.config, 'SNAPSHOT_MAX_CHANGES', 0)
+        Item.get(Item.name == 'scarpe nuove').delete_instance()
+        snapshot.reload_snapshot(Item, path)
+        rebuild.assert_called_once_with(Item, path, lock=mocker.ANY)
+
+    def test_reload_snapshot__rebuilt_by_other_process(self, path, mocker):
+        index = snapshot.open_snapshot(Item, path)
+        Item.get(Item.name == 'scarpe rosse').delete_instance()
+
+        rebuild = mocker.patch.object(snapshot, 'rebuild_snapshot')
+        mocker.patch.object(search.config, 'SNAPSHOT_MAX_CHANGES', 0)
+        lock = snapshot._try_lock(path)
+        assert snapshot.reload_snapshot(Item, path) is index
+        assert not rebuild.called
+
+        lock.close()
+        snapshot.reload_snapshot(Item, path)
+        assert rebuild.called
+
+    def test_other_worker_changes__in_overlay(self, path):
+        index = snapshot.open_snapshot(Item, path)
+        assert index.version == Item.catalog_version()
+        Item.sync_search()
+
+        # changed by the queries of another process, without signals here
+        item = Item.get(Item.name == 'scarpe rosse')
+        with Item._meta.database.transaction():
+            Item.update(name='divano rosso').where(Item.id == item.id).execute()
+            CatalogChange.record(Item._meta.db_table, item.id)
+        assert get_names(Item.search('scarpe', Item.select())) == ['scarpe da ballo']
+        assert set(index.changes) == {item.id}
+
+    def test_open_snapshot__catch_up(self, path):
+        snapshot.build_snapshot(Item, path)
+        item = Item.get(Item.name == 'scarpe rosse')
+        item.name = 'divano rosso'
+        item.save()
+
+        # a new process maps the snapshot written before the change
+        search.drop_index(Item)
+        index = snapshot.open_snapshot(Item, path)
+        Item.sync_search(since=index.version)
+        assert set(index.changes) == {item.id}
+        assert get_names(Item.search('scarpe', Item.select())) == ['scarpe da ballo']
@@ -0,0 +1,185 @@
+"""
+Test suite for the instrumentation of the searches (:mod:`search.stats`).
+"""
+import http.client as client
+
+import pytest
+import simplejson as json
+
+from models import Item, User
+import search
+from search import core, stats
+from tests import test_utils
+from tests.test_case import TestCase
+from tests.test_search_vectorized import ATTRIBUTES, make_index
+from tests.test_searchitem import NAMES
+from tests.test_utils import add_admin_user, add_user, open_with_auth
+
+
+TEST_USER_PSW = 'my_password123@'
+
+
+@pytest.fixture(autouse=True)
+def reset_totals():
+    stats.reset()
+    yield
+    stats.reset()
+
+
+def test_collect__disabled():
+    with stats.collect() as counters:
+        assert counters is None
+        assert stats.current() is None
+
+    assert stats.totals.searches == 0
+
+
+def test_search__counters():
+    objects = [Item(id=i, name=name, category='', description='') for i, name in enumerate(NAMES)]
+
+    with stats.collect(force=True) as counters:
+        results = core.search_matches('tavolo sedie', ['name', 'description'], objects,
+                                      threshold=0)
+
+    assert results == core.search_matches('tavolo sedie', ['name', 'description'], objects,
+                                          threshold=0)
+    assert counters.searches == 1
+    assert counters.documents == len(NAMES)
+    # the threshold is 0, no attribute is skipped
+    assert counters.attributes == 2 * len(NAMES)
+    assert counters.pairs > counters.cache_hits > 0
+    assert all(value >= 0 for value in counters.as_dict()['time'].values())
+    assert counters.total >= counters.tokenize + counters.similarity
+    assert stats.current() is None
+
+
+def test_similarity__counters():
+    with stats.collect(force=True) as counters:
+        core.similarity('scarpe rosse', 'scarpe rosse e scarpe verdi')
+
+    # the query tokens against the 4 tokens of the string, twice 'scarpe'
+    assert counters.pairs == 8
+    assert counters.cache_hits == 2
+
+
+def test_collect__nested_and_totals():
+    with stats.collect(force=True) as outer:
+        core.similarity('scarpe', 'scarpe')
+        with stats.collect(force=True) as inner:
+            core.similarity('scarpe', 'scarpa')
+        assert inner is outer
+
+    with stats.collect(force=True):
+        core.similarity('sedia', 'sedie')
+
+    assert stats.totals.searches == 2
+    assert stats.totals.pairs == 3
+    assert stats.totals.as_dict()['pairs'] == 3
+
+
+@pytest.mark.parametrize('engine', ['python', 'numpy'])
+def test_index_search__counters(mocker, engine):
+    mocker.patch.object(search.config, 'ENGINE', engine)
+    index = make_index()
+    candidates = index.candidates('tavolo sedie', ATTRIBUTES, threshold=0.75)
+
+    with stats.collect(force=True) as counters:
+        results = index.search('tavolo sedie', ATTRIBUTES, threshold=0.75, limit=5)
+
+    assert results == index.search('tavolo sedie', ATTRIBUTES, threshold=0.75, limit=5)
+    assert counters.documents == len(candidates)
+    assert counters.pairs > 0
+    if engine == 'python':
+        assert 0 < counters.attributes <= len(candidates) * len(ATTRIBUTES)
+
+
+class TestSearchExplain(TestCase):
+    @classmethod
+    def setup_class(cls):
+        super(TestSearchExplain, cls).setup_class()
+        Item.delete().execute()
+        for name in NAMES:
+            test_utils.add_item(name=name, description='random description', category='')
+
+    def setup_method(self):
+        User.delete().execute()
+
+    @classmethod
+    def teardown_class(cls):
+        search.drop_index(Item)
+        Item.delete().execute()
+
+    def search(self, user=None, **params):
+        url = '/items/db/?' + '&'.join('{}={}'.format(k, v) for k, v in params.items())
+        if user is None:
+            resp = self.app.get(url)
+        else:
+            resp = open_with_auth(self.app, url, 'GET', user.email, TEST_USER_PSW, None, None)
+        return resp, json.loads(resp.data)
+
+    def test_explain__admin(self):
+        admin = add_admin_user('admin_explain@email.com', TEST_USER_PSW)
+        resp, data = self.search(admin, query='tavolo', limit=3, explain=1)
+
+        assert resp.status_code == client.OK
+        assert len(data['data']) == 3
+        explain = data['meta']['explain']
+        assert explain['searches'] == 1
+        assert explain['documents'] == Item.select().count()
+        assert set(explain['time']) == set(stats.TIMERS)
+        assert stats.totals.searches == 1
+
+    def test_explain__not_admin(self):
+        user = add_user('user_explain@email.com', TEST_USER_PSW)
+        resp, data = self.search(user, query='tavolo', limit=3, explain=1)
+        assert isinstance(data, list)
+
+        resp, data = self.search(query='tavolo', limit=3, explain=1)
+        assert isinstance(data, list)
+        assert stats.totals.searches == 0
+
+    def test_explain__result_cache(self, mocker):
+        mocker.patch.object(search.config, 'RESULT_CACHE_SIZE', 10)
+        admin = add_admin_user('admin_cache@email.com', TEST_USER_PSW)
+        self.search(admin, query='sedie', limit=3, explain=1)
+        resp, data = self.search(admin, query='sedie', limit=3, explain=1)
+
+        assert data['meta']['explain']['result_cache_hits'] == 1
+        assert data['meta']['explain']['documents'] == 0
+
+    def test_collect_stats__all_searches(self, mocker):
+        mocker.patch.object(search.config, 'COLLECT_STATS', True)
+        self.search(query='tavolo', limit=3)
+        resp, data = self.search(query='sedie', limit=3)
+
+        assert isinstance(data, list)
+        assert stats.totals.searches == 2
+
+    @pytest.mark.usefixtures('no_result_cache')
+    def test_stats__admin(self, mocker):
+        mocker.patch.object(search.config, 'COLLECT_STATS', True)
+        self.search(query='tavolo', limit=3)
+        admin = add_admin_user('admin_stats@email.com', TEST_USER_PSW)
+
+        resp = open_with_auth(self.app, '/items/db/stats/', 'GET', admin.email,
+                              TEST_USER_PSW, None, None)
+        data = json.loads(resp.data)['data']
+        assert resp.status_code == client.OK
+        assert data['type'] == 'search_stats'
+        assert data['attributes']['searches'] == 1
+        assert data['attributes']['documents'] == Item.select().count()
+
+        resp = open_with_auth(self.app, '/items/db/stats/', 'DELETE', admin.email,
+                              TEST_USER_PSW, None, None)
+        assert resp.status_code == client.NO_CONTENT
+        assert stats.totals.searches == 0
+
+    def test_stats__not_admin(self):
+        user = add_user('user_stats@email.com', TEST_USER_PSW)
+
+        resp = open_with_auth(self.app, '/items/db/stats/', 'GET', user.email,
+                              TEST_USER_PSW, None, None)
+        assert resp.status_code == client.UNAUTHORIZED
+
+        resp = self.app.get('/items/db/stats/')
+        assert resp.status_code == client.UNAUTHORIZED
@@ -0,0 +1,74 @@
+"""
+Test suite for the pre-tokenized document store (:mod:`search.store`) and the
+positional scoring of repeated tokens.
+"""
+import search
+from search import utils
+from search.core import similarity, token_similarity
+from search.store import DocumentStore
+
+
+def make_store():
+    store = DocumentStore(['name', 'category'])
+    store.add(10, [['scarpe', 'ballo'], ['scarpe']])
+    store.add(20, [['divano', 'letto'], []])
+    return store
+
+
+def test_add__shared_term_ids():
+    store = make_store()
+
+    assert store.terms == ['scarpe', 'ballo', 'divano', 'letto']
+    assert list(store.term_ids_of(10, 'name')) == [0, 1]
+    assert list(store.term_ids_of(10, 'category')) == [0]
+    assert list(store.term_ids_of(20, 'category')) == []
+    assert store.tokens_of(20) == [['divano', 'letto'], []]
+
+
+def test_add__replaces_document():
+    store = make_store()
+    store.add(10, [['poltrona'], ['arredamento']])
+
+    assert len(store) == 2
+    assert store.tokens_of(10) == [['poltrona'], ['arredamento']]
+    assert store.tokens_of(20) == [['divano', 'letto'], []]
+
+
+def test_remove__compacts_store(mocker):
+    mocker.patch.object(search.config, 'STORE_MAX_GARBAGE', 0.25)
+    store = make_store()
+    store.add(30, [['sedia'], ['arredamento']])
+    store.add(40, [['tavolo'], ['arredamento']])
+
+    store.remove(10)
+    assert len(store.doc_ids) == 4
+
+    store.remove(30)
+    assert list(store.doc_ids) == [20, 40]
+    assert list(store.offsets['name']) == [0, 2, 3]
+    assert store.tokens_of(20) == [['divano', 'letto'], []]
+    assert store.tokens_of(40) == [['tavolo'], ['arredamento']]
+    assert 10 not in store
+
+
+def test_remove__missing_document():
+    store = make_store()
+    store.remove(99)
+
+    assert len(store) == 2
+
+
+def test_index_similarity():
+    assert utils.index_similarity(0, 0, 3, 2) == 1
+    assert utils.index_similarity(2, 0, 3, 2) == 0
+    assert utils.index_similarity(2, 0, 3, 1) == 1
+
+
+def test_similarity__repeated_tokens_positions():
+    # the second `letto` is at the end of the string and far from the query
+    # one, so it must not get the same positional value of the first one.
+    assert similarity('letto singolo', 'letto singolo letto') < \
+        similarity('letto singolo', 'letto singolo')
+
+    assert similarity('letto', 'letto') == 1
+    assert token_similarity(['letto'], []) == 0
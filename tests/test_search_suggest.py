@@ -0,0 +1,122 @@
+"""
+Test suite for the autocomplete prefix index (:mod:`search.suggest`) and the
+``/items/suggest/`` endpoint.
+"""
+import http.client as client
+
+import simplejson as json
+
+from models import Item
+import search
+from search.suggest import PrefixIndex
+from tests import test_utils
+from tests.test_case import TestCase
+from tests.test_utils import format_jsonapi_request
+
+
+def get_index():
+    index = PrefixIndex(['name', 'category'])
+    index.add(1, {'name': 'scarpe da ballo', 'category': 'scarpe'})
+    index.add(2, {'name': 'scarpe rosse', 'category': 'scarpe'})
+    index.add(3, {'name': 'scarponi', 'category': 'montagna'})
+    index.add(4, {'name': 'sedia', 'category': 'arredamento'})
+    return index
+
+
+def test_suggest__ranked_by_frequency():
+    index = get_index()
+
+    assert index.suggest('sca') == [('scarpe', 2), ('scarponi', 1)]
+    assert index.suggest('SCARPO ') == [('scarponi', 1)]
+    assert index.suggest('s', limit=2) == [('scarpe', 2), ('scarponi', 1)]
+
+
+def test_suggest__no_match():
+    index = get_index()
+
+    assert index.suggest('xyz') == []
+    assert index.suggest('') == []
+
+
+def test_add__replaces_document():
+    index = get_index()
+    index.add(2, {'name': 'divano rosso', 'category': 'arredamento'})
+
+    assert index.suggest('scarpe') == [('scarpe', 1)]
+    assert index.suggest('arr') == [('arredamento', 2)]
+    assert index.suggest('ross') == [('rosso', 1)]
+
+
+def test_remove__drops_unused_terms():
+    index = get_index()
+    index.remove(3)
+    index.remove(12345)
+
+    assert 'scarponi' not in index.terms
+    assert 'montagna' not in index.frequencies
+    assert index.terms == sorted(index.terms)
+    assert len(index) == 3
+
+
+def test_suggest__short_prefix_cached():
+    index = get_index()
+
+    assert index.suggest('s') == [('scarpe', 2), ('scarponi', 1), ('sedia', 1)]
+    assert ('s', 10) in index.cached
+
+    index.add(5, {'name': 'sedia', 'category': ''})
+    assert not index.cached
+    assert index.suggest('s') == [('scarpe', 2), ('sedia', 2), ('scarponi', 1)]
+
+
+class TestSuggestItems(TestCase):
+    def setup_method(self):
+        super(TestSuggestItems, self).setup_method()
+        search.drop_prefix_index(Item)
+
+    @classmethod
+    def teardown_class(cls):
+        search.drop_prefix_index(Item)
+
+    def suggest(self, prefix, **params):
+        params['prefix'] = prefix
+        resp = self.app.get('/items/suggest/', query_string=params)
+        return resp, json.loads(resp.data)
+
+    def test_suggest__success(self):
+        test_utils.add_item(name='scarpe da ballo', category='scarpe')
+        test_utils.add_item(name='scarponi', category='montagna')
+
+        resp, data = self.suggest('scar')
+
+        assert resp.status_code == client.OK
+        assert data == {'data': [
+            {'type': 'suggestion', 'id': 'scarpe', 'attributes': {'frequency': 1}},
+            {'type': 'suggestion', 'id': 'scarponi', 'attributes': {'frequency': 1}},
+        ]}
+
+    def test_suggest__limit(self):
+        for name in ['scarpe', 'scarponi', 'scarpette']:
+            test_utils.add_item(name=name, category='')
+
+        resp, data = self.suggest('scar', limit=2)
+        assert [s['id'] for s in data['data']] == ['scarpe', 'scarpette']
+
+    def test_suggest__bad_request(self):
+        resp, data = self.suggest('', limit=1000)
+
+        assert resp.status_code == client.BAD_REQUEST
+        assert len(data['errors']) == 2
+
+    def test_suggest__updated_by_hooks(self):
+        item = test_utils.add_item(name='scarpe', category='')
+        assert self.suggest('scar')[1]['data'][0]['id'] == 'scarpe'
+
+        data = format_jsonapi_request('item', {'name': 'scarponi'})
+        resp = self.app.patch('/items/{}'.format(item.uuid), data=json.dumps(data),
+                              content_type='application/json')
+        assert resp.status_code == client.OK
+        assert [s['id'] for s in self.suggest('scar')[1]['data']] == ['scarponi']
+
+        item.delete_instance()
+        assert self.suggest('scar')[1]['data'] == []
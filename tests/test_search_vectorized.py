@@ -0,0 +1,79 @@
+"""
+Test suite for the NumPy search engine (:mod:`search.vectorized`), cross
+checked against the reference python implementation.
+"""
+import random
+
+import pytest
+
+import search
+from search import utils, vectorized
+from search.cache import SimilarityCache
+from search.index import SearchIndex
+from tests.test_search_index import QUERIES
+from tests.test_searchitem import NAMES
+
+ATTRIBUTES = ['name', 'category', 'description']
+
+WORDS = [
+    'scarpe', 'scarpa', 'sedie', 'sedia', 'tavolo', 'tavola', 'letto',
+    'divano', 'rosso', 'rossa', 'legno', 'cucina', 'poltrona', 'mutande',
+]
+
+
+def make_index():
+    rnd = random.Random(1234)
+    index = SearchIndex(ATTRIBUTES)
+    for doc_id, name in enumerate(NAMES):
+        index.add(doc_id, {
+            'name': name,
+            'category': rnd.choice(['arredamento', 'abbigliamento', '']),
+            'description': ' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(0, 12))),
+        })
+    for doc_id in range(len(NAMES), 300):
+        index.add(doc_id, {
+            attr: ' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(0, 6)))
+            for attr in ATTRIBUTES
+        })
+    return index
+
+
+INDEX = make_index()
+
+
+def reference(query, limit=-1, threshold=0.75):
+    return INDEX.search(query, ATTRIBUTES, threshold=threshold, limit=limit)
+
+
+def numpy_engine(query, limit=-1, threshold=0.75):
+    weights = utils.attribute_weights(ATTRIBUTES)
+    query_tokens = utils.tokenize(query.lower())
+    return vectorized.search(INDEX, list(INDEX.store.slots), query_tokens, ATTRIBUTES,
+                             weights, limit, threshold, SimilarityCache())
+
+
+@pytest.mark.usefixtures('exact_candidates')
+@pytest.mark.parametrize('query', QUERIES + ['rosso legno cucina', 'sedia rossa di legno'])
+@pytest.mark.parametrize('threshold', [0, 0.4, 0.75])
+def test_numpy_engine__same_results(query, threshold):
+    expected = reference(query, threshold=threshold)
+    result = numpy_engine(query, threshold=threshold)
+
+    assert result == expected
+
+
+@pytest.mark.usefixtures('exact_candidates')
+@pytest.mark.parametrize('limit', [1, 5, 20])
+def test_numpy_engine__limit(limit):
+    assert numpy_engine('tavolo sedie', limit) == reference('tavolo sedie', limit)
+
+
+def test_numpy_engine__selected_by_config(mocker):
+    mocker.patch.object(search.config, 'ENGINE', 'numpy')
+    spy = mocker.spy(vectorized, 'search')
+
+    result = INDEX.search('scarpe', ATTRIBUTES, limit=5)
+
+    assert spy.call_count == 1
+    mocker.patch.object(search.config, 'ENGINE', 'python')
+    assert result == INDEX.search('scarpe', ATTRIBUTES, limit=5)
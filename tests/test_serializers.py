@@ -0,0 +1,103 @@
+"""
+Test suite for the compiled serializers of the schemas (:mod:`serializers`),
+checking that they dump the same documents of marshmallow for every schema.
+"""
+import inspect
+
+import pytest
+import simplejson
+
+from marshmallow_jsonapi import fields
+
+from models import Address, Favorite, Item, Order, OrderItem, Picture, User
+import schemas
+from schemas import BaseSchema, ItemSchema, OrderSchema
+import serializers
+from tests.test_case import TestCase
+from tests.test_utils import add_address, add_user
+
+SCHEMAS = [cls for _, cls in inspect.getmembers(schemas, inspect.isclass)
+           if issubclass(cls, BaseSchema) and cls is not BaseSchema]
+
+
+@pytest.fixture
+def compiled(mocker):
+    mocker.patch.dict(serializers._SERIALIZERS)
+    serializers.compile_schemas(BaseSchema)
+
+
+class TestSerializers(TestCase):
+    def setup_method(self):
+        super(TestSerializers, self).setup_method()
+        self.user = add_user('serializers@email.com', 'password',
+                             id='cfe57aa6-76c6-433d-93fe-443363978904')
+        self.address = add_address(self.user, id='27e375f4-3d54-458c-91e4-d8a4fdf3b032')
+        self.items = [
+            Item.create(uuid='25da606b-dbd3-45e1-bb23-ff1f84a5622a', name='Item 1',
+                        description='Item 1 description', price=5.24, availability=10,
+                        category='scarpe'),
+            Item.create(uuid='08bd8de0-a4ac-459d-956f-cf6d8b8a7507', name='Item 2',
+                        description='Item 2 description', price=8, availability=3,
+                        category='scarpe'),
+        ]
+        Picture.create(uuid='df690434-a488-419f-899e-8853cba1a22b', extension='jpg',
+                       item=self.items[0])
+        order = Order.create(delivery_address=self.address, user=self.user,
+                             uuid='451b3bba-fe4d-470d-bf48-cb306c939bc6')
+        order.add_item(self.items[0], 2).add_item(self.items[1])
+        Favorite.create(uuid='9f4a5ab3-3dc5-4ba8-8a5b-6fb2c4ed8e2b', user=self.user,
+                        item=self.items[1])
+
+    def objects(self, schema_class):
+        model = {
+            'AddressSchema': Address, 'FavoriteSchema': Favorite, 'ItemSchema': Item,
+            'OrderSchema': Order, 'OrderItemSchema': OrderItem, 'PictureSchema': Picture,
+            'UserSchema': User,
+        }[schema_class.__name__]
+        return list(model.select())
+
+    @pytest.mark.parametrize('schema_class', SCHEMAS, ids=lambda cls: cls.__name__)
+    def test_compile_schema__same_as_marshmallow(self, schema_class):
+        serialize = serializers.compile_schema(schema_class)
+        assert serialize is not None
+
+        objects = self.objects(schema_class)
+        assert objects
+        for obj in objects:
+            expected = schema_class().dump(obj).data
+            assert serialize(obj) == expected
+            # same keys in the same order
+            assert simplejson.dumps(serialize(obj)) == simplejson.dumps(expected)
+
+    @pytest.mark.usefixtures('compiled')
+    def test_jsonapi__compiled(self):
+        item = self.items[0]
+        expected = ItemSchema(include_data=[]).dumps(item).data
+
+        assert serializers.get_serializer(ItemSchema) is not None
+        assert ItemSchema.jsonapi(item) == (expected, {})
+        assert Item.json_list(self.items) == '[{}]'.format(','.join(
+            ItemSchema().dumps(item).data for item in self.items))
+
+        # related resources are still included by marshmallow
+        data, errors = OrderSchema.jsonapi(Order.get(), include_data=['items'])
+        assert 'included' in simplejson.loads(data)
+
+
+def test_compile_schema__not_supported():
+    class InflectedSchema(BaseSchema):
+        class Meta:
+            type_ = 'inflected'
+            inflect = str.upper
+
+        id = fields.Str()
+
+    class LinkedSchema(BaseSchema):
+        class Meta:
+            type_ = 'linked'
+
+        id = fields.Str()
+        item = fields.Relationship(related_url='/items/{id}', related_url_kwargs={'id': '<id>'})
+
+    assert serializers.compile_schema(InflectedSchema) is None
+    assert serializers.compile_schema(LinkedSchema) is None
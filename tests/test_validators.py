@@ -0,0 +1,167 @@
+"""
+Test suite for the compiled checkers of the requests data
+(:mod:`validators`), checking that they accept only the data marshmallow
+finds valid, and that the errors of the invalid requests do not change.
+"""
+import inspect
+
+from marshmallow_jsonapi import fields
+import pytest
+
+import schemas
+from schemas import AddressSchema, BaseSchema, ItemSchema, OrderSchema, UserSchema
+import validators
+
+SCHEMAS = [cls for _, cls in inspect.getmembers(schemas, inspect.isclass)
+           if issubclass(cls, BaseSchema) and cls is not BaseSchema]
+
+ITEM = {
+    'data': {
+        'type': 'item',
+        'attributes': {
+            'name': 'scarpe', 'price': 10.5, 'description': 'rosse',
+            'availability': 3, 'category': 'scarpe',
+        },
+    },
+}
+
+USER = {
+    'data': {
+        'type': 'user',
+        'attributes': {
+            'first_name': 'Mario', 'last_name': 'Rossi',
+            'email': 'mario@email.com', 'password': 'password',
+        },
+    },
+}
+
+ORDER = {
+    'data': {
+        'type': 'order',
+        'relationships': {
+            'items': {'data': [{'type': 'item', 'id': '1', 'quantity': 2}]},
+            'delivery_address': {'data': {'type': 'address', 'id': '2'}},
+            'user': {'data': {'type': 'user', 'id': '3'}},
+        },
+    },
+}
+
+ADDRESS = {
+    'data': {
+        'type': 'address',
+        'attributes': {
+            'country': 'Italy', 'city': 'Firenze', 'post_code': '50100',
+            'address': 'via Roma 1', 'phone': '0555555555',
+        },
+        'relationships': {'user': {'data': {'type': 'user', 'id': '3'}}},
+    },
+}
+
+
+def with_attributes(document, **attributes):
+    data = dict(document['data'])
+    data['attributes'] = dict(data.get('attributes', {}), **attributes)
+    return {'data': data}
+
+
+def with_relationships(document, **relationships):
+    data = dict(document['data'])
+    data['relationships'] = dict(data.get('relationships', {}), **relationships)
+    return {'data': data}
+
+
+def without(document, name):
+    data = dict(document['data'])
+    data['attributes'] = {k: v for k, v in data.get('attributes', {}).items() if k != name}
+    data['relationships'] = {k: v for k, v in data.get('relationships', {}).items()
+                             if k != name}
+    return {'data': data}
+
+
+VALID = [
+    (ItemSchema, ITEM, False),
+    (ItemSchema, with_attributes(ITEM, price='10.5', unknown='ignored'), False),
+    (ItemSchema, {'data': {'type': 'item', 'attributes': {'price': 3}}}, True),
+    (ItemSchema, {'data': {'type': 'item', 'id': 'ignored'}}, True),
+    (UserSchema, USER, False),
+    (UserSchema, {'data': {'type': 'user', 'attributes': {'last_name': 'Bianchi'}}}, True),
+    (OrderSchema, ORDER, False),
+    (OrderSchema, without(ORDER, 'user'), True),
+    (AddressSchema, ADDRESS, False),
+]
+
+INVALID = [
+    (ItemSchema, with_attributes(ITEM, name=''), False),
+    (ItemSchema, with_attributes(ITEM, price=-1), False),
+    (ItemSchema, with_attributes(ITEM, price='cheap'), True),
+    (ItemSchema, with_attributes(ITEM, availability=None), True),
+    (ItemSchema, without(ITEM, 'category'), False),
+    (ItemSchema, {'data': {'attributes': {}}}, True),
+    (ItemSchema, {'items': []}, True),
+    (UserSchema, with_attributes(USER, email='not an email'), False),
+    (OrderSchema, with_relationships(ORDER, items={'data': []}), True),
+    (OrderSchema, with_relationships(ORDER, items={'data': {'type': 'item', 'id': '1'}}), True),
+    (OrderSchema, with_relationships(ORDER, user={'type': 'user', 'id': '3'}), True),
+    (OrderSchema, with_relationships(ORDER, delivery_address={'data': {'id': '2'}}), False),
+    (AddressSchema, without(ADDRESS, 'user'), False),
+]
+
+
+@pytest.mark.parametrize('schema_class', SCHEMAS)
+@pytest.mark.parametrize('partial', [False, True])
+def test_compile_checker(schema_class, partial):
+    check = validators.get_checker(schema_class, partial)
+    assert check is not None
+    assert validators.get_checker(schema_class, partial) is check
+    assert not check({})
+
+
+@pytest.mark.parametrize('schema_class,data,partial', VALID)
+def test_validate_input__valid(schema_class, data, partial):
+    assert schema_class().validate(data, partial=partial) == {}
+    assert validators.get_checker(schema_class, partial)(data) is True
+    assert schema_class.validate_input(data, partial=partial) == {}
+
+
+@pytest.mark.parametrize('schema_class,data,partial', INVALID)
+def test_validate_input__invalid(schema_class, data, partial):
+    errors = schema_class().validate(data, partial=partial)
+    assert errors
+    assert validators.get_checker(schema_class, partial)(data) is False
+    assert schema_class.validate_input(data, partial=partial) == errors
+    # the cached instance does not keep the errors of the previous requests
+    assert schema_class.validate_input(data, partial=partial) == errors
+
+
+def test_check__wrong_type():
+    # marshmallow raises IncorrectTypeError, or reports a missing `type`
+    assert not validators.get_checker(ItemSchema, True)({'data': {'type': 'user'}})
+    assert not validators.get_checker(ItemSchema, True)({'data': []})
+
+
+def test_validate_input__partial_fields():
+    data = {'data': {'type': 'item', 'attributes': {'price': 3}}}
+    assert validators.get_checker(ItemSchema, ('price',)) is None
+    assert (ItemSchema.validate_input(data, partial=('price',)) ==
+            ItemSchema().validate(data, partial=('price',)))
+
+
+def test_compile_checker__not_supported():
+    class MethodSchema(BaseSchema):
+        class Meta:
+            type_ = 'method'
+
+        id = fields.Str(dump_only=True)
+        name = fields.Str(required=True)
+        total = fields.Method('get_total', deserialize='load_total')
+
+    class InflectedSchema(BaseSchema):
+        class Meta:
+            type_ = 'inflected'
+            inflect = str.upper
+
+        id = fields.Str(dump_only=True)
+        name = fields.Str(required=True)
+
+    assert validators.compile_checker(MethodSchema) is None
+    assert validators.compile_checker(InflectedSchema) is None
@@ -4,12 +4,15 @@ Utility module for Flask resource handlers and models.
 import dotenv
 import os
 
-from flask import Response
+from flask import Response, stream_with_context
 
 dotenv.load()
 
 IMAGE_FOLDER = 'images'
 
+#: Minimum size, in characters, of the chunks written by the streamed responses
+STREAM_CHUNK_SIZE = 64 * 1024
+
 
 def get_project_root():
     return os.path.dirname(__file__)
@@ -62,6 +65,38 @@ def generate_response(data, status, mimetype='application/vnd.api+json'):
     )
 
 
+def generate_stream_response(parts, status, mimetype='application/vnd.api+json'):
+    """
+    Generate a Response object streaming the body from an iterable of strings,
+    such as :any:`BaseModel.json_stream`, instead of building it all in
+    memory.
+
+    The first part is sent as soon as it is generated, so that the client
+    gets the first byte immediately, the following ones are gathered in
+    chunks of at least :any:`STREAM_CHUNK_SIZE` characters. The request
+    context (and so the database connection) lasts until the body is sent.
+    """
+    def chunks():
+        parts_iter = iter(parts)
+        yield next(parts_iter, '')
+
+        buffer, size = [], 0
+        for part in parts_iter:
+            buffer.append(part)
+            size += len(part)
+            if size >= STREAM_CHUNK_SIZE:
+                yield ''.join(buffer)
+                buffer, size = [], 0
+        if buffer:
+            yield ''.join(buffer)
+
+    return Response(
+        response=stream_with_context(chunks()),
+        status=status,
+        mimetype=mimetype
+    )
+
+
 def non_empty_str(val, name):
     """
     Check if a string is empty. If not, raise a ValueError exception.
@@ -0,0 +1,123 @@
+"""
+Compiled checkers of the requests data, in front of the :mod:`schemas`
+validation.
+
+Validating a request with marshmallow runs the load hooks of the schema,
+unwraps the JSONAPI document and goes through the unmarshaller for every
+field, before collecting and formatting the errors. Most requests are valid,
+so :func:`compile_checker` generates, once per schema class and ``partial``
+mode, a python function that unwraps the document with a few dict lookups and
+deserializes each field calling the field object itself, as the unmarshaller
+would: it returns ``True`` only when marshmallow would find no error.
+
+When the checker returns ``False`` the data is validated again by
+marshmallow, so the errors are exactly the JSONAPI errors the endpoints
+always returned. Schemas with validation hooks or fields not supported here
+are always validated by marshmallow.
+
+Example:
+    >>> from schemas import ItemSchema
+    >>> check = get_checker(ItemSchema, partial=True)
+    >>> check({'data': {'type': 'item', 'attributes': {'price': 3}}})
+    True
+    >>> check({'data': {'type': 'item', 'attributes': {'price': -3}}})
+    False
+"""
+from marshmallow import ValidationError, fields as ma_fields
+from marshmallow.utils import missing
+from marshmallow_jsonapi import Schema
+
+from serializers import processors
+
+#: Compiled checkers, mapping ``(schema class, partial)`` to their function,
+#: or to ``None`` if the schema cannot be compiled
+_CHECKERS = {}
+
+
+def compile_checker(schema_class, partial=False):
+    """
+    Generate the checker function of a schema class.
+
+    Arguments:
+        schema_class (type): subclass of :class:`marshmallow_jsonapi.Schema`
+        partial (bool): whether missing fields are allowed, as in
+            ``Schema.validate``
+
+    Returns:
+        callable: function taking the request data and returning ``True``
+        only if ``schema_class().validate(data, partial=partial)`` has no
+        errors, ``None`` if the schema uses features that cannot be compiled
+    """
+    if (schema_class.opts.inflect is not None or
+            processors(schema_class) != processors(Schema)):
+        return None
+
+    schema = schema_class()
+    namespace = {'_missing': missing, 'ValidationError': ValidationError}
+    lines = [
+        'def check(data):',
+        '    if data.__class__ is not dict:',
+        '        return False',
+        '    item = data.get("data")',
+        '    if item.__class__ is not dict or item.get("type", _missing) != {!r}:'.format(
+            schema.opts.type_),
+        '        return False',
+        '    attributes = item.get("attributes", {})',
+        '    relationships = item.get("relationships", {})',
+        '    if attributes.__class__ is not dict or relationships.__class__ is not dict:',
+        '        return False',
+        '    try:',
+    ]
+
+    for index, (name, field) in enumerate(schema.fields.items()):
+        if field.dump_only:
+            continue
+        if (name in ('id', '_meta') or field.load_from not in (None, name) or
+                field.missing is not missing or not field._CHECK_ATTRIBUTE or
+                isinstance(field, ma_fields.Nested)):
+            return None
+
+        value = 'v{}'.format(index)
+        namespace['_deserialize_{}'.format(index)] = field.deserialize
+        lines += [
+            '        {0} = relationships[{1!r}] if {1!r} in relationships else '
+            'attributes.get({1!r}, _missing)'.format(value, name),
+        ]
+        if partial or not field.required:
+            lines += [
+                '        if {} is not _missing:'.format(value),
+                '            _deserialize_{}({}, {!r}, None)'.format(index, value, name),
+            ]
+        else:
+            # fails if missing, as required
+            lines.append('        _deserialize_{}({}, {!r}, None)'.format(index, value, name))
+
+    lines += [
+        '    except ValidationError:',
+        '        return False',
+        '    return True',
+    ]
+
+    source = '\n'.join(lines)
+    code = compile(source, '<checker {}>'.format(schema_class.__name__), 'exec')
+    exec(code, namespace)
+    check = namespace['check']
+    check.source = source
+    return check
+
+
+def get_checker(schema_class, partial=False):
+    """
+    Return the checker of the schema class for the ``partial`` mode,
+    compiling it the first time, ``None`` if it cannot be compiled or
+    ``partial`` is a collection of field names.
+    """
+    if partial not in (True, False):
+        return None
+
+    key = (schema_class, partial)
+    try:
+        return _CHECKERS[key]
+    except KeyError:
+        check = _CHECKERS[key] = compile_checker(schema_class, partial)
+        return check
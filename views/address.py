@@ -2,7 +2,7 @@ from auth import auth
 from flask import request
 from flask_restful import Resource
 from http.client import CREATED, NO_CONTENT, NOT_FOUND, OK, BAD_REQUEST
-from models import Address
+from models import Address, User
 from utils import generate_response
 
 import uuid
@@ -103,4 +103,6 @@ class AddressHandler(Resource):
         if result == 0:
             return None, NOT_FOUND
 
+        # deleted by a query, without signals: the user lists its addresses
+        auth.current_user.updated_at = User.touch(auth.current_user.id)
         return None, NO_CONTENT
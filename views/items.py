@@ -3,14 +3,19 @@ Items view: this module provides methods to interact
 with items resources
 """
 
+import decimal
 import http.client as client
+import os
 import uuid
 
 from flask import request
 from flask_restful import Resource
+import simplejson as json
 
+from auth import auth
 from models import Item
-from utils import generate_response
+import search
+from utils import generate_response, generate_stream_response
 
 
 SEARCH_FIELDS = ['name', 'description']
@@ -21,8 +26,8 @@ class ItemsHandler(Resource):
 
     def get(self):
         """Retrieve every item"""
-        data = Item.json_list(Item.select())
-        return generate_response(data, client.OK)
+        data = Item.json_stream(Item.select())
+        return generate_stream_response(data, client.OK)
 
     def post(self):
         """
@@ -114,6 +119,83 @@ class ItemHandler(Resource):
         return None, client.NO_CONTENT
 
 
+def search_filters(args):
+    """
+    Parse the facet filters of a search request.
+
+    Args:
+        args (dict): request arguments, with the optional ``category``,
+            ``min_price``, ``max_price`` and ``in_stock`` filters
+
+    Returns:
+        tuple: ``(terms, ranges, errors)`` where ``terms`` and ``ranges`` are
+        the filters as accepted by :meth:`search.facets.FacetIndex.filter` and
+        ``errors`` the list of the invalid filters messages
+    """
+    terms, ranges, errors = {}, {}, []
+
+    category = args.get('category')
+    if category:
+        terms['category'] = category
+
+    prices = []
+    for name in ('min_price', 'max_price'):
+        value = args.get(name)
+        if value is None:
+            prices.append(None)
+            continue
+        try:
+            price = decimal.Decimal(value)
+        except decimal.InvalidOperation:
+            price = None
+        if price is None or not price.is_finite():
+            errors.append('Invalid {}: {}'.format(name, value))
+            price = None
+        prices.append(price)
+    if any(price is not None for price in prices):
+        ranges['price'] = tuple(prices)
+
+    if args.get('in_stock', '').lower() in ('1', 'true'):
+        ranges['availability'] = (1, None)
+
+    return terms, ranges, errors
+
+
+def search_cursor(args):
+    """
+    Parse the cursor of a paginated search request.
+
+    A cursor is accepted only for the catalog version it was created on (see
+    :any:`BaseModel.catalog_version`, the same in all the workers), since
+    after a change of the items that can affect their ranking or the filters
+    it may not continue the same ranking. The orders change the version only
+    when an item runs out of stock or is restocked.
+
+    Args:
+        args (dict): request arguments, with the optional ``cursor`` returned
+            by the previous page (empty for the first page)
+
+    Returns:
+        tuple: ``(cursor, after, errors)`` where ``cursor`` is the request
+        cursor (``None`` if the search is not paginated), ``after`` the
+        ``(match, id)`` position to continue from, as accepted by
+        :any:`BaseModel.search`, and ``errors`` the list of the invalid
+        cursor messages
+    """
+    cursor = args.get('cursor')
+    if not cursor:
+        return cursor, None, []
+
+    try:
+        match, item_id, version = search.cursor.decode(cursor)
+    except ValueError as error:
+        return cursor, None, [str(error)]
+
+    if version != Item.catalog_version():
+        return cursor, None, ['Expired cursor, the items changed: restart the search.']
+    return cursor, (match, item_id), []
+
+
 class SearchItemHandler(Resource):
     def get(self):
         query = request.args.get('query')
@@ -121,10 +203,70 @@ class SearchItemHandler(Resource):
         min_limit, max_limit = 0, 100
 
         limit_in_range = limit > min_limit and limit <= max_limit
-
-        if query is not None and limit_in_range:
-            matches = Item.search(query, Item.select(), limit)
-            return generate_response(Item.json_list(matches), client.OK)
+        terms, ranges, filter_errors = search_filters(request.args)
+        cursor, after, cursor_errors = search_cursor(request.args)
+        # counters and timings of the search, for the admins only
+        explain = (request.args.get('explain', '').lower() in ('1', 'true') and
+                   getattr(auth.current_user, 'admin', False))
+
+        if query is not None and limit_in_range and not filter_errors and not cursor_errors:
+            # restrict the dataset before scoring, both in the database and
+            # through the ids of the items passing the filters
+            dataset = Item.select()
+            for attr, value in terms.items():
+                dataset = dataset.where(getattr(Item, attr) == value)
+            for attr, (minimum, maximum) in ranges.items():
+                if minimum is not None:
+                    dataset = dataset.where(getattr(Item, attr) >= minimum)
+                if maximum is not None:
+                    dataset = dataset.where(getattr(Item, attr) <= maximum)
+
+            ids = None
+            with_facets = request.args.get('facets', '').lower() in ('1', 'true')
+            if terms or ranges or with_facets:
+                # changes of the other workers first, the facet index is
+                # kept up to date from the change log as the search index
+                Item.sync_search()
+                facets = search.get_facet_index(Item) or search.build_facet_index(Item)
+                ids = facets.filter(terms, ranges)
+
+            # version of the ranked items, for the cursor of the next page
+            version = Item.catalog_version() if cursor is not None else None
+            with search.stats.collect(force=explain) as counters:
+                if with_facets:
+                    # the facets count all the results, not only the page
+                    everything = Item.search_matches(query, dataset, ids=ids)
+                if with_facets and after is None:
+                    results = everything[:limit]
+                else:
+                    results = Item.search_matches(query, dataset, limit, ids=ids, after=after)
+            matches = [obj for obj, _ in results]
+            data = Item.json_list(matches)
+
+            meta = {}
+            if with_facets:
+                meta['facets'] = {
+                    'category': facets.counts((obj.id for obj, _ in everything), 'category'),
+                }
+            if request.args.get('suggest', '').lower() in ('1', 'true'):
+                meta['did_you_mean'] = None
+                if not matches and after is None:
+                    # correct the query through the vocabulary of the search
+                    # index, or of the autocomplete if the index is not built
+                    index = (search.get_index(Item) or search.get_prefix_index(Item) or
+                             search.build_prefix_index(Item))
+                    meta['did_you_mean'] = index.did_you_mean(query) or None
+            if cursor is not None:
+                # a full page may be followed by other results
+                meta['cursor'] = None
+                if len(results) == limit:
+                    obj, match = results[-1]
+                    meta['cursor'] = search.cursor.encode(match, obj.id, version)
+            if explain:
+                meta['explain'] = counters.as_dict()
+            if meta:
+                data = '{{"data": {}, "meta": {}}}'.format(data, json.dumps(meta))
+            return generate_response(data, client.OK)
 
         def fmt_error(msg):
             return {'detail': msg}
@@ -139,4 +281,108 @@ class SearchItemHandler(Resource):
             errors['errors'].append(
                 fmt_error(msg.format(min_limit, max_limit, limit)))
 
+        for msg in filter_errors + cursor_errors:
+            errors['errors'].append(fmt_error(msg))
+
+        return errors, client.BAD_REQUEST
+
+
+class BatchSearchItemHandler(Resource):
+    """Search of many queries at once, scanning the items once for all of them"""
+
+    def post(self):
+        request_data = request.get_json(force=True, silent=True) or {}
+        queries = request_data.get('queries')
+        limit = request_data.get('limit', -1)
+        min_limit, max_limit = 0, 100
+        max_queries = 100
+
+        valid_queries = (
+            isinstance(queries, list) and 0 < len(queries) <= max_queries and
+            all(isinstance(query, str) and query for query in queries)
+        )
+        limit_in_range = (isinstance(limit, int) and not isinstance(limit, bool) and
+                          min_limit < limit <= max_limit)
+
+        if valid_queries and limit_in_range:
+            results = Item.batch_search(queries, Item.select(), limit)
+            data = ', '.join(
+                '{{"query": {}, "data": {}}}'.format(json.dumps(query), Item.json_list(matches))
+                for query, matches in zip(queries, results)
+            )
+            return generate_response('{{"data": [{}]}}'.format(data), client.OK)
+
+        def fmt_error(msg):
+            return {'detail': msg}
+
+        errors = {"errors": []}
+
+        if not valid_queries:
+            errors['errors'].append(fmt_error(
+                'Queries must be a list of 1 to {} non empty strings.'.format(max_queries)))
+
+        if not limit_in_range:
+            msg = 'Limit out of range. must be between {} and {}. Requested: {}'
+            errors['errors'].append(
+                fmt_error(msg.format(min_limit, max_limit, limit)))
+
+        return errors, client.BAD_REQUEST
+
+
+class SearchStatsHandler(Resource):
+    """Counters and timings of the searches served by the process"""
+
+    @auth.login_required
+    def get(self):
+        if not auth.current_user.admin:
+            return {'message': "You can't get the search stats."}, client.UNAUTHORIZED
+
+        data = {
+            'type': 'search_stats',
+            'id': str(os.getpid()),
+            'attributes': search.stats.totals.as_dict(),
+        }
+        return {'data': data}, client.OK
+
+    @auth.login_required
+    def delete(self):
+        if not auth.current_user.admin:
+            return {'message': "You can't reset the search stats."}, client.UNAUTHORIZED
+
+        search.stats.reset()
+        return None, client.NO_CONTENT
+
+
+class SuggestItemHandler(Resource):
+    """Autocomplete of the search queries, from the words of the items"""
+
+    def get(self):
+        prefix = request.args.get('prefix', '').strip()
+        limit = int(request.args.get('limit', 10))
+        min_limit, max_limit = 0, 100
+
+        limit_in_range = limit > min_limit and limit <= max_limit
+
+        if prefix and limit_in_range:
+            Item.sync_search()
+            index = search.get_prefix_index(Item) or search.build_prefix_index(Item)
+            suggestions = [
+                {'type': 'suggestion', 'id': term, 'attributes': {'frequency': frequency}}
+                for term, frequency in index.suggest(prefix, limit)
+            ]
+            return {'data': suggestions}, client.OK
+
+        def fmt_error(msg):
+            return {'detail': msg}
+
+        errors = {"errors": []}
+
+        if not prefix:
+            errors['errors'].append(fmt_error('Missing prefix.'))
+
+        if not limit_in_range:
+            msg = 'Limit out of range. must be between {} and {}. Requested: {}'
+            errors['errors'].append(
+                fmt_error(msg.format(min_limit, max_limit, limit)))
+
         return errors, client.BAD_REQUEST
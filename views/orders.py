@@ -11,7 +11,7 @@ from flask_restful import Resource
 from auth import auth
 from models import database, Address, Order, Item, User
 from notifications import notify_new_order
-from utils import generate_response
+from utils import generate_response, generate_stream_response
 
 from exceptions import InsufficientAvailabilityException
 
@@ -21,8 +21,8 @@ class OrdersHandler(Resource):
 
     def get(self):
         """ Get all the orders."""
-        data = Order.json_list(Order.select())
-        return generate_response(data, OK)
+        data = Order.json_stream(Order.select())
+        return generate_stream_response(data, OK)
 
     @auth.login_required
     def post(self):
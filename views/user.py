@@ -7,7 +7,7 @@ import uuid
 
 from auth import auth
 from models import User
-from utils import generate_response
+from utils import generate_response, generate_stream_response
 from notifications import notify_new_user
 
 
@@ -24,8 +24,8 @@ class UsersHandler(Resource):
         if not auth.current_user.admin:
             return ({'message': "You can't get the list users."}, UNAUTHORIZED)
 
-        data = User.json_list(User.select())
-        return generate_response(data, OK)
+        data = User.json_stream(User.select())
+        return generate_stream_response(data, OK)
 
     def post(self):
         """ Add an user to the database."""